@@ -1,13 +1,9 @@
 import streamlit as st
 from datetime import datetime, timedelta
-import pandas as pd
-import matplotlib.pyplot as plt
-import altair as alt
-import plotly.express as px
-# pip install bokeh==2.4.3
-from bokeh.plotting import figure as bok
+# the plotting libraries (matplotlib, altair, plotly, bokeh==2.4.3) are imported by the charts that use them,
+# so that the table is displayed before they are loaded
 
-from data_analysis import get_HPFC_data, merge_HPFC_data
+from data_analysis import merge_HPFC_data, get_forward_table, get_product_prices
 
 st.set_page_config(
     page_title="Streamlit for HPFC",
@@ -28,7 +24,6 @@ dates.append(datetime.date(datetime(2023,4,13)).strftime("%Y%m%d"))
 dates.append(datetime.date(datetime(2023,4,14)).strftime("%Y%m%d"))
 dates.append(datetime.date(datetime(2023,4,17)).strftime("%Y%m%d"))
 merged_df = merge_HPFC_data(countries, dates)
-peak_df = merged_df.set_index('Datum').between_time('8:00', '19:30').reset_index()
 st.dataframe(merged_df)
 
 #ne_plotte_pas_tout = """
@@ -44,6 +39,7 @@ with st.container():
         st.header("HPFC Prognose - " + countries[1] + "\nmatplotlib figure")
         #fig, ax = plt.plot(x=merged_df["Datum"], y=merged_df["HPFC_" + countries[1] + "_" + dates[d]] for d in [0,1,3])
         #st.pyplot(fig)
+        import matplotlib.pyplot as plt
         fig, ax = plt.subplots()
         for i, d in enumerate(dates_prognose):
             ax.plot(merged_df["Datum"], merged_df["HPFC_" + countries[1] + "_" + d], label=d, color=colors[i])
@@ -51,6 +47,7 @@ with st.container():
         st.pyplot(fig)
     with HPFC_Prognose[2]:
         st.header("HPFC Prognose - " + countries[2] + "\naltair chart")
+        import altair as alt
 
         hover = alt.selection_single( fields=["date"], nearest=True, on="mouseover", empty="none" )
         line1 = alt.Chart(merged_df).mark_line().encode( x='Datum', y='HPFC_FR_20230102', color=alt.value("green"))
@@ -74,17 +71,13 @@ with st.container():
 
 with st.container():
     day_ahead_HPFC_Prognose = st.columns(len(countries))
-    today = datetime.date(datetime(2023,4,17)) #dt.date.today()
-    today = datetime.combine(today, datetime.min.time())
+    # the day-ahead of the latest vintage
+    today = datetime.strptime(dates[-1], "%Y%m%d")
     tomorrow = today + timedelta(days = 1)
     after_tomorrow = today + timedelta(days = 2)
     yesterday = today - timedelta(days = 1)
     for c, country in enumerate(countries):
-        base = merged_df[(merged_df["Datum"] >= tomorrow) & (merged_df["Datum"] < after_tomorrow)]
-        peak = base[(base["Datum"] >= tomorrow + timedelta(hours = 8)) & (base["Datum"] < after_tomorrow - timedelta(hours = 4))]
-        base = base["HPFC_" + country + "_" + today.strftime("%Y%m%d")]
-        peak = peak["HPFC_" + country + "_" + today.strftime("%Y%m%d")]
-        df_DA_HPFC_Prognose = pd.DataFrame({"Base" : [base.mean()], "Peak" : [peak.mean()]})
+        df_DA_HPFC_Prognose = get_forward_table(country, dates[-1]).day_prices(tomorrow)
         with day_ahead_HPFC_Prognose[c]:
             st.header("Day-ahead " + tomorrow.strftime("%Y-%m-%d") + " HPFC " + country + " Prognose (EUR/MWh)")
             st.table(df_DA_HPFC_Prognose)
@@ -93,8 +86,7 @@ with st.container():
 
 with st.container():
     monatlicher_Mittelwerte = st.columns(len(countries))
-    per_month = merged_df.set_index('Datum').groupby(pd.Grouper(freq='M')).mean()
-    per_month["Datum"] = per_month.index.get_level_values('Datum')
+    per_month = get_product_prices(countries, dates, "M", "base")
 
     with monatlicher_Mittelwerte[0]:
         st.header("Monatlicher Mittelwert von HPFC Prognose - " + countries[0] + "\nvega_lite line chart")
@@ -114,11 +106,13 @@ with st.container():
     
     with monatlicher_Mittelwerte[1]:
         st.header("Monatlicher Mittelwert von HPFC Prognose - " + countries[1] + "\nplotly line")
+        import plotly.express as px
         prognoseb2 = px.line(per_month, x="Datum", y=["HPFC_DE_20230407", "HPFC_DE_20230413", "HPFC_DE_20230414"])
         st.plotly_chart(prognoseb2, use_container_width=True)
 
     with monatlicher_Mittelwerte[2]:
         st.header("Monatlicher Mittelwert von HPFC Prognose - " + countries[2] + "\nbokeh")
+        from bokeh.plotting import figure as bok
         mittelwert = bok(
             y_axis_label = "HPFC (EUR/MWh)hfoejfipezjfeom"
         )
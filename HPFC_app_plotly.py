@@ -1,10 +1,7 @@
 import streamlit as st
 from datetime import datetime, timedelta
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objs as go
 
-from data_analysis import get_HPFC_data, merge_HPFC_data
+from data_analysis import merge_HPFC_data, get_forward_table, get_product_prices
 
 st.set_page_config(
     page_title="Streamlit & Plotly for HPFC",
@@ -23,9 +20,11 @@ dates.append(datetime.date(datetime(2023,4,13)).strftime("%Y%m%d"))
 dates.append(datetime.date(datetime(2023,4,14)).strftime("%Y%m%d"))
 dates.append(datetime.date(datetime(2023,4,17)).strftime("%Y%m%d"))
 merged_df = merge_HPFC_data(countries, dates)
-peak_df = merged_df.set_index('Datum').between_time('8:00', '19:30').reset_index()
 st.dataframe(merged_df)
 
+# plotly is imported once the table is displayed
+import plotly.express as px
+import plotly.graph_objs as go
 
 prog_colors = ["green", "blue", "red"]
 prog_dates = [dates[d] for d in [0,1,3]]
@@ -40,17 +39,13 @@ with st.container():
 
 with st.container():
     day_ahead_HPFC_Prognose = st.columns(len(countries))
-    today = datetime.date(datetime(2023,4,17))
-    today = datetime.combine(today, datetime.min.time())
+    # the day-ahead of the latest vintage
+    today = datetime.strptime(dates[-1], "%Y%m%d")
     tomorrow = today + timedelta(days = 1)
     after_tomorrow = today + timedelta(days = 2)
     yesterday = today - timedelta(days = 1)
     for c, country in enumerate(countries):
-        base = merged_df[(merged_df["Datum"] >= tomorrow) & (merged_df["Datum"] < after_tomorrow)]
-        peak = base[(base["Datum"] >= tomorrow + timedelta(hours = 8)) & (base["Datum"] < after_tomorrow - timedelta(hours = 4))]
-        base = base["HPFC_" + country + "_" + today.strftime("%Y%m%d")]
-        peak = peak["HPFC_" + country + "_" + today.strftime("%Y%m%d")]
-        df_DA_HPFC_Prognose = pd.DataFrame({"Base" : [base.mean()], "Peak" : [peak.mean()]})
+        df_DA_HPFC_Prognose = get_forward_table(country, dates[-1]).day_prices(tomorrow)
         with day_ahead_HPFC_Prognose[c]:
             st.header("Day-ahead " + tomorrow.strftime("%Y-%m-%d") + " HPFC " + country + " Prognose (EUR/MWh)")
             st.table(df_DA_HPFC_Prognose)
@@ -58,10 +53,8 @@ with st.container():
 
 mittelwert_colors = [["blue", "dodgerblue"], ["forestgreen", "lawngreen"], ["red", "lightcoral"]]
 mittelwert_dates = [dates[d] for d in [1,2,3]]
-base_per_month = merged_df.set_index("Datum").groupby(pd.Grouper(freq='M')).mean()
-base_per_month["Datum"] = base_per_month.index.get_level_values('Datum')
-peak_per_month = peak_df.set_index("Datum").groupby(pd.Grouper(freq='M')).mean()
-peak_per_month["Datum"] = peak_per_month.index.get_level_values('Datum')
+base_per_month = get_product_prices(countries, dates, "M", "base")
+peak_per_month = get_product_prices(countries, dates, "M", "peak")
 with st.container():
     monatlicher_Mittelwerte = st.columns(len(countries))
     for c, country in enumerate(countries):
@@ -0,0 +1,2 @@
+# Benchmarks of the hpfc engine, to be run from the root of the repository :
+#   python -m benchmarks.bench_parser
@@ -0,0 +1,90 @@
+import argparse, ast, json, os, platform, subprocess, sys
+from datetime import datetime, timezone
+
+from benchmarks.bench_pipeline import compare, git_commit, results_dir
+
+
+# Import time report of the apps and of the hpfc modules, in the spirit of python -X importtime
+# Each target is imported in a fresh interpreter with -X importtime, best of --repeat runs. For an app script only
+# its top-level imports are run (read with ast) : it is what a new worker process pays before the script can show
+# anything, the imports done later by the charts that need them are not counted. The time of a target is the sum
+# of the cumulative times of the packages it imports at the top level (the start-up of the interpreter excluded),
+# and its heaviest packages are listed. The results are written as json, and can be compared with an earlier run :
+#   python -m benchmarks.bench_imports
+#   python -m benchmarks.bench_imports --compare benchmarks/results/<file>.json
+
+app_targets = ["interactive_app1.py", "HPFC_app1.py", "HPFC_app_bokeh.py", "HPFC_app_plotly.py", "data_analysis.py"]
+module_targets = ["hpfc.engine", "hpfc.store", "hpfc.spot", "hpfc.loader", "hpfc.service"]
+heaviest_count = 5
+
+def top_level_imports(script):
+    # the import statements of the module level of a script, as source code
+    with open(script, encoding="utf-8") as script_file:
+        source = script_file.read()
+    tree = ast.parse(source)
+    return "\n".join(ast.get_source_segment(source, node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+def import_times(code):
+    # {package: cumulative time in seconds} of the top-level imports of a fresh interpreter running code
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "exit code " + str(result.returncode))
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        # the top-level packages are indented by a single space
+        if not name.startswith("  "):
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+def measure_target(code, startup, repeat):
+    # best total over repeat runs and the heaviest packages of that run
+    best = None
+    for _ in range(repeat):
+        times = {name: seconds for name, seconds in import_times(code).items() if name not in startup}
+        total = sum(times.values())
+        if best is None or total < best[0]:
+            best = (total, sorted(times.items(), key=lambda item: -item[1])[:heaviest_count])
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of the apps and of the hpfc modules")
+    parser.add_argument("targets", nargs="*", help="app scripts (.py) or modules, all of them by default")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--results-dir", default=results_dir)
+    parser.add_argument("--compare", help="json results of an earlier run")
+    args = parser.parse_args()
+
+    targets = args.targets or app_targets + module_targets
+    # the modules imported by the start-up of the interpreter itself are not part of any target
+    startup = set(import_times("pass"))
+    stages = []
+    print(f"{'target':<24}{'import (ms)':>13}   heaviest packages (ms)")
+    for target in targets:
+        code = top_level_imports(target) if target.endswith(".py") else "import " + target
+        try:
+            total, heaviest = measure_target(code, startup, args.repeat)
+        except RuntimeError as error:
+            print(f"{target:<24}{'failed':>13}   {error}")
+            continue
+        stages.append({"stage": target, "seconds": total, "heaviest": [[name, seconds] for name, seconds in heaviest]})
+        print(f"{target:<24}{total*1000:>13.1f}   " + ", ".join(f"{name} {seconds*1000:.0f}" for name, seconds in heaviest))
+
+    result = {"commit": git_commit(), "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+              "parameters": {"repeat": args.repeat},
+              "environment": {"python": platform.python_version(), "machine": platform.machine(), "system": platform.system()},
+              "stages": stages}
+    os.makedirs(args.results_dir, exist_ok=True)
+    result_path = os.path.join(args.results_dir, "imports_" + datetime.now().strftime("%Y%m%d_%H%M%S") + "_" + str(result["commit"]) + ".json")
+    with open(result_path, "w") as result_file:
+        json.dump(result, result_file, indent=2)
+    print("\nresults written to " + result_path)
+    if args.compare:
+        regressions = compare(stages, args.compare)
+        if len(regressions) > 0:
+            print("slower than the baseline : " + ", ".join(regressions))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse, os
+import pandas as pd
+
+from hpfc.align import align_datasets
+from hpfc.parser import parse_HPFC_file
+from benchmarks.common import data_path, HPFC_files, best_time
+
+
+# Compares the single-pass alignment of hpfc.align with the iterative pd.merge loop of
+# merge_datasets (outer join) and merge_HPFC_data (inner join), for 1 to 64 series.
+# The series are the HPFC files of the data directory, shifted by a few days each time they are
+# reused, so that the outer join has to extend the time index.
+
+def merge_datasets_legacy(datasets, how="outer"):
+    # original implementation, kept here as a reference
+    merged_df = pd.DataFrame()
+    for df in datasets:
+        if len(df)>0:
+            if len(merged_df)==0:
+                merged_df = df
+            else:
+                merged_df = pd.merge(merged_df, df, on="Datum", how=how)
+    return merged_df
+
+def make_series(data_path, n_series):
+    files = HPFC_files(data_path)
+    curves = [parse_HPFC_file(file_path, os.path.basename(file_path)[:-4]) for file_path in files]
+    series = []
+    for i in range(n_series):
+        df = curves[i % len(curves)].copy()
+        df.columns = ["Datum", df.columns[1] + "_" + str(i)]
+        df["Datum"] = df["Datum"] + pd.Timedelta(days=i // len(curves))
+        series.append(df)
+    return series
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the merge of N Datum-keyed series")
+    parser.add_argument("--data-path", default=data_path)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-series", type=int, default=64)
+    args = parser.parse_args()
+
+    all_series = make_series(args.data_path, args.max_series)
+    counts = [n for n in [1, 2, 4, 8, 16, 32, 64, 128, 256] if n <= args.max_series]
+    for how in ["outer", "inner"]:
+        print(how + " join")
+        print(f"{'series':>8}{'pd.merge loop (ms)':>21}{'aligned (ms)':>15}{'speedup':>10}")
+        for n in counts:
+            series = all_series[:n]
+            t_legacy, df_legacy = best_time(merge_datasets_legacy, series, how, repeat=args.repeat)
+            t_new, df_new = best_time(align_datasets, series, how, repeat=args.repeat)
+            pd.testing.assert_frame_equal(df_legacy.reset_index(drop=True), df_new)
+            print(f"{n:>8}{t_legacy*1000:>21.1f}{t_new*1000:>15.1f}{t_legacy/t_new:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse, os, tempfile
+import pandas as pd
+
+from hpfc.parser import parse_HPFC_file
+from hpfc.store import load_curve_file
+from hpfc.timeaxis import utc_from_wall_clock
+from benchmarks.common import data_path, HPFC_files, best_time
+
+
+# Compares the vectorized parser of hpfc.parser with the original transpose/melt implementation
+# of fetch_HPFC_data_from_filer, on every HPFC file of the data directory.
+# The last column is the read time from the parquet store of hpfc.store, once the file is converted.
+# The original implementation returns local wall-clock times : its result is put on the UTC time axis of
+# hpfc.timeaxis before the comparison.
+
+def parse_HPFC_file_legacy(file_path, name):
+    # original implementation, kept here as a reference
+    df = pd.read_csv(file_path, sep=";")
+    df.columns.values[0] = "Datum"
+    df = df.transpose()
+    df.columns = df.iloc[0]
+    df = df[1:]
+    df = df.reset_index()
+    df = df.melt(id_vars=["index"], value_vars=list(df.columns)[1:])
+    df["Datum"] = df["Datum"].astype(str) + " " + df["index"].astype(str) + "h"
+    df = df.drop("index", axis=1)
+    df["Datum"] = pd.to_datetime(df["Datum"], format="%d.%m.%Y %Hh")
+    df["value"] = df["value"].astype(float)
+    df.columns = ["Datum", name]
+    return df
+
+def utc_frame(df):
+    datum, positions = utc_from_wall_clock(df["Datum"].to_numpy())
+    return pd.DataFrame({"Datum": datum, df.columns[1]: df.iloc[:, 1].to_numpy()[positions]})
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the HPFC file parser")
+    parser.add_argument("--data-path", default=data_path)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    store_path = tempfile.mkdtemp()
+    total_legacy, total_new, total_store = 0.0, 0.0, 0.0
+    print(f"{'file':<32}{'legacy (ms)':>14}{'vectorized (ms)':>18}{'speedup':>10}{'store (ms)':>13}")
+    for file_path in HPFC_files(args.data_path):
+        name = os.path.basename(file_path)[:-4]
+        t_legacy, df_legacy = best_time(parse_HPFC_file_legacy, file_path, name, repeat=args.repeat)
+        t_new, df_new = best_time(parse_HPFC_file, file_path, name, repeat=args.repeat)
+        # both parsers must return exactly the same curve
+        df_legacy = utc_frame(df_legacy)
+        pd.testing.assert_frame_equal(df_legacy, df_new)
+        load_curve_file(file_path, name, store_path)
+        t_store, df_store = best_time(load_curve_file, file_path, name, store_path, repeat=args.repeat)
+        pd.testing.assert_frame_equal(df_legacy, df_store)
+        total_legacy += t_legacy
+        total_new += t_new
+        total_store += t_store
+        print(f"{name:<32}{t_legacy*1000:>14.1f}{t_new*1000:>18.1f}{t_legacy/t_new:>9.1f}x{t_store*1000:>13.1f}")
+    print(f"{'total':<32}{total_legacy*1000:>14.1f}{total_new*1000:>18.1f}{total_legacy/total_new:>9.1f}x{total_store*1000:>13.1f}")
+
+if __name__ == "__main__":
+    main()
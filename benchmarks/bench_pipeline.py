@@ -0,0 +1,171 @@
+import argparse, gc, json, os, platform, shutil, subprocess, tempfile, threading, time, tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+from hpfc.parser import HPFC_column_name, HPFC_file_name
+from hpfc.store import load_curve_file
+from hpfc.align import align_datasets
+from hpfc.engine import split_products
+from hpfc.aggregates import AggregatePyramid, granularity_codes
+from hpfc.stats import WindowStatistics
+from hpfc.products import default_product_definition, peak_mask
+from hpfc.spot import update_spot_archive, spot_frame
+from hpfc.loader import http_session
+from hpfc.metrics import resident_memory
+from hpfc import siloveda_stub
+from benchmarks.synthetic import generate_dataset, spot_code
+
+
+# Headless benchmark of the whole pipeline of the app, without streamlit, over a synthetic dataset :
+#   parse (csv to the parquet store) -> store read -> spot (SiloVeda stub over HTTP) -> merge
+#   -> product split -> aggregate (pyramid and averages of every granularity) -> stats (kernel and a window)
+# Each stage is timed (best of --repeat runs) and then run once more under tracemalloc for its peak memory
+# (numpy and pandas allocations ; the buffers of pyarrow are not traced). The results are written as json
+# in --results-dir, with the git commit, so that two commits can be compared :
+#   python -m benchmarks.bench_pipeline --countries 10 --vintages 30
+#   python -m benchmarks.bench_pipeline --countries 10 --vintages 30 --compare benchmarks/results/<file>.json
+
+results_dir = "benchmarks/results/"
+work_dir = ".hpfc_bench/"
+regression_threshold = 1.10
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def measure(function, repeat):
+    # best wall time over repeat runs, then the peak traced memory of one more run, and its result
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+        del result
+    gc.collect()
+    memory = resident_memory()
+    tracemalloc.start()
+    try:
+        result = function()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    rss = resident_memory()
+    return best, peak, (rss - memory if rss is not None and memory is not None else None), result
+
+def run_pipeline(data_path, countries, vintages, repeat, spot_url=None):
+    stages = []
+    temporary_dirs = []
+    def temporary_dir(prefix):
+        temporary_dirs.append(tempfile.mkdtemp(prefix=prefix))
+        return temporary_dirs[-1]
+    try:
+        return run_stages(data_path, countries, vintages, repeat, spot_url, stages, temporary_dir)
+    finally:
+        for directory in temporary_dirs:
+            shutil.rmtree(directory, ignore_errors=True)
+
+def run_stages(data_path, countries, vintages, repeat, spot_url, stages, temporary_dir):
+    def record(name, function, rows=len):
+        seconds, peak, rss_delta, result = measure(function, repeat)
+        stages.append({"stage": name, "seconds": seconds, "peak_bytes": peak, "rss_delta_bytes": rss_delta, "rows": rows(result)})
+        print(f"{name:<16}{seconds*1000:>12.1f}{peak/2**20:>14.1f}{rows(result):>14}")
+        return result
+
+    files = [(data_path + HPFC_file_name(country, vintage), HPFC_column_name(country, vintage)) for country in countries for vintage in vintages]
+    print(f"{'stage':<16}{'time (ms)':>12}{'peak (MB)':>14}{'rows':>14}")
+    # each parse run converts into an empty store, the read runs use the converted store
+    def parse():
+        store_path = temporary_dir("hpfc_bench_store_")
+        return [load_curve_file(file_path, name, store_path) for file_path, name in files], store_path
+    datasets, store_path = record("parse", parse, rows=lambda result: sum(len(df) for df in result[0]))
+    datasets = record("store read", lambda: [load_curve_file(file_path, name, store_path) for file_path, name in files],
+                      rows=lambda result: sum(len(df) for df in result))
+    if spot_url is not None:
+        def spot():
+            spot_store = temporary_dir("hpfc_bench_spot_")
+            return [spot_frame(update_spot_archive(spot_code(country), spot_store, http_session(), spot_url), "spot_" + country) for country in countries]
+        datasets = record("spot", spot, rows=lambda result: sum(len(df) for df in result)) + datasets
+    merged_df = record("merge", lambda: align_datasets(datasets, how="outer"))
+    products = record("product split", lambda: split_products(merged_df, default_product_definition), rows=lambda result: len(result[1]))
+    def aggregate():
+        pyramid = AggregatePyramid(products[1])
+        return [pyramid.averages(code) for code in granularity_codes]
+    record("aggregate", aggregate, rows=lambda result: sum(len(df) for df in result))
+    def statistics():
+        kernel = WindowStatistics(merged_df, peak_mask(merged_df["Datum"].to_numpy(), default_product_definition))
+        start, end = merged_df["Datum"].iloc[len(merged_df) // 4], merged_df["Datum"].iloc[3 * len(merged_df) // 4]
+        return kernel.window(start, end)
+    record("stats", statistics)
+    return stages
+
+def compare(stages, baseline_path, threshold=regression_threshold):
+    # ratio of the times of each stage to the baseline, the stages slower than threshold are flagged
+    with open(baseline_path) as baseline_file:
+        baseline = {stage["stage"]: stage for stage in json.load(baseline_file)["stages"]}
+    print("\ncompared with " + baseline_path)
+    print(f"{'stage':<16}{'baseline (ms)':>15}{'now (ms)':>12}{'ratio':>9}")
+    regressions = []
+    for stage in stages:
+        if stage["stage"] not in baseline:
+            continue
+        before = baseline[stage["stage"]]["seconds"]
+        ratio = stage["seconds"] / before if before > 0 else float("inf")
+        flag = "  slower" if ratio > threshold else ""
+        if ratio > threshold:
+            regressions.append(stage["stage"])
+        print(f"{stage['stage']:<16}{before*1000:>15.1f}{stage['seconds']*1000:>12.1f}{ratio:>8.2f}x{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the load, merge, product split, aggregate and stats pipeline")
+    parser.add_argument("--countries", type=int, default=4)
+    parser.add_argument("--vintages", type=int, default=5)
+    parser.add_argument("--years", type=int, default=4)
+    parser.add_argument("--step-minutes", type=int, default=60, choices=[15, 30, 60])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-spot", action="store_true", help="skip the SiloVeda stage")
+    parser.add_argument("--work-dir", default=work_dir)
+    parser.add_argument("--results-dir", default=results_dir)
+    parser.add_argument("--compare", help="json results of an earlier run")
+    args = parser.parse_args()
+
+    # the synthetic files are generated once per set of parameters and reused by later runs
+    name = "c" + str(args.countries) + "_v" + str(args.vintages) + "_y" + str(args.years) + "_m" + str(args.step_minutes)
+    data_path = os.path.join(args.work_dir, name) + "/"
+    start = time.perf_counter()
+    countries, vintages = generate_dataset(data_path, args.countries, args.vintages, args.years, args.step_minutes)
+    print(str(len(countries) * len(vintages)) + " synthetic file(s) in " + data_path + f" ({time.perf_counter() - start:.1f}s)\n")
+
+    spot_url, server = None, None
+    if not args.no_spot:
+        server = siloveda_stub.serve(port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        spot_url = "http://127.0.0.1:" + str(server.server_address[1]) + "/SiloVedaServices/measuringdata_api/v3/timeSeries/"
+    try:
+        stages = run_pipeline(data_path, countries, vintages, args.repeat, spot_url)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    result = {"commit": git_commit(), "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+              "parameters": {"countries": args.countries, "vintages": args.vintages, "years": args.years,
+                             "step_minutes": args.step_minutes, "repeat": args.repeat, "spot": not args.no_spot},
+              "environment": {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+                              "machine": platform.machine(), "system": platform.system()},
+              "stages": stages}
+    os.makedirs(args.results_dir, exist_ok=True)
+    result_path = os.path.join(args.results_dir, "pipeline_" + name + "_" + datetime.now().strftime("%Y%m%d_%H%M%S") + "_" + str(result["commit"]) + ".json")
+    with open(result_path, "w") as result_file:
+        json.dump(result, result_file, indent=2)
+    print("\nresults written to " + result_path)
+    if args.compare:
+        regressions = compare(stages, args.compare)
+        if len(regressions) > 0:
+            print("slower than the baseline : " + ", ".join(regressions))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import glob, os, time
+
+
+# helpers shared by the benchmarks
+
+data_path = "small_HPFC_data/"
+
+def HPFC_files(data_path=data_path):
+    return sorted(glob.glob(os.path.join(data_path, "HPFC_*.csv")))
+
+def best_time(function, *args, repeat=5):
+    # best wall time over several runs, in seconds, and the result of the last run
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
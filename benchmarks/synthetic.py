@@ -0,0 +1,82 @@
+import argparse, os
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+from hpfc.parser import HPFC_file_name
+
+
+# Synthetic HPFC datasets for the benchmarks
+# The files have the exact layout of the filer (DWH_REFERENZPREISE_<CC>;0;1;...;23, one line per day,
+# dd.mm.yyyy and the prices with a "." decimal separator), one file per country and vintage, named
+# HPFC_<CC>_<yyyymmdd>.csv. Each curve starts on January 1 of the year of its vintage and covers `years`
+# years, with daily, weekly and yearly shapes plus noise. With step_minutes=15 the files have one column
+# per quarter hour (0 to 95). Everything is deterministic : the same arguments give the same files.
+# The spot prices come from the SiloVeda stub (hpfc.siloveda_stub), which answers synthetic json responses.
+#   python -m benchmarks.synthetic .hpfc_bench/data --countries 10 --vintages 365
+
+country_codes = ["CH", "DE", "FR", "AT", "IT", "NL", "BE", "CZ", "HU", "SI", "PL", "ES", "DK", "SE", "NO", "SK"]
+siloveda_spot_codes = {"CH": 17210, "DE": 17208, "FR": 17209, "AT": 17207}
+
+def synthetic_countries(n_countries):
+    # real codes first, then XA, XB, ... if more countries are asked for
+    extra = [chr(ord("X") + i // 26) + chr(ord("A") + i % 26) for i in range(max(0, n_countries - len(country_codes)))]
+    return (country_codes + extra)[:n_countries]
+
+def vintage_dates(n_vintages, last_vintage=date(2023, 4, 17)):
+    # one vintage per calendar day, the last one on last_vintage
+    return [last_vintage - timedelta(days=n_vintages - 1 - i) for i in range(n_vintages)]
+
+def synthetic_prices(country, vintage, days, step_minutes=60):
+    # prices of shape (days, steps per day) for the curve of a country and vintage
+    steps = 24 * 60 // step_minutes
+    seed = sum(ord(c) * 31**i for i, c in enumerate(country)) * 100003 + vintage.toordinal()
+    rng = np.random.default_rng(seed)
+    hours = np.arange(steps) * step_minutes / 60
+    day_numbers = np.arange(len(days))
+    weekdays = np.array([day.weekday() for day in days])
+    level = 80 + 15 * (seed % 7) + 30 * np.cos((np.array([day.timetuple().tm_yday for day in days]) - 15) / 365 * 2 * np.pi)
+    daily_shape = 25 * np.sin((hours - 7) / 24 * 2 * np.pi) + 15 * np.exp(-((hours - 19) / 2) ** 2)
+    weekend = np.where(weekdays >= 5, -20.0, 0.0)
+    drift = (vintage.toordinal() % 30) * 0.5 - day_numbers / 365 * 3
+    values = (level + weekend + drift)[:, None] + daily_shape[None, :] + rng.normal(0, 6, (len(days), steps))
+    return np.round(values, 2)
+
+def write_HPFC_file(file_path, country, vintage, years=4, step_minutes=60):
+    start = date(vintage.year, 1, 1)
+    days = [start + timedelta(days=i) for i in range((date(vintage.year + years, 1, 1) - start).days)]
+    steps = 24 * 60 // step_minutes
+    values = synthetic_prices(country, vintage, days, step_minutes)
+    df = pd.DataFrame(values, index=[day.strftime("%d.%m.%Y") for day in days], columns=[str(i) for i in range(steps)])
+    df.index.name = "DWH_REFERENZPREISE_" + country
+    df.to_csv(file_path, sep=";", float_format="%.2f", lineterminator="\n")
+
+def generate_dataset(directory, n_countries=4, n_vintages=5, years=4, step_minutes=60, last_vintage=date(2023, 4, 17)):
+    # write the files that are not there yet, return the countries and the vintages as yyyymmdd strings
+    os.makedirs(directory, exist_ok=True)
+    countries = synthetic_countries(n_countries)
+    vintages = vintage_dates(n_vintages, last_vintage)
+    for country in countries:
+        for vintage in vintages:
+            file_path = os.path.join(directory, HPFC_file_name(country, vintage.strftime("%Y%m%d")))
+            if not os.path.isfile(file_path):
+                write_HPFC_file(file_path, country, vintage, years, step_minutes)
+    return countries, [vintage.strftime("%Y%m%d") for vintage in vintages]
+
+def spot_code(country):
+    # SiloVeda time series of the spot prices of a country, a synthetic code for the other countries
+    return siloveda_spot_codes.get(country, 18000 + country_codes.index(country) if country in country_codes else 19000 + sum(map(ord, country)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic HPFC files in the layout of the filer")
+    parser.add_argument("directory")
+    parser.add_argument("--countries", type=int, default=4)
+    parser.add_argument("--vintages", type=int, default=5)
+    parser.add_argument("--years", type=int, default=4)
+    parser.add_argument("--step-minutes", type=int, default=60, choices=[15, 30, 60])
+    args = parser.parse_args()
+    countries, vintages = generate_dataset(args.directory, args.countries, args.vintages, args.years, args.step_minutes)
+    print(str(len(countries) * len(vintages)) + " file(s) in " + args.directory)
+
+if __name__ == "__main__":
+    main()
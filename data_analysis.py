@@ -1,40 +1,41 @@
-import pandas as pd
-from datetime import datetime
 import streamlit as st
 
-data_path = "small_HPFC_data/"
+from hpfc import engine
+from hpfc.timeaxis import local_frame
+
+# the data of the apps comes from the shared engine of hpfc.engine (loader, product splitter and aggregator),
+# whose results are also shared on disk between the app processes ; st.cache_data keeps them in the process
+data_path = engine.data_path
 #data_path = "K:/Dept/W/HUV.A04974/1000_Handel Front Office/1100_Admin/1170_User/Lelievre/HPFC/"
 
 @st.cache_data
 def get_HPFC_data(country, date):
     # need date as 8-characters string : yyyymmdd
     # will need to implement error detection at some point
-    df = pd.read_csv(data_path + "HPFC_" + country +"_" + date + ".csv", sep=";")
-    df.columns.values[0] = "Datum"
-    df = df.transpose()
-    df.columns = df.iloc[0]
-    df = df[1:]
-    df = df.reset_index()
-    df = df.melt(id_vars=["index"], value_vars=list(df.columns)[1:])
-    df["Datum"] = df["Datum"].astype(str) + " " + df["index"].astype(str) + "h"
-    df = df.drop("index", axis=1)
-    df["Datum"] = pd.to_datetime(df["Datum"], format="%d.%m.%Y %Hh")
-    df["value"] = df["value"].astype(float)
-    df.columns = ["Datum", "HPFC" + "_" + country +"_" + date]
+    df = engine.load_curve(country, date, data_path)
     
     return df
 
 @st.cache_data
-def merge_HPFC_data(countries, dates):
-    merged_df = pd.DataFrame()
-    for country in countries:
-        for date in dates:
-            df = get_HPFC_data(country, date)
-            if len(merged_df)==0:
-                merged_df = df
-            else:
-                merged_df = pd.merge(merged_df, df, on="Datum")
+def get_HPFC_curves(countries, dates):
+    # inner join of all the curves on "Datum" (UTC), in a single pass
+    datasets = [get_HPFC_data(country, date) for country in countries for date in dates]
+    merged_df = engine.merge_curves(datasets, how="inner")
     return merged_df
 
-    
+@st.cache_data
+def merge_HPFC_data(countries, dates):
+    # the merged curves with "Datum" in local time, for the tables and charts
+    return local_frame(get_HPFC_curves(countries, dates))
 
+@st.cache_data
+def get_forward_table(country, date):
+    # forward product prices of an HPFC file : day-ahead, weeks, months, quarters and calendar years, base and peak
+    return engine.forward_table(country, date, data_path)
+
+@st.cache_data
+def get_product_prices(countries, dates, period, load):
+    # prices of the products of a period ("M" for the months) for every curve
+    return engine.product_prices(countries, dates, period, load, data_path)
+
+    
@@ -0,0 +1,3 @@
+# Shared data engine of the HPFC Streamlit apps
+# The modules of this package do not depend on streamlit, so they can be used by the apps,
+# by the benchmarks and by scripts alike. Caching for the apps is done in the apps themselves.
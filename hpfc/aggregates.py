@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+from hpfc.timeaxis import local_times, to_utc
+
+
+# Multi-granularity aggregate pyramid
+# Built once per loaded curve set and product : prefix sums and counts of the values, and for every
+# granularity (quarter-hourly, hourly, daily, weekly, monthly, quarterly, yearly) the row boundaries of each
+# period plus the per-period sums and counts. Any granularity over any date window is then answered by slicing,
+# and the means over partial windows are exact (sum / count over the values inside the window).
+# The rows are on the UTC time axis (hpfc.timeaxis) and the periods are those of the local calendar : the quarter
+# hours and hours are cut on the UTC instants, the days, weeks, months, quarters and years on the local times, so
+# that a day has 23, 24 or 25 hours. The period labels and the bounds of the windows are local wall-clock times,
+# the labels are those of groupby(pd.Grouper(freq=...)) on the local times, empty periods included.
+# Granularities finer than the time step of the data are answered by the finest level of the data
+# (e.g. quarter-hourly averages of hourly curves are the hourly values).
+
+granularity_codes = ["15min", "H", "D", "W", "M", "Q", "Y"]
+granularity_steps = {"15min": np.timedelta64(15, "m"), "H": np.timedelta64(1, "h"), "D": np.timedelta64(1, "D")}
+
+class AggregatePyramid:
+
+    def __init__(self, df):
+        # df : "Datum" column sorted in time, and one column per series (or an empty dataframe)
+        if len(df) == 0:
+            df = pd.DataFrame({"Datum": np.array([], dtype="datetime64[ns]")})
+        self.columns = [column for column in df.columns if column != "Datum"]
+        self.datum = df["Datum"].to_numpy()
+        self.local = local_times(self.datum)
+        values = df[self.columns].to_numpy(dtype="float64")
+        finite = ~np.isnan(values)
+        self.cum_sums = np.zeros((len(values)+1, len(self.columns)))
+        self.cum_counts = np.zeros((len(values)+1, len(self.columns)), dtype="int64")
+        np.cumsum(np.where(finite, values, 0.0), axis=0, out=self.cum_sums[1:])
+        np.cumsum(finite, axis=0, out=self.cum_counts[1:])
+        self.levels = {}
+        if len(self.datum) > 0:
+            steps = np.diff(self.datum)
+            steps = steps[steps > np.timedelta64(0)]
+            step = steps.min() if len(steps) > 0 else np.timedelta64(1, "h")
+            for code in granularity_codes:
+                if code in granularity_steps and granularity_steps[code] < step:
+                    continue
+                self.levels[code] = self.build_level(code)
+
+    @property
+    def nbytes(self):
+        return self.cum_sums.nbytes + self.cum_counts.nbytes + sum(sums.nbytes + counts.nbytes for labels, bounds, sums, counts in self.levels.values())
+
+    def build_level(self, code):
+        # labels of the periods and index of the first row of each period (plus the end)
+        if code in ("15min", "H"):
+            # the UTC offsets are whole hours : the hours of the UTC axis are the local hours, 25 on the autumn switch day
+            rows_per_period = pd.Series(1, index=pd.DatetimeIndex(self.datum)).resample(code).count()
+            labels = pd.DatetimeIndex(local_times(rows_per_period.index.to_numpy()))
+        else:
+            rows_per_period = pd.Series(1, index=pd.DatetimeIndex(self.local)).resample(code).count()
+            labels = rows_per_period.index
+        bounds = np.zeros(len(rows_per_period)+1, dtype="int64")
+        np.cumsum(rows_per_period.to_numpy(), out=bounds[1:])
+        sums = self.cum_sums[bounds[1:]] - self.cum_sums[bounds[:-1]]
+        counts = self.cum_counts[bounds[1:]] - self.cum_counts[bounds[:-1]]
+        return labels, bounds, sums, counts
+
+    def level_code(self, granularity_code):
+        # the granularity itself, or the finest level of the data if the granularity is finer than its time step
+        if granularity_code in self.levels or len(self.levels) == 0:
+            return granularity_code
+        return next(code for code in granularity_codes if code in self.levels)
+
+    def period_range(self, granularity_code, start=None, end=None):
+        # first and last (excluded) periods overlapping the window
+        labels, bounds, sums, counts = self.levels[self.level_code(granularity_code)]
+        lo, hi = self.window_rows(start, end)
+        if lo == hi:
+            return 0, 0
+        return np.searchsorted(bounds, lo, side="right") - 1, np.searchsorted(bounds, hi - 1, side="right")
+
+    def period_means(self, granularity_code, first, last):
+        # labels and means of the full periods first to last (excluded)
+        labels, bounds, sums, counts = self.levels[self.level_code(granularity_code)]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(counts[first:last] > 0, sums[first:last] / counts[first:last], np.nan)
+        return labels[first:last], means
+
+    def window_rows(self, start=None, end=None):
+        # rows strictly between start and end (local wall-clock times), like (Datum > start) & (Datum < end)
+        lo = 0 if start is None else np.searchsorted(self.datum, to_utc(start), side="right")
+        hi = len(self.datum) if end is None else np.searchsorted(self.datum, to_utc(end), side="left")
+        return lo, max(lo, hi)
+
+    def window_sums(self, start=None, end=None):
+        # exact sums and counts of every column over a window
+        lo, hi = self.window_rows(start, end)
+        return self.cum_sums[hi] - self.cum_sums[lo], self.cum_counts[hi] - self.cum_counts[lo]
+
+    def window_means(self, start=None, end=None):
+        sums, counts = self.window_sums(start, end)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.Series(np.where(counts > 0, sums / counts, np.nan), index=self.columns)
+
+    def averages(self, granularity_code, start=None, end=None):
+        # same dataframe as groupby(pd.Grouper(freq=granularity_code)).mean() over the local periods, with a "Datum"
+        # column of local labels inserted, computed on the rows of the window only
+        if len(self.datum) == 0:
+            return pd.DataFrame()
+        labels, bounds, sums, counts = self.levels[self.level_code(granularity_code)]
+        if start is not None or end is not None:
+            lo, hi = self.window_rows(start, end)
+            if lo == hi:
+                return pd.DataFrame()
+            # periods of the first and last rows of the window, the edge periods are recomputed on the window
+            first = np.searchsorted(bounds, lo, side="right") - 1
+            last = np.searchsorted(bounds, hi - 1, side="right") - 1
+            labels = labels[first:last+1]
+            sums, counts = sums[first:last+1].copy(), counts[first:last+1].copy()
+            for i, period in [(0, first), (len(labels)-1, last)]:
+                period_lo, period_hi = max(bounds[period], lo), min(bounds[period+1], hi)
+                sums[i] = self.cum_sums[period_hi] - self.cum_sums[period_lo]
+                counts[i] = self.cum_counts[period_hi] - self.cum_counts[period_lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(counts > 0, sums / counts, np.nan)
+        gran_df = pd.DataFrame(means, index=labels.rename("Datum"), columns=self.columns)
+        gran_df.insert(loc=0, column="Datum", value=gran_df.index)
+        return gran_df
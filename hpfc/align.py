@@ -0,0 +1,62 @@
+from functools import reduce
+import numpy as np
+import pandas as pd
+
+
+# Single-pass alignment of several "Datum"-keyed datasets
+# Replaces the iterative pd.merge(..., on="Datum") loops : the common time index is built once
+# (union for an outer join, intersection for an inner join) and every value column is written
+# into one preallocated 2D array, instead of copying an ever wider merged frame for each dataset.
+# The result is the same as the iterative merge, as long as the timestamps of each dataset are unique.
+
+def align_datasets(datasets, how="outer"):
+    # datasets : dataframes with a "Datum" column and one or more value columns, empty ones are ignored
+    datasets = [df for df in datasets if len(df)>0]
+    if len(datasets) == 0:
+        return pd.DataFrame()
+    keys = [df["Datum"].to_numpy() for df in datasets]
+    # most datasets share the same time axis : each distinct axis is only used once to build the index
+    distinct_keys, key_ids = [], []
+    for key in keys:
+        for i, other in enumerate(distinct_keys):
+            if len(key) == len(other) and np.array_equal(key, other):
+                key_ids.append(i)
+                break
+        else:
+            key_ids.append(len(distinct_keys))
+            distinct_keys.append(key)
+    if how == "outer":
+        datum = distinct_keys[0] if len(distinct_keys) == 1 else np.unique(np.concatenate(distinct_keys))
+    elif how == "inner":
+        datum = reduce(np.intersect1d, distinct_keys)
+    else:
+        raise ValueError("how must be 'outer' or 'inner', not " + repr(how))
+    columns = [column for df in datasets for column in df.columns if column != "Datum"]
+    dtype = np.result_type(*[df[column].dtype for df in datasets for column in df.columns if column != "Datum"])
+    if not np.issubdtype(dtype, np.floating):
+        dtype = np.dtype("float64")
+    # one row per value column, so that the transposed array becomes a single pandas block without copy
+    values = np.full((len(columns), len(datum)), np.nan, dtype=dtype)
+    # positions of each distinct axis in the common index (None when the axis is the index itself)
+    positions = []
+    for key in distinct_keys:
+        if len(key) == len(datum) and np.array_equal(key, datum):
+            positions.append(None)
+        else:
+            position = np.searchsorted(datum, key)
+            found = position < len(datum)
+            found[found] = datum[position[found]] == key[found]
+            positions.append((position[found], found))
+    row = 0
+    for df, key_id in zip(datasets, key_ids):
+        n_columns = df.shape[1] - 1
+        df_values = df.drop(columns="Datum").to_numpy(dtype=dtype, copy=False).T
+        if positions[key_id] is None:
+            values[row:row+n_columns] = df_values
+        else:
+            position, found = positions[key_id]
+            values[row:row+n_columns, position] = df_values[:, found]
+        row += n_columns
+    merged_df = pd.DataFrame(values.T, columns=columns, copy=False)
+    merged_df.insert(loc=0, column="Datum", value=datum)
+    return merged_df
@@ -0,0 +1,131 @@
+import os, sys, time
+from collections import OrderedDict
+from threading import Lock
+from weakref import WeakValueDictionary
+import numpy as np
+import pandas as pd
+
+from hpfc.metrics import note_cache
+
+
+# Size-bounded cache of the curve data, shared by all the sessions of a server process
+# The keys are cheap identifiers (e.g. ("HPFC", country, date, file mtime) or (selection, product)) instead of
+# hashes of whole dataframes. The cache is an LRU bounded by a memory budget, entries can have a time to live
+# (for the spot data), and entries built from files are dropped as soon as one of these files changes.
+# Hits, misses, evictions, expirations and invalidations are counted.
+
+def value_size(value):
+    # approximate memory size of a cached value in bytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(value_size(item) for item in value)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+class CurveCache:
+
+    def __init__(self, max_bytes=1024 * 2**20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size, expiry time or None, sources)
+        self.bytes = 0
+        self.lock = Lock()
+        self.key_locks = WeakValueDictionary()
+        self.hits, self.misses, self.evictions, self.expirations, self.invalidations = 0, 0, 0, 0, 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self.remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, ttl=None, sources=()):
+        # sources : (path, signature) of the files the value was built from
+        size = value_size(value)
+        expiry = None if ttl is None else time.monotonic() + ttl
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (value, size, expiry, tuple(sources))
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key):
+        # the lock must be held
+        value, size, expiry, sources = self.entries.pop(key)
+        self.bytes -= size
+
+    def key_lock(self, key):
+        with self.lock:
+            lock = self.key_locks.get(key)
+            if lock is None:
+                lock = Lock()
+                self.key_locks[key] = lock
+            return lock
+
+    def get_or_compute(self, key, compute, ttl=None, source_paths=()):
+        # cached value of key, computed once (even if several threads ask for it at the same time)
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            note_cache(True)
+            return value
+        lock = self.key_lock(key)
+        with lock:
+            with self.lock:
+                entry = self.entries.get(key)
+            if entry is not None:
+                note_cache(True)
+                return entry[0]
+            # the signatures are taken before the computation, so a file modified meanwhile invalidates the entry
+            sources = [(path, file_signature(path)) for path in source_paths]
+            note_cache(False)
+            value = compute()
+            self.put(key, value, ttl, sources)
+            return value
+
+    def invalidate_changed_files(self):
+        # drop the entries built from a file that was modified or removed since, return the number of dropped entries
+        with self.lock:
+            sources = {path for value, size, expiry, entry_sources in self.entries.values() for path, signature in entry_sources}
+        signatures = {path: file_signature(path) for path in sources}
+        with self.lock:
+            stale = [key for key, (value, size, expiry, entry_sources) in self.entries.items()
+                     if any(signatures.get(path, signature) != signature for path, signature in entry_sources)]
+            for key in stale:
+                self.remove(key)
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "expirations": self.expirations, "invalidations": self.invalidations}
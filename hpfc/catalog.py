@@ -0,0 +1,215 @@
+import hashlib, logging, os, re, time
+from collections import namedtuple
+from datetime import date as Date
+from threading import Lock
+import numpy as np
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+
+
+# Catalog of the HPFC files available in a directory
+# The directory is scanned once, then kept up to date incrementally by a watchdog observer (a polling observer
+# can be used for network shares that do not send change notifications). The catalog indexes
+# (country, kind, vintage date) -> path, mtime and size, where kind is "HPFC" for HPFC_<CC>_<yyyymmdd>.csv
+# and "spot" for HPFC_<CC>_spot_<yyyymmdd>.csv.
+# For each (country, kind), a dense day -> vintage table answers "nearest vintage on or before a date" in constant time.
+
+logger = logging.getLogger(__name__)
+
+file_pattern = re.compile(r"^HPFC_(?P<country>[A-Z]{2})(?:_(?P<kind>spot))?_(?P<date>\d{8})\.csv$")
+
+CatalogEntry = namedtuple("CatalogEntry", ["country", "kind", "date", "path", "mtime_ns", "size"])
+
+def parse_file_name(file_name):
+    # (country, kind, date) of an HPFC file name, None for other files
+    match = file_pattern.match(file_name)
+    if match is None:
+        return None
+    return match.group("country"), match.group("kind") or "HPFC", match.group("date")
+
+def day_number(date):
+    # days since 0001-01-01 of a yyyymmdd string, a datetime.date or a datetime
+    if isinstance(date, str):
+        return Date(int(date[:4]), int(date[4:6]), int(date[6:8])).toordinal()
+    return date.toordinal()
+
+
+class VintageIndex:
+    # sorted vintage dates of one (country, kind) and the dense table of the latest vintage on or before each day
+
+    def __init__(self, dates):
+        self.dates = sorted(dates)
+        days = np.array([day_number(date) for date in self.dates], dtype="int64")
+        self.first_day = int(days[0]) if len(days) > 0 else 0
+        span = int(days[-1]) - self.first_day + 1 if len(days) > 0 else 0
+        self.floor = np.searchsorted(days, self.first_day + np.arange(span), side="right") - 1
+
+    def on_or_before(self, date):
+        if len(self.dates) == 0:
+            return None
+        offset = day_number(date) - self.first_day
+        if offset < 0:
+            return None
+        if offset >= len(self.floor):
+            return self.dates[-1]
+        return self.dates[self.floor[offset]]
+
+
+class CatalogEventHandler(FileSystemEventHandler):
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.catalog.update_file(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.catalog.update_file(event.src_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.catalog.remove_file(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.catalog.remove_file(event.src_path)
+            self.catalog.update_file(event.dest_path)
+
+
+class HPFCCatalog:
+
+    def __init__(self, data_path):
+        self.data_path = data_path
+        self.entries = {}  # (country, kind, date) -> CatalogEntry
+        self.indexes = {}  # (country, kind) -> VintageIndex, rebuilt lazily after a change
+        self.lock = Lock()
+        self.version = 0
+        self.observer = None
+        self.scanned_at = None
+        self.listeners = []
+
+    def scan(self):
+        # full scan of the directory, an empty catalog if the directory is missing (e.g. a share not mounted)
+        entries = {}
+        try:
+            with os.scandir(self.data_path) as files:
+                for file in files:
+                    key = parse_file_name(file.name)
+                    if key is not None and file.is_file():
+                        stat = file.stat()
+                        entries[key] = CatalogEntry(*key, os.path.join(self.data_path, file.name), stat.st_mtime_ns, stat.st_size)
+        except OSError as error:
+            logger.warning("cannot scan %s (%r), no HPFC file available", self.data_path, error)
+        with self.lock:
+            # only the new or modified entries are notified
+            changed = [entry for key, entry in entries.items() if self.entries.get(key) != entry]
+            self.entries = entries
+            self.indexes = {}
+            self.version += 1
+            self.scanned_at = time.monotonic()
+        if len(changed) > 0:
+            self.notify(changed)
+        return self
+
+    def update_file(self, path):
+        key = parse_file_name(os.path.basename(path))
+        if key is None:
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.remove_file(path)
+            return
+        entry = CatalogEntry(*key, os.path.join(self.data_path, os.path.basename(path)), stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if self.entries.get(key) == entry:
+                return
+            self.entries[key] = entry
+            self.indexes.pop(key[:2], None)
+            self.version += 1
+        self.notify([entry])
+
+    def remove_file(self, path):
+        key = parse_file_name(os.path.basename(path))
+        with self.lock:
+            if key is None or key not in self.entries:
+                return
+            del self.entries[key]
+            self.indexes.pop(key[:2], None)
+            self.version += 1
+
+    def add_listener(self, listener):
+        # listener(entries) is called with the new or modified entries after each change
+        self.listeners.append(listener)
+
+    def notify(self, entries):
+        for listener in self.listeners:
+            try:
+                listener(entries)
+            except Exception:
+                logger.exception("catalog listener failed")
+
+    def start_watching(self, polling=False, polling_interval=30):
+        # keep the catalog up to date in a background thread, return False if the directory cannot be watched
+        if self.observer is not None:
+            return True
+        observer = PollingObserver(timeout=polling_interval) if polling else Observer()
+        try:
+            observer.schedule(CatalogEventHandler(self), self.data_path, recursive=False)
+            observer.daemon = True
+            observer.start()
+        except Exception as error:
+            logger.warning("cannot watch %s (%r), the catalog is refreshed by scans", self.data_path, error)
+            return False
+        self.observer = observer
+        return True
+
+    def stop_watching(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer = None
+
+    def refresh_if_stale(self, max_age=60):
+        # rescan when the directory is not watched and the last scan is older than max_age seconds
+        if self.observer is None and (self.scanned_at is None or time.monotonic() - self.scanned_at > max_age):
+            self.scan()
+
+    def index(self, country, kind="HPFC"):
+        with self.lock:
+            index = self.indexes.get((country, kind))
+            if index is None:
+                index = VintageIndex([date for (c, k, date) in self.entries if c == country and k == kind])
+                self.indexes[(country, kind)] = index
+            return index
+
+    # queries
+
+    def entry(self, country, date, kind="HPFC"):
+        return self.entries.get((country, kind, date))
+
+    def countries(self, kind="HPFC"):
+        return sorted({country for (country, k, date) in self.entries if k == kind})
+
+    def vintages(self, country, kind="HPFC"):
+        # all vintage dates of a country, oldest first
+        return list(self.index(country, kind).dates)
+
+    def latest(self, country, n=1, kind="HPFC"):
+        # the n latest vintage dates of a country, newest first
+        return self.index(country, kind).dates[::-1][:n]
+
+    def on_or_before(self, country, date, kind="HPFC"):
+        # the latest vintage date of a country on or before date, None if there is none
+        return self.index(country, kind).on_or_before(date)
+
+    def signature(self, countries, kind="HPFC"):
+        # hash of the paths, mtimes and sizes of the files of the countries, changes when one of them changes
+        sha = hashlib.sha1()
+        with self.lock:
+            entries = sorted(entry for key, entry in self.entries.items() if key[0] in countries and key[1] == kind)
+        for entry in entries:
+            sha.update((entry.path + ";" + str(entry.mtime_ns) + ";" + str(entry.size) + "\n").encode())
+        return sha.hexdigest()[:16]
@@ -0,0 +1,148 @@
+import glob, hashlib, json, os, uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from hpfc.catalog import parse_file_name
+from hpfc.parser import HPFC_column_name, HPFC_file_name
+from hpfc.store import load_curve_file, store_path, store_format
+
+
+# Memory-mapped cube of HPFC curves
+# All the curves of several countries and forecast dates are put on one shared time axis,
+# in a single float32 array of shape (country, forecast date, hour) stored in a file of the curve store.
+# The file is memory-mapped read-only, so that every session of every worker process of the server
+# shares the same pages instead of holding its own pandas copy of each curve.
+# The cube is rebuilt when the set of source files (or the mtime/size of one of them) changes, and the older cubes
+# of the same directory and countries are then removed from the store.
+
+def available_HPFC_dates(data_path, countries):
+    # forecast dates for which a file exists, for at least one of the countries
+    dates = set()
+    for file_path in glob.glob(os.path.join(glob.escape(data_path), "HPFC_*.csv")):
+        key = parse_file_name(os.path.basename(file_path))
+        if key is not None and key[1] == "HPFC" and key[0] in countries:
+            dates.add(key[2])
+    return sorted(dates)
+
+def sources_signature(data_path, countries, dates):
+    # hash of the names, mtimes and sizes of the source files of a cube
+    sha = hashlib.sha1()
+    for country in countries:
+        for date in dates:
+            file_path = os.path.join(data_path, HPFC_file_name(country, date))
+            if os.path.isfile(file_path):
+                stat = os.stat(file_path)
+                sha.update((file_path + ";" + str(stat.st_mtime_ns) + ";" + str(stat.st_size) + "\n").encode())
+    return sha.hexdigest()[:16]
+
+
+class CurveCube:
+
+    def __init__(self, values, countries, dates, start, step, index):
+        self.values = values  # (country, date, time step), float32, NaN where there is no data
+        self.countries = list(countries)
+        self.dates = list(dates)
+        self.start = np.datetime64(start, "ns")
+        self.step = np.timedelta64(step, "ns")
+        self.index = {tuple(key): tuple(position) for key, position in index}  # (country, date) -> (c, d)
+        self.datum = self.start + np.arange(values.shape[2]) * self.step
+
+    def __contains__(self, key):
+        return tuple(key) in self.index
+
+    def curve(self, country, date):
+        # view on the prices of one curve, on the shared time axis
+        c, d = self.index[(country, date)]
+        return self.values[c, d]
+
+    def frame(self, keys):
+        # dataframe "Datum", HPFC_<country>_<date>... for the available (country, date) keys
+        # the float block is a view on the cube when the keys are consecutive in the cube (e.g. all dates of
+        # a country, or a single curve); otherwise a single float32 copy of the selected curves is made
+        keys = [tuple(key) for key in keys if tuple(key) in self.index]
+        if len(keys) == 0:
+            return pd.DataFrame()
+        n_dates = len(self.dates)
+        rows = np.array([c * n_dates + d for c, d in (self.index[key] for key in keys)])
+        flat = self.values.reshape(len(self.countries) * n_dates, -1)
+        if np.all(np.diff(rows) == 1):
+            block = flat[rows[0]:rows[-1]+1]
+        else:
+            block = flat[rows]
+        df = pd.DataFrame(block.T, columns=[HPFC_column_name(country, date) for country, date in keys], copy=False)
+        df.insert(loc=0, column="Datum", value=self.datum)
+        return df
+
+    def save(self, path):
+        # the array and its index are written to temporary files then renamed, so that a cube
+        # being built by another worker is never read half-written
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "." + uuid.uuid4().hex + ".tmp"
+        array = np.lib.format.open_memmap(path + ".npy" + tmp, mode="w+", dtype="float32", shape=self.values.shape)
+        array[:] = self.values
+        array.flush()
+        del array
+        with open(path + ".json" + tmp, "w") as f:
+            json.dump({"countries": self.countries, "dates": self.dates,
+                       "start": str(self.start), "step": int(self.step.astype("int64")),
+                       "index": [[list(key), list(position)] for key, position in self.index.items()]}, f)
+        os.replace(path + ".npy" + tmp, path + ".npy")
+        os.replace(path + ".json" + tmp, path + ".json")
+
+    @classmethod
+    def load(cls, path):
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        values = np.load(path + ".npy", mmap_mode="r")
+        return cls(values, meta["countries"], meta["dates"], meta["start"], meta["step"], meta["index"])
+
+    @classmethod
+    def from_files(cls, data_path, countries, dates, store_path=store_path):
+        # the files are read in parallel, most of the time is spent in pandas/pyarrow code that releases the GIL
+        keys = [(country, date) for country in countries for date in dates
+                if os.path.isfile(os.path.join(data_path, HPFC_file_name(country, date)))]
+        def read(key):
+            df = load_curve_file(os.path.join(data_path, HPFC_file_name(*key)), HPFC_column_name(*key), store_path)
+            return df["Datum"].to_numpy(), df.iloc[:, 1].to_numpy(dtype="float32")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            curves = dict(zip(keys, executor.map(read, keys)))
+        if len(curves) == 0:
+            values = np.full((len(countries), len(dates), 0), np.nan, dtype="float32")
+            return cls(values, countries, dates, "1970-01-01", 3600 * 10**9, [])
+        # shared time axis : from the first to the last timestamp of all curves, with the step of the curves
+        start = min(datum[0] for datum, _ in curves.values())
+        end = max(datum[-1] for datum, _ in curves.values())
+        step = min(datum[1] - datum[0] for datum, _ in curves.values())
+        values = np.full((len(countries), len(dates), (end - start) // step + 1), np.nan, dtype="float32")
+        index = []
+        for (country, date), (datum, prices) in curves.items():
+            c, d = countries.index(country), dates.index(date)
+            values[c, d, (datum - start) // step] = prices
+            index.append(((country, date), (c, d)))
+        return cls(values, countries, dates, start, step, index)
+
+def remove_stale_cubes(path):
+    # older cubes of the same directory and countries (other dates or source files), a cube still mapped by
+    # another process that cannot be removed (on Windows) is removed after a later build
+    prefix = path.rsplit("_", 1)[0]
+    for old_path in glob.glob(glob.escape(prefix) + "_*.npy") + glob.glob(glob.escape(prefix) + "_*.json"):
+        if os.path.splitext(old_path)[0] != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+def open_cube(data_path, countries, dates=None, store_path=store_path):
+    # cube of every available forecast date by default, built once and then memory-mapped from the store
+    # the file name is cube_<directory and countries>_<dates, sources and store format>
+    if dates is None:
+        dates = available_HPFC_dates(data_path, countries)
+    signature = sources_signature(data_path, countries, dates)
+    sources = hashlib.sha1(json.dumps([os.path.abspath(data_path), list(countries)]).encode()).hexdigest()[:12]
+    key = hashlib.sha1((json.dumps([list(countries), list(dates), store_format]) + signature).encode()).hexdigest()[:16]
+    path = os.path.join(store_path, "cubes", "cube_" + sources + "_" + key)
+    if not (os.path.isfile(path + ".npy") and os.path.isfile(path + ".json")):
+        CurveCube.from_files(data_path, list(countries), list(dates), store_path).save(path)
+        remove_stale_cubes(path)
+    return CurveCube.load(path)
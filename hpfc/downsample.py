@@ -0,0 +1,40 @@
+import numpy as np
+
+
+# Min/max bucket downsampling of the lines sent to the browser
+# The points of a line inside the displayed window are split into buckets (about one per pixel) and
+# only the minimum and the maximum of each bucket are kept, in time order : price spikes and troughs stay
+# visible while the number of points per line stays near twice the pixel width of the chart.
+# A bucket without any value becomes a single NaN point, so that gaps still break the line.
+
+def minmax_indices(values, n_buckets):
+    # indices of the points to keep, sorted
+    n = len(values)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = values
+    buckets = padded.reshape(n_buckets, size)
+    missing = np.isnan(buckets)
+    empty = missing.all(axis=1)
+    offsets = np.arange(n_buckets) * size
+    lows = np.where(missing, np.inf, buckets).argmin(axis=1) + offsets
+    highs = np.where(missing, -np.inf, buckets).argmax(axis=1) + offsets
+    # empty buckets keep their first point, which is NaN
+    lows[empty] = offsets[empty]
+    highs[empty] = offsets[empty]
+    indices = np.unique(np.concatenate([lows, highs, [0, n-1]]))
+    return indices[indices < n]
+
+def downsample_series(datum, values, start=None, end=None, n_buckets=1000):
+    # points of a line between start and end (plus one point on each side, so that the line reaches the
+    # edges of the chart), downsampled to about 2 * n_buckets points
+    datum = np.asarray(datum)
+    values = np.asarray(values, dtype="float64")
+    lo = 0 if start is None else max(np.searchsorted(datum, np.datetime64(start, "ns"), side="left") - 1, 0)
+    hi = len(datum) if end is None else min(np.searchsorted(datum, np.datetime64(end, "ns"), side="right") + 1, len(datum))
+    datum, values = datum[lo:hi], values[lo:hi]
+    indices = minmax_indices(values, n_buckets)
+    return datum[indices], values[indices]
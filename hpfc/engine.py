@@ -0,0 +1,184 @@
+import dataclasses, hashlib, os, time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from hpfc.parser import HPFC_column_name, HPFC_file_name
+from hpfc.store import store_path, store_format, load_curve_file, load_product_table, write_table_atomic, file_lock
+from hpfc.align import align_datasets
+from hpfc.products import default_product_definition, peak_mask, product_mask
+from hpfc.aggregates import AggregatePyramid
+from hpfc.stats import WindowStatistics
+from hpfc.cache import file_signature
+from hpfc.forward import ForwardTable, compute_product_table
+
+
+# Data engine shared by all the apps
+# One loader (the HPFC files through the parquet store), one product splitter (the calendar peak mask of
+# hpfc.products) and one aggregator (the aggregate pyramid), so that every app computes base / peak /
+# off-peak and the period averages the same way. The prices of the forward products (day-ahead, weeks, months,
+# quarters, calendar years) come from the tables computed when each file is ingested (hpfc.forward).
+# The derived frames are also kept on disk in the store directory, keyed on their parameters and on the
+# mtime and size of the source files : an app process reuses what another process (or a previous run)
+# has already computed. The derived files not used for derived_max_age seconds are removed.
+
+data_path = os.environ.get("HPFC_DATA_PATH", "small_HPFC_data/")
+derived_max_age = 7 * 24 * 3600
+
+def source_files(countries, dates, data_path=data_path):
+    return [data_path + HPFC_file_name(country, date) for country in countries for date in dates]
+
+def load_curve(country, date, data_path=data_path, store_path=store_path):
+    # curve of one HPFC file (hourly or quarter-hourly) : "Datum" and HPFC_<country>_<date>
+    return load_curve_file(data_path + HPFC_file_name(country, date), HPFC_column_name(country, date), store_path)
+
+def cached_curve(cache, country, date, data_path=data_path, store_path=store_path):
+    # load_curve through a curve cache (hpfc.cache), dropped when the file changes ; empty if there is no file
+    # the key is the same for the app and the query service, so that they share the entries of a common cache
+    file_path = data_path + HPFC_file_name(country, date)
+    signature = file_signature(file_path)
+    if signature is None:
+        return pd.DataFrame()
+    return cache.get_or_compute( ("HPFC", country, date, file_path, signature),
+                                 lambda: load_curve(country, date, data_path, store_path), source_paths=[file_path] )
+
+def curve_name(country, date):
+    # name of the curve of one HPFC file in a selection, e.g. "HPFC CH 20230417"
+    return "HPFC " + country + " " + date
+
+def selection_key(names, datasets, source_paths=()):
+    # cheap identifier of loaded datasets : name, columns (the curves with their vintage dates), length, first and
+    # last dates of each of them, and the mtime and size of the source files, so that a file delivered again with
+    # the same length gives another key
+    key = []
+    for name, df in zip(names, datasets):
+        if len(df)>0:
+            key.append( (name, tuple(df.columns), len(df), df["Datum"].iloc[0].value, df["Datum"].iloc[-1].value) )
+        else:
+            key.append( (name, 0) )
+    return tuple(key), tuple(file_signature(path) for path in source_paths)
+
+# the derived data of a selection through a curve cache, under the keys shared by the app and the precompute
+# scheduler (hpfc.precompute), so that what the scheduler computes in advance is what the app looks up
+
+def cached_merge(cache, datasets, key, source_paths=()):
+    return cache.get_or_compute( ("merged", key), lambda: merge_curves(datasets, how="outer"), source_paths=source_paths )
+
+def cached_products(cache, merged_df, key, source_paths=(), definition=default_product_definition):
+    return cache.get_or_compute( ("products", key, definition), lambda: split_products(merged_df, definition), source_paths=source_paths )
+
+def cached_pyramid(cache, df, key, source_paths=()):
+    return cache.get_or_compute( ("pyramid", key), lambda: AggregatePyramid(df), source_paths=source_paths )
+
+def cached_statistics(cache, df, key, source_paths=(), definition=default_product_definition, product="base"):
+    # statistics of the product rows of the curves df (all their rows, not only those of the product, for the
+    # peak - base spread)
+    def build():
+        if len(df) == 0:
+            return WindowStatistics(df)
+        datum = df["Datum"].to_numpy()
+        return WindowStatistics(df, peak_mask(datum, definition), product_mask(datum, product, definition))
+    return cache.get_or_compute( ("statistics", key, definition), build, source_paths=source_paths )
+
+def merge_curves(datasets, how="outer"):
+    # all the curves on one time axis, in a single pass
+    return align_datasets(datasets, how=how)
+
+def load_curves(countries, dates, data_path=data_path, how="inner", store_path=store_path):
+    return merge_curves([load_curve(country, date, data_path, store_path) for country in countries for date in dates], how)
+
+def split_products(merged_df, definition=default_product_definition):
+    # base, peak and off-peak rows of the curves
+    if len(merged_df) == 0:
+        return merged_df, pd.DataFrame(), pd.DataFrame()
+    mask = peak_mask(merged_df["Datum"].to_numpy(), definition)
+    return merged_df, merged_df[mask], merged_df[~mask]
+
+def product_frame(merged_df, product, definition=default_product_definition):
+    base_df, peak_df, off_peak_df = split_products(merged_df, definition)
+    return {"base": base_df, "peak": peak_df, "off-peak": off_peak_df}[product]
+
+def averages(df, granularity_code, start=None, end=None):
+    # period averages of the local calendar, labelled in local time, with a "Datum" column (see AggregatePyramid)
+    return AggregatePyramid(df).averages(granularity_code, start, end)
+
+def key_fields(key):
+    # the parameters of a derived frame as plain tuples, with every field of the product definitions
+    # (the repr of a ProductDefinition leaves out its holidays)
+    if dataclasses.is_dataclass(key):
+        return (type(key).__name__,) + dataclasses.astuple(key)
+    if isinstance(key, (tuple, list)):
+        return tuple(key_fields(item) for item in key)
+    return key
+
+def derived_file_path(kind, key, source_paths, store_path=store_path):
+    signatures = [(os.path.abspath(path), file_signature(path)) for path in source_paths]
+    digest = hashlib.sha1(repr((kind, key_fields(key), signatures, store_format)).encode()).hexdigest()[:20]
+    return os.path.join(store_path, "derived", kind + "_" + digest + ".parquet")
+
+def remove_old_derived_files(store_path=store_path, max_age=derived_max_age):
+    directory = os.path.join(store_path, "derived")
+    if not os.path.isdir(directory):
+        return
+    now = time.time()
+    for entry in os.scandir(directory):
+        try:
+            if entry.name.endswith(".parquet") and now - entry.stat().st_atime > max_age:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+def shared_frame(kind, key, source_paths, compute, store_path=store_path):
+    # frame computed once for all the processes sharing the store, "Datum" set back as index if it was
+    path = derived_file_path(kind, key, source_paths, store_path)
+    def read():
+        table = pq.read_table(path, memory_map=True)
+        df = table.to_pandas()
+        if (table.schema.metadata or {}).get(b"hpfc_index") == b"Datum":
+            df.index = pd.DatetimeIndex(df["Datum"], name="Datum")
+        return df
+    if os.path.isfile(path):
+        try:
+            return read()
+        except (OSError, pa.ArrowException):
+            pass
+    try:
+        with file_lock(path):
+            # another process may have written it while we were waiting for the lock
+            if os.path.isfile(path):
+                return read()
+            df = compute()
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if df.index.name == "Datum":
+                table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"hpfc_index": b"Datum"})
+            write_table_atomic(table, path)
+    except (OSError, TimeoutError):
+        # the store is not writable : the frame is computed in this process only
+        return compute()
+    remove_old_derived_files(store_path)
+    return df
+
+def product_curves(countries, dates, product, data_path=data_path, definition=default_product_definition, store_path=store_path):
+    # hourly curves of one product, inner join of the files
+    compute = lambda: product_frame(load_curves(countries, dates, data_path, store_path=store_path), product, definition).reset_index(drop=True)
+    return shared_frame("product", (tuple(countries), tuple(dates), product, definition), source_files(countries, dates, data_path), compute, store_path)
+
+def product_averages(countries, dates, product, granularity_code, data_path=data_path, definition=default_product_definition, store_path=store_path):
+    # period averages of one product, e.g. the monthly peak averages of all the files
+    compute = lambda: averages(product_curves(countries, dates, product, data_path, definition, store_path), granularity_code)
+    return shared_frame("averages", (tuple(countries), tuple(dates), product, granularity_code, definition), source_files(countries, dates, data_path), compute, store_path)
+
+def forward_table(country, date, data_path=data_path, definition=default_product_definition, store_path=store_path):
+    # forward product prices of one HPFC file, from the store for the default product definition
+    if definition == default_product_definition:
+        return ForwardTable(load_product_table(data_path + HPFC_file_name(country, date), HPFC_column_name(country, date), store_path))
+    return ForwardTable(compute_product_table(load_curve(country, date, data_path, store_path), definition))
+
+def product_prices(countries, dates, period, load="base", data_path=data_path, definition=default_product_definition, store_path=store_path):
+    # prices of the complete products of a period for every curve, e.g. the monthly base prices :
+    # "Datum" (start of the delivery periods) and one column per curve
+    prices = {HPFC_column_name(country, date): forward_table(country, date, data_path, definition, store_path).period_prices(period, load)
+              for country in countries for date in dates}
+    df = pd.concat(prices, axis=1).rename_axis("Datum")
+    df.insert(loc=0, column="Datum", value=df.index)
+    return df
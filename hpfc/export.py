@@ -0,0 +1,76 @@
+import gzip, tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from hpfc.parser import HPFC_column_name
+from hpfc.timeaxis import local_times
+
+
+# Streaming export of curve data as csv, gzip csv or parquet
+# The data is written chunk by chunk (one csv block or one parquet row group per chunk) to a spooled
+# temporary file, which stays in memory for small exports and goes to disk for large ones, instead of
+# building the whole export as one string ; only the finished file is read back as bytes for the download
+# button (st.download_button takes bytes, not temporary files). The chunks of the full hourly cube are built directly from
+# slices of the memory-mapped cube, so the cube is never materialized as a whole dataframe.
+
+export_formats = {
+    "csv": ("text/csv", ".csv"),
+    "csv.gz": ("application/gzip", ".csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+chunk_rows = 20000
+spool_size = 32 * 2**20
+
+def frame_chunks(df, chunk_rows=chunk_rows):
+    # a dataframe in chunks of rows (views, no copy), an empty dataframe as one empty chunk
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def cube_chunks(cube, keys=None, chunk_rows=chunk_rows):
+    # the hourly curves of the cube (all of them by default) in chunks of rows : "Datum" (local time), "UTC" and
+    # one column per curve ; the repeated hour of the autumn switch has two rows with the same "Datum"
+    keys = [key for key in (keys if keys is not None else sorted(cube.index, key=lambda key: cube.index[key])) if key in cube]
+    columns = [HPFC_column_name(country, date) for country, date in keys]
+    positions = [cube.index[key] for key in keys]
+    countries = np.array([c for c, d in positions], dtype="int64")
+    dates = np.array([d for c, d in positions], dtype="int64")
+    local = local_times(cube.datum)
+    for start in range(0, len(cube.datum), chunk_rows):
+        stop = min(start + chunk_rows, len(cube.datum))
+        values = cube.values[countries, dates, start:stop]
+        chunk = pd.DataFrame(values.T, columns=columns, copy=False)
+        chunk.insert(loc=0, column="Datum", value=local[start:stop])
+        chunk.insert(loc=1, column="UTC", value=cube.datum[start:stop])
+        yield chunk
+
+def write_export(chunks, export_format, out):
+    # write the chunks to the binary file out
+    if export_format == "parquet":
+        writer = None
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema)
+            writer.write_table(table)
+        if writer is not None:
+            writer.close()
+    elif export_format in ("csv", "csv.gz"):
+        stream = gzip.GzipFile(fileobj=out, mode="wb") if export_format == "csv.gz" else out
+        header = True
+        for chunk in chunks:
+            stream.write(chunk.to_csv(index=False, header=header).encode("utf-8"))
+            header = False
+        if stream is not out:
+            stream.close()
+    else:
+        raise ValueError("unknown export format " + repr(export_format))
+
+def export_file(chunks, export_format):
+    # the content of the export as bytes, ready to be given to st.download_button
+    with tempfile.SpooledTemporaryFile(max_size=spool_size) as out:
+        write_export(chunks, export_format, out)
+        out.seek(0)
+        return out.read()
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+from hpfc.products import default_product_definition, peak_mask
+from hpfc.timeaxis import local_times, utc_times
+
+
+# Forward product prices of an HPFC curve
+# The settlement average of every delivery period of a curve (days, weeks, months, quarters and calendar years of
+# the local calendar) for the base and peak loads, computed in one pass over the curve when its file is ingested
+# in the store (see hpfc.store.load_product_table) and kept next to the parquet copy of the curve.
+# A product of a vintage is then a dict lookup instead of a rescan of the hourly curve :
+#   table.price("Cal-25", "peak"), table.price(("M", "2023-05-01")), table.day_prices(tomorrow)
+# A period is complete when the curve has a value for each of its hours (23 or 25 hours on the DST switch days).
+
+product_periods = ["D", "W", "M", "Q", "Y"]
+product_loads = ["base", "peak"]
+table_columns = ["product", "period", "start", "end", "base", "peak", "hours", "peak hours", "complete"]
+
+def product_labels(period, starts):
+    # usual names of the products : 18.04.2023, W16-23 (ISO week), May-23, Q3-23, Cal-25
+    starts = pd.DatetimeIndex(starts)
+    if period == "D":
+        return list(starts.strftime("%d.%m.%Y"))
+    if period == "W":
+        weeks = starts.isocalendar()
+        return ["W%02d-%02d" % (week, year % 100) for week, year in zip(weeks["week"], weeks["year"])]
+    if period == "M":
+        return list(starts.strftime("%b-%y"))
+    if period == "Q":
+        return ["Q%d-%02d" % (quarter, year % 100) for quarter, year in zip(starts.quarter, starts.year)]
+    if period == "Y":
+        return ["Cal-%02d" % (year % 100) for year in starts.year]
+    raise ValueError("unknown delivery period " + repr(period))
+
+def compute_product_table(df, definition=default_product_definition):
+    # df : "Datum" (UTC) and the values of one curve ; one row per delivery period, in the order of product_periods
+    if len(df) == 0:
+        return pd.DataFrame({column: [] for column in table_columns})
+    datum = df["Datum"].to_numpy()
+    values = df.iloc[:, 1].to_numpy(dtype="float64")
+    finite = ~np.isnan(values)
+    peak = peak_mask(datum, definition) & finite
+    steps = np.diff(datum)
+    steps = steps[steps > np.timedelta64(0)]
+    step = steps.min() if len(steps) > 0 else np.timedelta64(1, "h")
+    local = pd.DatetimeIndex(local_times(datum))
+    tables = []
+    for period in product_periods:
+        # the rows of a period are contiguous : the sums are reduced between the first rows of the periods
+        periods = local.to_period(period)
+        ids = periods.asi8
+        firsts = np.concatenate([[0], np.flatnonzero(np.diff(ids)) + 1])
+        starts = periods[firsts].start_time
+        ends = (periods[firsts] + 1).start_time
+        counts = np.add.reduceat(finite, firsts)
+        peak_counts = np.add.reduceat(peak, firsts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            base_prices = np.where(counts > 0, np.add.reduceat(np.where(finite, values, 0.0), firsts) / counts, np.nan)
+            peak_prices = np.where(peak_counts > 0, np.add.reduceat(np.where(peak, values, 0.0), firsts) / peak_counts, np.nan)
+        period_steps = (utc_times(ends) - utc_times(starts)) // step
+        tables.append(pd.DataFrame({"product": product_labels(period, starts), "period": period,
+                                    "start": starts.to_numpy(), "end": ends.to_numpy(),
+                                    "base": base_prices, "peak": peak_prices,
+                                    "hours": counts * (step / np.timedelta64(1, "h")),
+                                    "peak hours": peak_counts * (step / np.timedelta64(1, "h")),
+                                    "complete": counts == period_steps}))
+    return pd.concat(tables, ignore_index=True)
+
+class ForwardTable:
+
+    def __init__(self, table):
+        # table : the frame of compute_product_table
+        self.table = table
+        self.prices = {load: table[load].to_numpy(dtype="float64") for load in product_loads}
+        self.positions = {label: i for i, label in enumerate(table["product"])}
+        starts = table["start"].to_numpy(dtype="datetime64[ns]").astype("int64")
+        self.positions.update({(period, start): i for i, (period, start) in enumerate(zip(table["period"], starts))})
+
+    def position(self, product):
+        # product : its name ("Cal-25", "Q3-23", "May-23", "W16-23", "18.04.2023") or (period, start of the period)
+        key = (product[0], pd.Timestamp(product[1]).value) if isinstance(product, tuple) else product
+        if key not in self.positions:
+            raise KeyError("no product " + repr(product) + " in the curve")
+        return self.positions[key]
+
+    def price(self, product, load="base"):
+        # settlement average of a product, NaN if the curve has no value in its period
+        return self.prices[load][self.position(product)]
+
+    def day_prices(self, day):
+        # base and peak prices of a delivery day, e.g. the day-ahead of the vintage
+        i = self.position(("D", pd.Timestamp(day).normalize()))
+        return pd.DataFrame({"Base": [self.prices["base"][i]], "Peak": [self.prices["peak"][i]]})
+
+    def period_prices(self, period, load="base", complete=True):
+        # prices of all the products of a period ("M" : the months), indexed by the start of the periods
+        rows = self.table[(self.table["period"] == period) & (self.table["complete"] | (not complete))]
+        return pd.Series(rows[load].to_numpy(dtype="float64"), index=pd.DatetimeIndex(rows["start"], name="Datum"))
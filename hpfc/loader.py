@@ -0,0 +1,101 @@
+import logging, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+import pandas as pd
+
+from hpfc.metrics import current_recorder, recording, stage, count_rows
+
+
+# Concurrent loading of the datasets of a selection
+# The HTTP requests (SiloVeda) and the file reads (filer / curve store) of a selection run in two thread pools
+# instead of one after the other. Each task has its own timeout, counted from the moment it starts running (a task
+# still waiting for a worker after the timeout is given up as well), so that a slow file does not use up the time
+# of the others ; a task that fails or times out is reported and replaced by an empty dataframe, so that the
+# other datasets are still displayed.
+# The results keep the order of the tasks, so they can be given to merge_datasets as before.
+# requests is only imported when the first HTTP session is created, i.e. when spot prices are selected.
+
+logger = logging.getLogger(__name__)
+
+http_workers = 4
+file_workers = 8
+
+session_lock = Lock()
+session = None
+
+def http_session():
+    # one requests.Session per process, with a connection pool large enough for the HTTP thread pool
+    global session
+    with session_lock:
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=http_workers, pool_maxsize=http_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+def run_task(task, recorder, starts, i):
+    # one task in a worker thread, recorded as a stage of the rerun that started it
+    starts[i] = time.monotonic()
+    with recording(recorder):
+        with stage("load " + task.name) as s:
+            result = task.function(*task.args)
+            s.rows_out = count_rows(result)
+    return result
+
+class LoadTask:
+
+    def __init__(self, name, function, *args, kind="file"):
+        # kind is "http" or "file" and decides the thread pool of the task
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kind = kind
+
+def load_concurrently(tasks, timeout=60, initializer=None):
+    # run the tasks, return the dataframes (in the order of the tasks) and the failures as (name, message)
+    # initializer is run in each worker thread before its first task (e.g. to attach the streamlit context)
+    results = [pd.DataFrame() for _ in tasks]
+    failures = []
+    if len(tasks) == 0:
+        return results, failures
+    start = time.perf_counter()
+    recorder = current_recorder()
+    http_pool = ThreadPoolExecutor(max_workers=http_workers, thread_name_prefix="hpfc-http", initializer=initializer)
+    file_pool = ThreadPoolExecutor(max_workers=file_workers, thread_name_prefix="hpfc-file", initializer=initializer)
+    try:
+        futures = {}
+        # start time of each task, set by its worker thread
+        starts = [None] * len(tasks)
+        submitted = time.monotonic()
+        for i, task in enumerate(tasks):
+            pool = http_pool if task.kind == "http" else file_pool
+            futures[pool.submit(run_task, task, recorder, starts, i)] = i
+        pending = set(futures)
+        while len(pending) > 0:
+            # wait until a task ends or the earliest deadline of the running and waiting tasks
+            deadline = min((starts[futures[future]] or submitted) + timeout for future in pending)
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as error:
+                    logger.warning("loading %s failed: %r", tasks[i].name, error)
+                    failures.append((tasks[i].name, repr(error)))
+            now = time.monotonic()
+            for future in [future for future in pending if not future.done() and (starts[futures[future]] or submitted) + timeout <= now]:
+                i = futures[future]
+                future.cancel()
+                pending.discard(future)
+                logger.warning("loading %s timed out after %ss", tasks[i].name, timeout)
+                failures.append((tasks[i].name, "timed out after " + str(timeout) + "s"))
+    finally:
+        # the pools are not waited for : a task that timed out must not block the page
+        http_pool.shutdown(wait=False, cancel_futures=True)
+        file_pool.shutdown(wait=False, cancel_futures=True)
+    logger.info("%d dataset(s) loaded in %.2fs, %d failure(s)", len(tasks) - len(failures), time.perf_counter() - start, len(failures))
+    failures.sort(key=lambda failure: [task.name for task in tasks].index(failure[0]))
+    return results, failures
@@ -0,0 +1,204 @@
+import functools, json, logging, os, sys, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pandas as pd
+
+
+# Timing instrumentation of the stages of a rerun
+# A stage (context manager or decorator) records its wall time, the rows it got and returned, the change of
+# the memory of the process and the hits and misses of the curve cache that happened inside it.
+# The records of a rerun are collected by the recorder of the thread (see recording, the loader passes it
+# to its worker threads), each record is logged as one json line on the "hpfc.metrics" logger, and the
+# totals per stage are kept for the Prometheus text format (metrics_text, serve_metrics).
+# The memory is the resident memory of the whole process : with concurrent stages the deltas overlap.
+
+logger = logging.getLogger("hpfc.metrics")
+
+local = threading.local()
+totals_lock = threading.Lock()
+totals = {}
+
+def resident_memory():
+    # resident memory of the process in bytes, None if it is not available
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD), ("PeakWorkingSetSize", ctypes.c_size_t),
+                        ("WorkingSetSize", ctypes.c_size_t), ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPagedPoolUsage", ctypes.c_size_t), ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t), ("PagefileUsage", ctypes.c_size_t),
+                        ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    return None
+
+def count_rows(value):
+    # rows of a dataframe, an array or a list / tuple of them, None for anything else
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        counts = [count_rows(item) for item in value]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if len(counts) > 0 else None
+    return None
+
+class StageRecorder:
+
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def frame(self):
+        # one row per stage, in the order the stages finished
+        with self.lock:
+            return pd.DataFrame(self.records, columns=["stage", "seconds", "rows_in", "rows_out", "memory_delta", "cache_hits", "cache_misses", "thread"])
+
+def current_recorder():
+    return getattr(local, "recorder", None)
+
+def start_recording():
+    # new recorder for the stages of the thread, e.g. at the top of each rerun of a script
+    local.recorder = StageRecorder()
+    return local.recorder
+
+class recording:
+    # context manager : the stages of the thread go to recorder, e.g. in a worker thread of the loader
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def __enter__(self):
+        self.previous = current_recorder()
+        local.recorder = self.recorder
+        return self.recorder
+
+    def __exit__(self, *exc):
+        local.recorder = self.previous
+
+def note_cache(hit):
+    # called by the curve cache : the hit or miss is counted in the innermost stage of the thread
+    stack = getattr(local, "stages", None)
+    if stack:
+        if hit:
+            stack[-1].cache_hits += 1
+        else:
+            stack[-1].cache_misses += 1
+
+class stage:
+    # context manager recording one stage : with stage("merge", rows_in=n) as s: ... s.rows_out = len(df)
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __enter__(self):
+        if not hasattr(local, "stages"):
+            local.stages = []
+        local.stages.append(self)
+        self.memory = resident_memory()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        memory = resident_memory()
+        local.stages.pop()
+        memory_delta = memory - self.memory if memory is not None and self.memory is not None else None
+        record = (self.name, seconds, self.rows_in, self.rows_out, memory_delta, self.cache_hits, self.cache_misses, threading.current_thread().name)
+        recorder = current_recorder()
+        if recorder is not None:
+            recorder.add(record)
+        with totals_lock:
+            total = totals.setdefault(self.name, {"count": 0, "seconds": 0.0, "rows_out": 0, "cache_hits": 0, "cache_misses": 0})
+            total["count"] += 1
+            total["seconds"] += seconds
+            total["rows_out"] += self.rows_out or 0
+            total["cache_hits"] += self.cache_hits
+            total["cache_misses"] += self.cache_misses
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"stage": self.name, "seconds": round(seconds, 6), "rows_in": self.rows_in, "rows_out": self.rows_out,
+                                    "memory_delta": memory_delta, "cache_hits": self.cache_hits, "cache_misses": self.cache_misses,
+                                    "thread": record[-1], "failed": exc[0] is not None}))
+
+def instrument(name):
+    # decorator : the call is a stage, the rows are counted on the dataframe arguments and on the result
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name, rows_in=count_rows(list(args) + list(kwargs.values()))) as s:
+                result = function(*args, **kwargs)
+                s.rows_out = count_rows(result)
+            return result
+        return wrapper
+    return decorator
+
+def label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def metrics_text(gauges=None):
+    # totals per stage in the Prometheus text format, plus optional gauges {name: value} (e.g. the curve cache stats)
+    with totals_lock:
+        stages = {name: dict(total) for name, total in totals.items()}
+    lines = ["# TYPE hpfc_stage_seconds summary"]
+    for name, total in sorted(stages.items()):
+        lines.append('hpfc_stage_seconds_sum{stage="' + label(name) + '"} ' + repr(total["seconds"]))
+        lines.append('hpfc_stage_seconds_count{stage="' + label(name) + '"} ' + str(total["count"]))
+    lines.append("# TYPE hpfc_stage_rows_total counter")
+    for name, total in sorted(stages.items()):
+        lines.append('hpfc_stage_rows_total{stage="' + label(name) + '"} ' + str(total["rows_out"]))
+    lines.append("# TYPE hpfc_stage_cache_total counter")
+    for name, total in sorted(stages.items()):
+        lines.append('hpfc_stage_cache_total{stage="' + label(name) + '",result="hit"} ' + str(total["cache_hits"]))
+        lines.append('hpfc_stage_cache_total{stage="' + label(name) + '",result="miss"} ' + str(total["cache_misses"]))
+    for name, value in sorted((gauges or {}).items()):
+        lines.append("# TYPE hpfc_" + name + " gauge")
+        lines.append("hpfc_" + name + " " + repr(value))
+    memory = resident_memory()
+    if memory is not None:
+        lines.append("# TYPE hpfc_resident_memory_bytes gauge")
+        lines.append("hpfc_resident_memory_bytes " + str(memory))
+    return "\n".join(lines) + "\n"
+
+def serve_metrics(port, host="127.0.0.1", gauges=None):
+    # Prometheus text endpoint on http://host:port/metrics, in a daemon thread ; gauges is a function returning {name: value}
+    # the loopback interface only by default ; None (logged) if the port cannot be opened, e.g. already in use
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics_text(gauges() if gauges is not None else None).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, format, *args):
+            pass
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.warning("metrics endpoint on %s:%s not started: %s", host, port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="hpfc-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from hpfc.timeaxis import utc_from_wall_clock
+
+
+# Parser for the HPFC files of the filer
+# The files are written in a wide layout, one line per day and one column per hour (or per quarter hour) :
+#   DWH_REFERENZPREISE_<CC>;0;1;...;23            DWH_REFERENZPREISE_<CC>;0;1;...;95
+#   01.01.2023;12.06;-0.1;...;35                  01.01.2023;12.06;11.80;...;34.20
+# The days and hours of the files are local wall-clock times. The parser returns a long dataframe with the
+# columns "Datum" (UTC instants, see hpfc.timeaxis) and <name>, one row per time step in chronological order :
+# the spring switch day has 23 hours and the autumn switch day 25 (the repeated hour keeps the value of the file).
+# Only the day labels are parsed as dates (once per day), the wall-clock times are built arithmetically
+# by adding the offsets of the columns to the days. The time step is derived from the number of
+# columns : 24 columns are hours, 96 columns are quarter hours.
+
+def read_HPFC_file(file_path):
+    # read the semicolon file, return the days (datetime64[ns]), the offsets of the columns
+    # (timedelta64[ns]) and the prices as a 2D float array of shape (days, columns)
+    df = pd.read_csv(file_path, sep=";", index_col=0)
+    days = pd.to_datetime(df.index, format="%d.%m.%Y").values
+    offsets = np.arange(len(df.columns), dtype="int64") * day_step(len(df.columns))
+    values = df.to_numpy(dtype="float64")
+    return days, offsets, values
+
+def day_step(n_columns):
+    # time step of a file with n_columns values per day (24 : one hour, 96 : 15 minutes)
+    if n_columns == 0 or (24 * 60) % n_columns != 0:
+        raise ValueError("unexpected number of values per day : " + str(n_columns))
+    return np.timedelta64(24 * 3600 * 10**9 // n_columns, "ns")
+
+def hourly_index(days, offsets):
+    # every (day, time step) wall-clock time, day-major, i.e. in the order of values.ravel()
+    return (days[:, None] + offsets[None, :]).ravel()
+
+def parse_HPFC_file(file_path, name):
+    days, offsets, values = read_HPFC_file(file_path)
+    datum, positions = utc_from_wall_clock(hourly_index(days, offsets))
+    df = pd.DataFrame({"Datum": datum, name: values.ravel()[positions]})
+    return df
+
+def HPFC_column_name(country, date):
+    return "HPFC" + "_" + country + "_" + date
+
+def HPFC_file_name(country, date):
+    # need date as 8-characters string : yyyymmdd
+    return "HPFC_" + country + "_" + date + ".csv"
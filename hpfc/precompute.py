@@ -0,0 +1,201 @@
+import argparse, logging, os, queue, threading, time
+
+from hpfc import engine
+from hpfc.catalog import HPFCCatalog
+from hpfc.cube import open_cube
+from hpfc.metrics import stage
+from hpfc.parser import HPFC_file_name
+from hpfc.products import default_product_definition, peak_mask
+from hpfc.store import store_path
+
+
+# Background precomputation of the HPFC files
+# The scheduler listens to the catalog of data_path (hpfc.catalog) and, for every new or modified HPFC file,
+# does in advance what the first request for it would have done :
+#   - the parsed curve in the parquet store, with its forward product table (hpfc.store, hpfc.forward)
+#   - the calendar peak mask of its time axis (hpfc.products)
+#   - the cube of all the files, rebuilt once per batch of new files (hpfc.cube)
+#   - with the curve cache of the app : the curve, its products, aggregate pyramids and statistics kernels, under
+#     the keys the app looks up when the newest vintage of a country is selected alone (engine.cached_*)
+# The tasks go through a bounded queue, a file already waiting is not queued twice and a file that does not fit is
+# left out (the next change of the file queues it again) ; at most `workers` tasks run at the same time.
+# In the app process (HPFC_PRECOMPUTE, see interactive_app1) it shares the curve cache of the app, as a separate
+# process it warms the parquet store (curves and forward product tables) and the cube shared with the apps :
+#   python -m hpfc.precompute --data-path small_HPFC_data/ --workers 2
+
+logger = logging.getLogger(__name__)
+
+precompute_workers = 2
+precompute_queue_size = 64
+# only the latest vintages of each country are precomputed at start, every new file afterwards
+initial_vintages = 5
+products = ["base", "peak", "off-peak"]
+# countries of the apps, in their order : the cube is keyed on it
+app_countries = ["CH", "DE", "FR", "AT"]
+
+class PrecomputeScheduler:
+
+    def __init__(self, data_path=engine.data_path, countries=None, cache=None, store_path=store_path,
+                 workers=precompute_workers, queue_size=precompute_queue_size, definition=default_product_definition):
+        self.data_path = data_path
+        self.catalog = None
+        self.countries = countries
+        self.cache = cache
+        self.store_path = store_path
+        self.workers = workers
+        self.definition = definition
+        self.tasks = queue.Queue(maxsize=queue_size)
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.stopping = threading.Event()
+        self.counts = {"queued": 0, "done": 0, "failed": 0, "dropped": 0}
+
+    def attach(self, catalog, initial=initial_vintages):
+        # precompute the latest vintages already in the catalog, then every file the catalog reports
+        self.catalog = catalog
+        catalog.add_listener(self.submit_entries)
+        for country in self.selected_countries():
+            for date in catalog.latest(country, initial)[::-1]:
+                self.submit(("curve", country, date))
+        return self
+
+    def selected_countries(self):
+        return self.countries if self.countries is not None else self.catalog.countries()
+
+    def submit_entries(self, entries):
+        # catalog listener : the new or modified HPFC files of the countries, the cube once after them
+        keys = [("curve", entry.country, entry.date) for entry in entries
+                if entry.kind == "HPFC" and entry.country in self.selected_countries()]
+        for key in keys:
+            self.submit(key)
+        if len(keys) > 0:
+            self.submit(("cube",))
+
+    def submit(self, key):
+        # queue a task unless it is already waiting, return False if the queue is full
+        with self.lock:
+            if key in self.pending:
+                return True
+            try:
+                self.tasks.put_nowait(key)
+            except queue.Full:
+                self.counts["dropped"] += 1
+                logger.warning("precompute queue full, %r left out", key)
+                return False
+            self.pending.add(key)
+            self.counts["queued"] += 1
+        return True
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name="hpfc-precompute-" + str(i), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def join(self):
+        # wait until every queued task is done
+        self.tasks.join()
+
+    def work(self):
+        while not self.stopping.is_set():
+            try:
+                key = self.tasks.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            # a change of the file while its task runs queues it again
+            with self.lock:
+                self.pending.discard(key)
+            try:
+                with stage("precompute " + key[0]):
+                    if key[0] == "curve":
+                        self.precompute_curve(*key[1:])
+                    else:
+                        self.precompute_cube()
+                self.count("done")
+            except Exception:
+                self.count("failed")
+                logger.exception("precompute of %r failed", key)
+            finally:
+                self.tasks.task_done()
+
+    def precompute_curve(self, country, date):
+        file_path = self.data_path + HPFC_file_name(country, date)
+        if not os.path.isfile(file_path):
+            return
+        df = engine.load_curve(country, date, self.data_path, self.store_path)
+        engine.forward_table(country, date, self.data_path, self.definition, self.store_path)
+        peak_mask(df["Datum"].to_numpy(), self.definition)
+        if self.cache is not None and date in self.catalog.latest(country):
+            self.precompute_selection(country, date)
+
+    def precompute_selection(self, country, date):
+        # what the app computes when the vintage is selected alone for its country
+        files = [self.data_path + HPFC_file_name(country, date)]
+        datasets = [engine.cached_curve(self.cache, country, date, self.data_path, self.store_path)]
+        key = engine.selection_key([engine.curve_name(country, date)], datasets, files)
+        merged_df = engine.cached_merge(self.cache, datasets, key, files)
+        for product, df in zip(products, engine.cached_products(self.cache, merged_df, key, files, self.definition)):
+            engine.cached_pyramid(self.cache, df, (key, product), files)
+            engine.cached_statistics(self.cache, merged_df, (key, product), files, self.definition, product)
+
+    def precompute_cube(self):
+        # the cube of all the vintages of the countries, as the apps open it
+        countries = self.selected_countries()
+        dates = sorted({date for country in countries for date in self.catalog.vintages(country)})
+        if len(dates) > 0:
+            open_cube(self.data_path, countries, dates, self.store_path)
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def stats(self):
+        with self.lock:
+            return {**self.counts, "waiting": self.tasks.qsize()}
+
+def start_precompute(catalog, countries=None, cache=None, store_path=store_path, workers=precompute_workers, queue_size=precompute_queue_size):
+    # scheduler of the files of a catalog, started in background threads
+    scheduler = PrecomputeScheduler(catalog.data_path, countries, cache, store_path, workers, queue_size)
+    scheduler.attach(catalog)
+    scheduler.submit(("cube",))
+    return scheduler.start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Background precomputation of the HPFC files of a directory")
+    parser.add_argument("--data-path", default=engine.data_path)
+    parser.add_argument("--store-path", default=store_path)
+    parser.add_argument("--country", action="append", help="countries to precompute, those of the apps by default")
+    parser.add_argument("--workers", type=int, default=precompute_workers)
+    parser.add_argument("--queue-size", type=int, default=precompute_queue_size)
+    parser.add_argument("--polling", action="store_true", help="poll the directory (network shares without change notifications)")
+    parser.add_argument("--once", action="store_true", help="precompute the files present and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    catalog = HPFCCatalog(os.path.join(args.data_path, "")).scan()
+    scheduler = start_precompute(catalog, args.country or app_countries, None, args.store_path, args.workers, args.queue_size)
+    if not args.once:
+        catalog.start_watching(polling=args.polling)
+    print("precomputing the HPFC files of " + catalog.data_path + " with " + str(args.workers) + " workers")
+    try:
+        while True:
+            scheduler.join()
+            if args.once:
+                break
+            logger.info("precompute %s", scheduler.stats())
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    scheduler.stop()
+    print("precompute " + str(scheduler.stats()))
+
+if __name__ == "__main__":
+    main()
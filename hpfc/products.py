@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from threading import Lock
+import numpy as np
+
+from hpfc.timeaxis import axis_key, local_times
+
+
+# Base / peak / off-peak split of the curves
+# The split is a boolean calendar mask over the time index (local weekday and time of day of the UTC
+# instants), computed once per time index and per product definition. The masks are cached at module level, so they are reused
+# by every column and every session, and are read-only.
+
+@dataclass(frozen=True)
+class ProductDefinition:
+    # peak hours : the peak week days, from peak_start to peak_end (excluded), in minutes after midnight
+    # holidays are off-peak all day long ; off-peak is everything that is not peak
+    peak_start: int = 8 * 60
+    peak_end: int = 20 * 60
+    peak_weekdays: tuple = (0, 1, 2, 3, 4)  # Monday is 0
+    holidays: tuple = field(default=(), repr=False)  # dates as "YYYY-MM-DD" strings or datetime.date
+
+default_product_definition = ProductDefinition()
+
+masks_cache = OrderedDict()
+masks_cache_size = 64
+masks_cache_lock = Lock()
+
+def calendar_fields(datum):
+    # local day, weekday (Monday=0) and minute of the day of every UTC instant, without any string conversion
+    datum = local_times(datum)
+    days = datum.astype("datetime64[D]")
+    minutes = ((datum - days) // np.timedelta64(1, "m")).astype("int64")
+    weekdays = (days.astype("int64") + 3) % 7  # 1970-01-01 was a Thursday
+    return days, weekdays, minutes
+
+def compute_peak_mask(datum, definition):
+    days, weekdays, minutes = calendar_fields(datum)
+    mask = np.isin(weekdays, definition.peak_weekdays) & (minutes >= definition.peak_start) & (minutes < definition.peak_end)
+    if len(definition.holidays) > 0:
+        mask &= ~np.isin(days, np.array([str(holiday) for holiday in definition.holidays], dtype="datetime64[D]"))
+    return mask
+
+def peak_mask(datum, definition=default_product_definition):
+    # cached read-only peak mask of a time index
+    key = (axis_key(datum), definition)
+    with masks_cache_lock:
+        if key in masks_cache:
+            masks_cache.move_to_end(key)
+            return masks_cache[key]
+    mask = compute_peak_mask(datum, definition)
+    mask.setflags(write=False)
+    with masks_cache_lock:
+        masks_cache[key] = mask
+        while len(masks_cache) > masks_cache_size:
+            masks_cache.popitem(last=False)
+    return mask
+
+def product_mask(datum, product, definition=default_product_definition):
+    # mask of the hours belonging to a product ("base", "peak" or "off-peak")
+    if product == "base":
+        return np.ones(len(datum), dtype=bool)
+    if product == "peak":
+        return peak_mask(datum, definition)
+    if product == "off-peak":
+        return ~peak_mask(datum, definition)
+    raise ValueError("unknown product " + repr(product))
+
+def easter_sunday(year):
+    # anonymous Gregorian algorithm
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    month = (h + l - 7 * m + 90) // 25
+    day = (h + l - 7 * m + 33 * month + 19) % 32
+    return date(year, month, day)
+
+def german_public_holidays(years):
+    # nationwide public holidays of Germany, e.g. ProductDefinition(holidays=german_public_holidays(range(2023, 2027)))
+    holidays = []
+    for year in years:
+        easter = easter_sunday(year)
+        holidays += [date(year, 1, 1), easter - timedelta(days=2), easter + timedelta(days=1),
+                     date(year, 5, 1), easter + timedelta(days=39), easter + timedelta(days=50),
+                     date(year, 10, 3), date(year, 12, 25), date(year, 12, 26)]
+    return tuple(sorted(holidays))
@@ -0,0 +1,259 @@
+import argparse, asyncio, io, json, logging, os, re, threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pyarrow as pa
+import tornado.ioloop
+import tornado.web
+
+from hpfc import engine
+from hpfc.aggregates import AggregatePyramid, granularity_codes
+from hpfc.cache import CurveCache, file_signature
+from hpfc.cube import available_HPFC_dates
+from hpfc.export import frame_chunks
+from hpfc.metrics import stage, metrics_text
+from hpfc.parser import HPFC_file_name
+from hpfc.products import default_product_definition
+from hpfc.store import store_path
+from hpfc.timeaxis import local_timezone
+
+
+# Headless query service of the curves, next to the streamlit apps
+# A tornado server answering the curves, their base / peak / off-peak split, their period averages and the forward
+# product prices, as Arrow IPC streams or json, for scripts and tools that need the data without the app :
+#   python -m hpfc.service --port 8502
+#   GET /curves?country=CH&vintage=20230414&vintage=20230417&product=peak&granularity=D&start=2023-05-01&end=2023-06-01&format=json
+#   GET /products?country=CH&vintage=20230414&period=Y     (the forward product table of hpfc.forward)
+#   GET /vintages?country=CH&country=DE                    GET /metrics (Prometheus text)
+# The data comes from the engine of the apps through a curve cache (hpfc.cache) : started from interactive_app1
+# (HPFC_SERVICE_PORT) it uses the cache of the app, and from the command line it shares the parquet store with it.
+# The computations run in a thread pool, so that the event loop keeps serving the other clients, and the responses
+# are streamed in chunks of rows. start and end are local times (or instants with a UTC offset), the windows exclude
+# their bounds like the app.
+
+logger = logging.getLogger(__name__)
+
+service_threads = 4
+country_pattern = re.compile(r"^[A-Z]{2}$")
+vintage_pattern = re.compile(r"^\d{8}$")
+response_formats = {"arrow": "application/vnd.apache.arrow.stream", "json": "application/json"}
+
+class CurveService:
+
+    def __init__(self, cache=None, data_path=engine.data_path, store_path=store_path, definition=default_product_definition):
+        self.cache = cache if cache is not None else CurveCache()
+        self.data_path = os.path.join(data_path, "")
+        self.store_path = store_path
+        self.definition = definition
+        self.executor = ThreadPoolExecutor(max_workers=service_threads, thread_name_prefix="hpfc-service")
+
+    def source_files(self, keys):
+        return [self.data_path + HPFC_file_name(country, vintage) for country, vintage in keys]
+
+    def curves(self, keys, product, granularity_code, start=None, end=None):
+        # "Datum" (local period labels) and one column per curve ; the finest granularity of the curves by default
+        files = self.source_files(keys)
+        missing = [path for path in files if file_signature(path) is None]
+        if len(missing) > 0:
+            raise tornado.web.HTTPError(404, reason="no HPFC file " + ", ".join(path[len(self.data_path):] for path in missing))
+        signatures = tuple(file_signature(path) for path in files)
+        def build():
+            datasets = [engine.cached_curve(self.cache, country, vintage, self.data_path, self.store_path) for country, vintage in keys]
+            return AggregatePyramid(engine.product_frame(engine.merge_curves(datasets, how="outer"), product, self.definition))
+        pyramid = self.cache.get_or_compute( ("service pyramid", tuple(keys), signatures, product, self.definition), build, source_paths=files )
+        if granularity_code is None:
+            granularity_code = granularity_codes[0]
+        return pyramid.averages(granularity_code, start, end).reset_index(drop=True)
+
+    def products(self, keys, periods=(), names=()):
+        # forward product tables of the curves, one row per product and curve
+        tables = []
+        for country, vintage in keys:
+            file_path = self.data_path + HPFC_file_name(country, vintage)
+            signature = file_signature(file_path)
+            if signature is None:
+                raise tornado.web.HTTPError(404, reason="no HPFC file " + HPFC_file_name(country, vintage))
+            forward = self.cache.get_or_compute( ("forward", country, vintage, file_path, signature),
+                                                 lambda: engine.forward_table(country, vintage, self.data_path, self.definition, self.store_path),
+                                                 source_paths=[file_path] )
+            table = forward.table
+            if len(periods) > 0:
+                table = table[table["period"].isin(periods)]
+            if len(names) > 0:
+                table = table[table["product"].isin(names)]
+            tables.append(table.assign(country=country, vintage=vintage))
+        return pd.concat(tables, ignore_index=True)
+
+    def vintages(self, countries):
+        return {country: available_HPFC_dates(self.data_path, [country]) for country in countries}
+
+class ServiceHandler(tornado.web.RequestHandler):
+
+    def initialize(self, service):
+        self.service = service
+
+    def values(self, name, pattern=None, default=None):
+        # repeated and comma-separated values of a query argument
+        values = [value for argument in self.get_arguments(name) for value in argument.split(",") if value != ""]
+        if len(values) == 0 and default is not None:
+            values = default
+        for value in values:
+            if pattern is not None and not pattern.match(value):
+                raise tornado.web.HTTPError(400, reason="invalid " + name + " " + repr(value))
+        return values
+
+    def curve_keys(self):
+        countries = self.values("country", country_pattern)
+        if len(countries) == 0:
+            raise tornado.web.HTTPError(400, reason="country is required")
+        vintages = self.values("vintage", vintage_pattern)
+        keys = []
+        for country in countries:
+            # the latest vintage of the country if none is given
+            country_vintages = vintages if len(vintages) > 0 else available_HPFC_dates(self.service.data_path, [country])[-1:]
+            keys += [(country, vintage) for vintage in country_vintages]
+        if len(keys) == 0:
+            raise tornado.web.HTTPError(404, reason="no HPFC file for " + ", ".join(countries))
+        return keys
+
+    def choice(self, name, options, default):
+        value = self.get_argument(name, default)
+        if value is not None and value not in options:
+            raise tornado.web.HTTPError(400, reason=name + " must be one of " + ", ".join(options))
+        return value
+
+    def date(self, name):
+        value = self.get_argument(name, None)
+        if value is None:
+            return None
+        try:
+            bound = pd.Timestamp(value)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="invalid " + name + " " + repr(value))
+        if bound is pd.NaT:
+            raise tornado.web.HTTPError(400, reason="invalid " + name + " " + repr(value))
+        # a bound with a UTC offset (2023-05-01T00:00Z) is an instant, taken at its local time
+        if bound.tzinfo is not None:
+            bound = bound.tz_convert(local_timezone).tz_localize(None)
+        return bound.to_pydatetime()
+
+    async def run(self, name, function, *args):
+        # computation in the thread pool of the service, recorded as a stage of the metrics
+        def timed():
+            with stage("service " + name) as s:
+                result = function(*args)
+                s.rows_out = len(result) if isinstance(result, pd.DataFrame) else None
+            return result
+        return await tornado.ioloop.IOLoop.current().run_in_executor(self.service.executor, timed)
+
+    async def write_frame(self, df, response_format):
+        # the frame in chunks of rows : an Arrow IPC stream (one record batch per chunk) or json {"columns", "data"}
+        self.set_header("Content-Type", response_formats[response_format])
+        if response_format == "arrow":
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            sink = io.BytesIO()
+            writer = pa.ipc.new_stream(sink, schema)
+            for chunk in frame_chunks(df):
+                writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+                self.write(sink.getvalue())
+                sink.seek(0)
+                sink.truncate()
+                await self.flush()
+            writer.close()
+            self.write(sink.getvalue())
+        else:
+            self.write('{"columns": ' + json.dumps([str(column) for column in df.columns]) + ', "data": [')
+            separator = ""
+            for chunk in frame_chunks(df):
+                rows = chunk.to_json(orient="values", date_format="iso")[1:-1]
+                if rows != "":
+                    self.write(separator + rows)
+                    separator = ","
+                    await self.flush()
+            self.write("]}")
+        self.finish()
+
+    def write_error(self, status_code, **kwargs):
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps({"error": self._reason}))
+
+class CurvesHandler(ServiceHandler):
+
+    async def get(self):
+        keys = self.curve_keys()
+        product = self.choice("product", ["base", "peak", "off-peak"], "base")
+        granularity_code = self.choice("granularity", granularity_codes, None)
+        start, end = self.date("start"), self.date("end")
+        response_format = self.choice("format", list(response_formats), "arrow")
+        df = await self.run("curves", self.service.curves, keys, product, granularity_code, start, end)
+        await self.write_frame(df, response_format)
+
+class ProductsHandler(ServiceHandler):
+
+    async def get(self):
+        keys = self.curve_keys()
+        periods = self.values("period")
+        names = self.values("product")
+        response_format = self.choice("format", list(response_formats), "json")
+        df = await self.run("products", self.service.products, keys, periods, names)
+        await self.write_frame(df, response_format)
+
+class VintagesHandler(ServiceHandler):
+
+    async def get(self):
+        countries = self.values("country", country_pattern)
+        self.finish(await self.run("vintages", self.service.vintages, countries))
+
+class MetricsHandler(ServiceHandler):
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(metrics_text({"curve_cache_" + name: value for name, value in self.service.cache.stats().items()}))
+
+def make_app(service):
+    routes = [(r"/curves", CurvesHandler), (r"/products", ProductsHandler), (r"/vintages", VintagesHandler), (r"/metrics", MetricsHandler)]
+    return tornado.web.Application([(path, handler, {"service": service}) for path, handler in routes])
+
+def start_service(port, host="127.0.0.1", cache=None, data_path=engine.data_path, store_path=store_path):
+    # the service in a daemon thread with its own event loop, e.g. inside the streamlit server with the cache of the app
+    # None (logged) if the port cannot be opened, e.g. already in use, so that the app still runs without the service
+    service = CurveService(cache, data_path, store_path)
+    started = threading.Event()
+    errors = []
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            service.server = make_app(service).listen(port, host)
+        except Exception as e:
+            errors.append(e)
+            loop.close()
+            return
+        finally:
+            started.set()
+        tornado.ioloop.IOLoop.current().start()
+    threading.Thread(target=run, name="hpfc-service", daemon=True).start()
+    started.wait()
+    if len(errors) > 0:
+        logger.warning("query service on %s:%s not started: %s", host, port, errors[0])
+        service.executor.shutdown()
+        return None
+    return service
+
+async def serve(port, host, data_path, store_path, cache_mb):
+    service = CurveService(CurveCache(max_bytes=cache_mb * 2**20), data_path, store_path)
+    make_app(service).listen(port, host)
+    print("HPFC query service on http://" + host + ":" + str(port) + "/ (data " + data_path + ")")
+    await asyncio.Event().wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP query service of the HPFC curves (Arrow IPC or json)")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--data-path", default=engine.data_path)
+    parser.add_argument("--store-path", default=store_path)
+    parser.add_argument("--cache-mb", type=int, default=1024)
+    args = parser.parse_args()
+    asyncio.run(serve(args.port, args.host, args.data_path, args.store_path, args.cache_mb))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import numpy as np
+
+from hpfc.products import default_product_definition, calendar_fields, product_mask
+from hpfc.vintages import period_bounds, period_means
+
+
+# Hourly shape of the curves
+# The shape factor of an hour is its price divided by the average price of its delivery month (on the base or the
+# peak hours), so that curves of different levels (countries, vintages, years) can be compared on their shape only.
+# The profiles are the mean shape factors per weekday and hour of the local calendar (7 x 24), and per calendar
+# month, weekday and hour (12 x 7 x 24). Like hpfc.vintages everything is computed on the aligned curve array, e.g.
+# the whole cube (countries, vintages, hours), in one batched pass for all the curves :
+#   shapes = ShapeProfiles(cube.values, cube.datum, "peak")
+#   shapes.factors[c, d]           hourly shape factors of a curve
+#   shapes.profiles()[c, d]        7 x 24 profile, shapes.profiles(month=0)[c, d] the one of January
+#   shapes.month_profiles[c, d]    12 x 7 x 24 profile tensor
+# The hours of the day are local, on the day of the autumn switch the repeated hour counts twice in its cell.
+
+weekday_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+month_names = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+profile_shape = (12, 7, 24)
+
+def shape_factors(values, datum, reference="base", code="M", definition=default_product_definition):
+    # values : (curves, hours) on the time axis datum ; shape factors (curves, hours), period labels and the
+    # reference averages (curves, periods)
+    values = np.atleast_2d(np.asarray(values, dtype="float64"))
+    labels, means = period_means(values, datum, code, product_mask(datum, reference, definition))
+    labels, bounds = period_bounds(datum, code)
+    period_of_hour = np.repeat(np.arange(len(labels)), np.diff(bounds))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        factors = values / means[:, period_of_hour]
+    return factors, labels, means
+
+def profile_cells(datum):
+    # cell (calendar month, weekday, hour of the day) of every instant, as a flat index of profile_shape
+    days, weekdays, minutes = calendar_fields(datum)
+    months = days.astype("datetime64[M]").astype("int64") % 12  # 1970-01 is month 0
+    return (months * 7 + weekdays) * 24 + minutes // 60
+
+def profile_sums(factors, cells):
+    # sums and counts of the finite factors of every curve per cell : two arrays (curves, cells)
+    # the hours are sorted by cell once, then all the curves are reduced between the first hours of the cells
+    n_cells = int(np.prod(profile_shape))
+    sums = np.zeros((len(factors), n_cells))
+    counts = np.zeros((len(factors), n_cells))
+    if factors.shape[1] == 0:
+        return sums, counts
+    order = np.argsort(cells, kind="stable")
+    sorted_cells = cells[order]
+    firsts = np.concatenate([[0], np.flatnonzero(np.diff(sorted_cells)) + 1])
+    finite = ~np.isnan(factors)
+    sums[:, sorted_cells[firsts]] = np.add.reduceat(np.where(finite, factors, 0.0)[:, order], firsts, axis=1)
+    counts[:, sorted_cells[firsts]] = np.add.reduceat(finite[:, order], firsts, axis=1)
+    return sums, counts
+
+class ShapeProfiles:
+
+    def __init__(self, values, datum, reference="base", code="M", definition=default_product_definition):
+        # values : (..., hours) e.g. the values of the cube (countries, vintages, hours), NaN where there is no data
+        # an empty cube (no vintage or no hour) gives empty factors and NaN profiles
+        leading = values.shape[:-1]
+        flat = np.reshape(values, (int(np.prod(leading)), values.shape[-1]))
+        factors, labels, means = shape_factors(flat, datum, reference, code, definition)
+        sums, counts = profile_sums(factors, profile_cells(datum))
+        self.reference = reference
+        self.labels = list(labels)
+        self.means = means.reshape(leading + (len(labels),))
+        self.factors = factors.astype("float32").reshape(values.shape)
+        self.sums = sums.reshape(leading + profile_shape)
+        self.counts = counts.reshape(leading + profile_shape)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.month_profiles = self.sums / self.counts
+
+    @property
+    def nbytes(self):
+        return self.means.nbytes + self.factors.nbytes + self.sums.nbytes + self.counts.nbytes + self.month_profiles.nbytes
+
+    def profiles(self, month=None):
+        # 7 x 24 profiles (mean shape factor per weekday and hour), over all the months or of one calendar month (0-11)
+        if month is not None:
+            return self.month_profiles[..., month, :, :]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.sums.sum(axis=-3) / self.counts.sum(axis=-3)
+
+    def hour_profiles(self, month=None):
+        # mean shape factor per hour of the day, over all the weekdays
+        sums = self.sums if month is None else self.sums[..., month:month+1, :, :]
+        counts = self.counts if month is None else self.counts[..., month:month+1, :, :]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums.sum(axis=(-3, -2)) / counts.sum(axis=(-3, -2))
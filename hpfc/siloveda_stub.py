@@ -0,0 +1,64 @@
+import argparse, json
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+
+
+# Stub of the SiloVeda time series endpoint, for tests and benchmarks without access to the real service
+#   python -m hpfc.siloveda_stub --port 8121
+#   SILOVEDA_URL=http://localhost:8121/SiloVedaServices/measuringdata_api/v3/timeSeries/ streamlit run interactive_app1.py
+# Every time series returns deterministic synthetic prices every 15 minutes between "from" and "to".
+
+def synthetic_spot_values(code, start, end, freq="15min"):
+    ts = pd.date_range(start, end, freq=freq, tz="UTC")
+    hours = ts.hour.to_numpy() + ts.minute.to_numpy() / 60
+    days = (ts - pd.Timestamp("2020-01-01", tz="UTC")).days.to_numpy()
+    rng = np.random.default_rng(int(code) * 7919 + len(ts))
+    values = 100 + 10 * (int(code) % 5) + 40 * np.sin((hours - 6) / 24 * 2 * np.pi) + 20 * np.cos(days / 365 * 2 * np.pi) + rng.normal(0, 8, len(ts))
+    stamps = np.char.add(np.datetime_as_string(ts.tz_localize(None).to_numpy(), unit="s"), "Z")
+    return [{"ts": t, "val": v, "state": 0} for t, v in zip(stamps.tolist(), np.round(values, 2).tolist())]
+
+def parse_date(value, default):
+    if value is None:
+        return default
+    return pd.Timestamp(value).tz_localize(None) if pd.Timestamp(value).tzinfo else pd.Timestamp(value)
+
+class SilovedaStubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.rstrip("/").split("/")
+        if len(parts) < 3 or parts[-1] != "values":
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        now = pd.Timestamp(datetime.now(timezone.utc).replace(tzinfo=None)).floor("15min")
+        start = parse_date(query.get("from", [None])[0], now - timedelta(days=7))
+        end = min(parse_date(query.get("to", [None])[0], now) + timedelta(days=1), now)
+        body = json.dumps(synthetic_spot_values(parts[-2], start, end)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port=8121, host="127.0.0.1"):
+    server = ThreadingHTTPServer((host, port), SilovedaStubHandler)
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub of the SiloVeda time series endpoint")
+    parser.add_argument("--port", type=int, default=8121)
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args()
+    server = serve(args.port, args.host)
+    print("SiloVeda stub listening on http://" + args.host + ":" + str(args.port) + "/SiloVedaServices/measuringdata_api/v3/timeSeries/")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
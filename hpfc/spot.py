@@ -0,0 +1,78 @@
+import os
+from datetime import datetime, timezone
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from hpfc.store import store_path, file_lock, write_table_atomic
+
+
+# Local archive of the spot prices of SiloVeda
+# One parquet file per SiloVeda time series, with the 15-minute averages of the raw values in UTC, so that
+# both the quarter-hourly and the hourly prices can be served (spot_frame averages them to the asked step).
+# Each update only fetches the values after the last stored quarter hour (the last one itself is fetched
+# again, it may have been incomplete), instead of everything since January 1 of last year.
+# Updates are serialized with a lock file, so several sessions or worker processes can update the archive
+# at the same time ; readers are never blocked since the file is replaced atomically.
+# The endpoint can be replaced (e.g. by the stub server of hpfc.siloveda_stub) with SILOVEDA_URL.
+# requests is imported at the first fetch without a session, not with the module.
+
+siloveda_url = os.environ.get("SILOVEDA_URL", "https://192.168.46.6:8121/SiloVedaServices/measuringdata_api/v3/timeSeries/")
+siloveda_token = os.environ.get("SILOVEDA_TOKEN", "e45b081a-712c-34c1-238f-f94a328e2dfa")
+siloveda_timeout = 60
+
+def fetch_spot_values(code, start, end, session=None, url=siloveda_url):
+    # raw values of a SiloVeda time series between start and end (included) : columns "ts" (UTC) and "val"
+    if session is None:
+        import requests as session
+    headers = {'SilovedaAPIKey': siloveda_token, 'Content-Type': 'application/json'}
+    parameters = {"from": start, "to": end, "inclFrom": True, "inclTo": True}
+    response = session.get(url + str(code) + "/values", params=parameters, headers=headers, verify=False, timeout=siloveda_timeout)
+    response.raise_for_status()
+    df = pd.DataFrame(response.json(), columns=["ts", "val"])
+    df["ts"] = pd.to_datetime(df["ts"], utc=True)
+    df["val"] = df["val"].astype(float)
+    return df
+
+archive_step = "15min"
+
+def resample_values(df, freq=archive_step):
+    # averages of the raw values per period of freq ("15min", "H"), indexed by the start of the period in UTC
+    if len(df) == 0:
+        return pd.Series([], index=pd.DatetimeIndex([], tz="UTC", name="ts"), dtype="float64", name="val")
+    return df.groupby(df["ts"].dt.floor(freq))["val"].mean()
+
+def spot_archive_path(code, store_path=store_path):
+    # the step is part of the name : the hourly archives of earlier versions are not mixed with these ones
+    return os.path.join(store_path, "spot", "spot_" + str(code) + "_" + archive_step + ".parquet")
+
+def read_spot_archive(code, store_path=store_path):
+    path = spot_archive_path(code, store_path)
+    if not os.path.isfile(path):
+        return resample_values(pd.DataFrame(columns=["ts", "val"]))
+    df = pq.read_table(path).to_pandas()
+    return pd.Series(df["val"].to_numpy(), index=pd.DatetimeIndex(df["ts"], name="ts"), name="val")
+
+def update_spot_archive(code, store_path=store_path, session=None, url=siloveda_url, now=None):
+    # fetch the values after the last stored quarter hour, add them to the archive and return the whole archive
+    path = spot_archive_path(code, store_path)
+    now = datetime.now(timezone.utc) if now is None else now
+    with file_lock(path):
+        archive = read_spot_archive(code, store_path)
+        if len(archive) > 0:
+            start = archive.index[-1].to_pydatetime()
+        else:
+            start = datetime(now.year-1, 1, 1, tzinfo=timezone.utc)
+        new_values = resample_values(fetch_spot_values(code, start, now.date(), session, url))
+        if len(new_values) > 0:
+            archive = pd.concat([archive[archive.index < new_values.index[0]], new_values])
+            table = pa.table({"ts": archive.index, "val": archive.to_numpy()})
+            write_table_atomic(table, path)
+    return archive
+
+def spot_frame(archive, name, freq="H"):
+    # "Datum" (UTC without timezone, the time axis of the HPFC curves) and the prices averaged per freq
+    if freq != archive_step and len(archive) > 0:
+        archive = archive.groupby(archive.index.floor(freq)).mean()
+    datum = archive.index.tz_convert("UTC").tz_localize(None)
+    return pd.DataFrame({"Datum": datum.to_numpy(), name: archive.to_numpy(dtype="float64")})
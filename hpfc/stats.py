@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+import pandas as pd
+
+from hpfc.timeaxis import to_utc
+
+
+# Window statistics of the curves
+# Built once per loaded curve set and product : prefix sums of the values, of their squares (around the
+# column means, to keep the variance accurate), of the valid and negative hours and of the peak hours, plus
+# the minimum and maximum of every block of block_size rows. The statistics of all columns over any date
+# window are then computed in one vectorized pass : the means, standard deviations, negative hours and
+# base/peak spreads from the prefix sums, the minimum and maximum from the blocks inside the window and the
+# rows at its edges, and only the percentiles read the rows of the window.
+# The negative hours are counted in hours : a negative quarter hour of a 15-minute curve counts for 0.25.
+# Moving the slider is an update of the prefix differences, and the last windows are kept in a small LRU.
+
+block_size = 512
+percentiles = [5, 50, 95]
+statistics_columns = ["Mean value", "Min value", "Max value", "Std deviation", "P5", "Median", "P95", "Negative hours", "Peak - base"]
+
+def column_step_hours(datum):
+    # smallest time step between the values of a column, in hours (1 if it has less than two values)
+    steps = np.diff(datum)
+    steps = steps[steps > np.timedelta64(0)]
+    return steps.min() / np.timedelta64(1, "h") if len(steps) > 0 else 1.0
+
+class WindowStatistics:
+
+    def __init__(self, df, peak=None, rows=None, results_size=16):
+        # df : "Datum" column sorted in time, and one column per series (or an empty dataframe)
+        # peak : boolean mask of the peak rows of df, for the base/peak spread
+        # rows : boolean mask of the rows of the product (e.g. the off-peak rows), all the rows by default ; the
+        # statistics are those of these rows, the base/peak spread is always computed over all the rows of df
+        if len(df) == 0:
+            df = pd.DataFrame({"Datum": np.array([], dtype="datetime64[ns]")})
+        self.columns = [column for column in df.columns if column != "Datum"]
+        self.datum = df["Datum"].to_numpy()
+        all_values = df[self.columns].to_numpy(dtype="float64")
+        all_finite = ~np.isnan(all_values)
+        self.values = np.ascontiguousarray(all_values if rows is None else np.where(rows[:, None], all_values, np.nan))
+        finite = ~np.isnan(self.values)
+        totals, total_counts = np.where(finite, self.values, 0.0).sum(axis=0), finite.sum(axis=0)
+        self.shift = np.where(total_counts > 0, totals / np.maximum(total_counts, 1), 0.0)
+        centered = np.where(finite, self.values - self.shift, 0.0)
+        self.cum_sums = self.prefix(centered)
+        self.cum_squares = self.prefix(centered * centered)
+        self.cum_counts = self.prefix(finite, dtype="int64")
+        self.cum_negatives = self.prefix(finite & (self.values < 0), dtype="int64")
+        # hours per value of each column : its own time step (an hourly column merged with 15-minute ones keeps 1 hour)
+        self.hours_per_value = np.array([column_step_hours(self.datum[finite[:, j]]) for j in range(len(self.columns))])
+        # the spread is the peak average minus the base average, both over all the rows
+        if peak is None:
+            peak = np.zeros(len(self.values), dtype=bool)
+        all_centered = np.where(all_finite, all_values - self.shift, 0.0)
+        peak = peak[:, None] & all_finite
+        self.cum_base_sums = self.prefix(all_centered)
+        self.cum_base_counts = self.prefix(all_finite, dtype="int64")
+        self.cum_peak_sums = self.prefix(np.where(peak, all_centered, 0.0))
+        self.cum_peak_counts = self.prefix(peak, dtype="int64")
+        # minimum and maximum of the full blocks, NaN ignored (fmin / fmax)
+        n_blocks = len(self.values) // block_size
+        blocks = self.values[:n_blocks * block_size].reshape(n_blocks, block_size, len(self.columns))
+        self.block_min = np.fmin.reduce(blocks, axis=1) if n_blocks > 0 else np.empty((0, len(self.columns)))
+        self.block_max = np.fmax.reduce(blocks, axis=1) if n_blocks > 0 else np.empty((0, len(self.columns)))
+        self.results = OrderedDict()
+        self.results_size = results_size
+        self.lock = Lock()
+
+    @staticmethod
+    def prefix(values, dtype="float64"):
+        cum = np.zeros((len(values)+1,) + values.shape[1:], dtype=dtype)
+        np.cumsum(values, axis=0, out=cum[1:])
+        return cum
+
+    @property
+    def nbytes(self):
+        arrays = [self.values, self.cum_sums, self.cum_squares, self.cum_counts, self.cum_negatives, self.cum_base_sums,
+                  self.cum_base_counts, self.cum_peak_sums, self.cum_peak_counts, self.block_min, self.block_max]
+        return sum(array.nbytes for array in arrays)
+
+    def window_rows(self, start=None, end=None):
+        # rows strictly between start and end (local wall-clock times), like (Datum > start) & (Datum < end)
+        lo = 0 if start is None else np.searchsorted(self.datum, to_utc(start), side="right")
+        hi = len(self.datum) if end is None else np.searchsorted(self.datum, to_utc(end), side="left")
+        return int(lo), int(max(lo, hi))
+
+    def window_extrema(self, lo, hi):
+        # minimum and maximum of every column over the rows lo to hi (excluded)
+        first, last = -(-lo // block_size), hi // block_size
+        if first >= last:
+            parts_min = parts_max = [self.values[lo:hi]]
+        else:
+            parts_min = [self.values[lo:first*block_size], self.block_min[first:last], self.values[last*block_size:hi]]
+            parts_max = [self.values[lo:first*block_size], self.block_max[first:last], self.values[last*block_size:hi]]
+        window_min = np.fmin.reduce(np.concatenate(parts_min), axis=0) if hi > lo else np.full(len(self.columns), np.nan)
+        window_max = np.fmax.reduce(np.concatenate(parts_max), axis=0) if hi > lo else np.full(len(self.columns), np.nan)
+        return window_min, window_max
+
+    def compute(self, lo, hi):
+        counts = self.cum_counts[hi] - self.cum_counts[lo]
+        sums = self.cum_sums[hi] - self.cum_sums[lo]
+        squares = self.cum_squares[hi] - self.cum_squares[lo]
+        peak_counts = self.cum_peak_counts[hi] - self.cum_peak_counts[lo]
+        peak_sums = self.cum_peak_sums[hi] - self.cum_peak_sums[lo]
+        base_counts = self.cum_base_counts[hi] - self.cum_base_counts[lo]
+        base_sums = self.cum_base_sums[hi] - self.cum_base_sums[lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            centered_means = np.where(counts > 0, sums / counts, np.nan)
+            # sample standard deviation, like pandas .std()
+            variances = np.where(counts > 1, (squares - sums * centered_means) / (counts - 1), np.nan)
+            stds = np.sqrt(np.maximum(variances, 0.0))
+            spreads = np.where(peak_counts > 0, peak_sums / peak_counts, np.nan) - np.where(base_counts > 0, base_sums / base_counts, np.nan)
+        window_min, window_max = self.window_extrema(lo, hi)
+        window_percentiles = np.full((len(percentiles), len(self.columns)), np.nan)
+        valid = counts > 0
+        if valid.any():
+            window_percentiles[:, valid] = np.nanpercentile(self.values[lo:hi] if valid.all() else self.values[lo:hi, valid], percentiles, axis=0)
+        negatives = (self.cum_negatives[hi] - self.cum_negatives[lo]) * self.hours_per_value
+        table = np.column_stack([centered_means + self.shift, window_min, window_max, stds,
+                                 window_percentiles[0], window_percentiles[1], window_percentiles[2], negatives, spreads])
+        return pd.DataFrame(table, index=self.columns, columns=statistics_columns)
+
+    def window(self, start=None, end=None):
+        # statistics of every column over the rows strictly between start and end, one row per column
+        lo, hi = self.window_rows(start, end)
+        with self.lock:
+            if (lo, hi) in self.results:
+                self.results.move_to_end((lo, hi))
+                return self.results[(lo, hi)]
+        result = self.compute(lo, hi)
+        with self.lock:
+            self.results[(lo, hi)] = result
+            while len(self.results) > self.results_size:
+                self.results.popitem(last=False)
+        return result
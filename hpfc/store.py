@@ -0,0 +1,171 @@
+import argparse, glob, hashlib, os, time, uuid
+from contextlib import contextmanager
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from hpfc.parser import parse_HPFC_file
+from hpfc.forward import compute_product_table
+
+
+# Columnar on-disk store of the HPFC curves
+# The first time a csv file of the filer is read, it is parsed and written as a parquet file
+# in the store directory. Later reads (from any session, any worker, or after a restart of the server)
+# are served from the parquet copy as long as the mtime and the size of the csv file do not change.
+# The store is a local directory : the filer itself is never written to.
+# The table of the forward product prices of each curve (hpfc.forward) is computed at the same time and kept
+# in the "products" sub-directory, under the same name as the copy of the curve.
+
+store_path = os.environ.get("HPFC_STORE_PATH", ".hpfc_store/")
+
+# version of the content of the store : the copies written by an earlier version (e.g. "Datum" in local
+# wall-clock time before version 2, UTC since) are in other directories and are never read
+store_format = 2
+
+# layout of the parquet copies : nanosecond timestamps delta-encoded (a regular time axis takes almost no
+# space and decodes fast), plain uncompressed prices ; a 15-minute file reads about as fast as an hourly file
+# used to with the default options
+curve_file_options = {"version": "2.6", "use_dictionary": False, "compression": "none",
+                      "column_encoding": {"Datum": "DELTA_BINARY_PACKED"}}
+
+def store_directory(source_dir, store_path=store_path):
+    # one sub-directory per source directory, so that two data paths with the same file names don't collide
+    key = hashlib.sha1((os.path.abspath(source_dir) + ";" + str(store_format)).encode()).hexdigest()[:12]
+    return os.path.join(store_path, key)
+
+def stored_file_path(file_path, store_path=store_path):
+    # the parquet file is keyed on the name, the mtime and the size of the csv file
+    stat = os.stat(file_path)
+    base = os.path.splitext(os.path.basename(file_path))[0]
+    directory = store_directory(os.path.dirname(file_path), store_path)
+    return os.path.join(directory, base + "_" + str(stat.st_mtime_ns) + "_" + str(stat.st_size) + ".parquet")
+
+def product_table_path(parquet_path):
+    directory, name = os.path.split(parquet_path)
+    return os.path.join(directory, "products", name)
+
+def write_table_atomic(table, path, **options):
+    # write to a temporary file then rename it, so that a concurrent reader never sees a half-written file
+    # options are given to pq.write_table
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + "." + uuid.uuid4().hex + ".tmp"
+    try:
+        pq.write_table(table, tmp_path, **options)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+@contextmanager
+def file_lock(path, timeout=120, stale_after=600):
+    # exclusive lock between threads and processes (also on a network share) : a lock file created with O_EXCL
+    # a lock file older than stale_after seconds is considered left over by a crashed process and removed
+    lock_path = path + ".lock"
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError("could not lock " + path)
+            time.sleep(0.05)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+def remove_stale_versions(path):
+    # older conversions of the same csv file (other mtime or size)
+    base = path.rsplit("_", 2)[0]
+    for old_path in glob.glob(glob.escape(base) + "_*_*.parquet"):
+        if old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+def load_curve_file(file_path, name, store_path=store_path):
+    # same dataframe as parse_HPFC_file, served from the columnar copy when it is up to date
+    parquet_path = stored_file_path(file_path, store_path)
+    if os.path.isfile(parquet_path):
+        try:
+            df = pq.read_table(parquet_path, memory_map=True).to_pandas()
+            df.columns = ["Datum", name]
+            return df
+        except (OSError, pa.ArrowException):
+            # unreadable copy : convert the csv file again
+            pass
+    df = parse_HPFC_file(file_path, name)
+    try:
+        write_table_atomic(pa.Table.from_pandas(df, preserve_index=False), parquet_path, **curve_file_options)
+        remove_stale_versions(parquet_path)
+        write_product_table(df, parquet_path)
+    except OSError:
+        # the store is not writable : the parsed dataframe is still returned
+        pass
+    return df
+
+def write_product_table(df, parquet_path):
+    table = compute_product_table(df)
+    path = product_table_path(parquet_path)
+    write_table_atomic(pa.Table.from_pandas(table, preserve_index=False), path)
+    remove_stale_versions(path)
+    return table
+
+def read_product_table(path):
+    if os.path.isfile(path):
+        try:
+            return pq.read_table(path).to_pandas()
+        except (OSError, pa.ArrowException):
+            pass
+    return None
+
+def load_product_table(file_path, name, store_path=store_path):
+    # forward product prices of a curve (hpfc.forward), written when the file is converted ; for a copy converted
+    # before the tables existed, the table is computed from the copy and written
+    parquet_path = stored_file_path(file_path, store_path)
+    table = read_product_table(product_table_path(parquet_path))
+    if table is not None:
+        return table
+    df = load_curve_file(file_path, name, store_path)
+    table = read_product_table(product_table_path(parquet_path))
+    if table is not None:
+        return table
+    try:
+        return write_product_table(df, parquet_path)
+    except OSError:
+        return compute_product_table(df)
+
+def convert_directory(data_path, store_path=store_path):
+    # convert every HPFC file of data_path that is not yet in the store, return the number of converted files
+    converted = 0
+    for file_path in sorted(glob.glob(os.path.join(glob.escape(data_path), "HPFC_*.csv"))):
+        if not os.path.isfile(stored_file_path(file_path, store_path)):
+            name = os.path.splitext(os.path.basename(file_path))[0]
+            load_curve_file(file_path, name, store_path)
+            converted += 1
+    return converted
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the HPFC csv files of a directory to the parquet store")
+    parser.add_argument("data_path", nargs="+")
+    parser.add_argument("--store-path", default=store_path)
+    args = parser.parse_args()
+    for data_path in args.data_path:
+        converted = convert_directory(data_path, args.store_path)
+        print(data_path + " : " + str(converted) + " file(s) converted")
+
+if __name__ == "__main__":
+    main()
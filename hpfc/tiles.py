@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+import pandas as pd
+
+
+# Server-side tile cache for the progressive loading of the price charts
+# The chart starts with a coarse overview of the whole period and asks for finer data when the user zooms.
+# For a window, the finest granularity of the aggregate pyramid with at most max_points periods in the window
+# is used, so that drilling down ends with hourly (or quarter-hourly) data without ever sending the full history.
+# The periods of each granularity are cut in tiles of tile_size periods, and the tiles are cached (LRU)
+# per curve set, so that panning and zooming back and forth is served from memory.
+
+detail_codes = ["15min", "H", "D", "W", "M", "Q", "Y"]
+
+class TileCache:
+
+    def __init__(self, tile_size=512, max_tiles=512):
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+        self.lock = Lock()
+        self.hits, self.misses = 0, 0
+
+    def tile(self, key, pyramid, code, i):
+        # labels and means of the periods of tile i of a granularity
+        tile_key = (key, code, i)
+        with self.lock:
+            if tile_key in self.tiles:
+                self.tiles.move_to_end(tile_key)
+                self.hits += 1
+                return self.tiles[tile_key]
+            self.misses += 1
+        n_periods = len(pyramid.levels[pyramid.level_code(code)][0])
+        tile = pyramid.period_means(code, i * self.tile_size, min((i+1) * self.tile_size, n_periods))
+        with self.lock:
+            self.tiles[tile_key] = tile
+            while len(self.tiles) > self.max_tiles:
+                self.tiles.popitem(last=False)
+        return tile
+
+    def detail_code(self, pyramid, start, end, max_points, finest_code=None):
+        # finest granularity (not finer than finest_code) with at most max_points periods in the window
+        codes = detail_codes if finest_code is None else detail_codes[detail_codes.index(finest_code):]
+        for code in codes:
+            if code not in pyramid.levels:
+                # finer than the time step of the curves
+                continue
+            first, last = pyramid.period_range(code, start, end)
+            if last - first <= max_points:
+                return code
+        return detail_codes[-1]
+
+    def window(self, key, pyramid, start, end, max_points, finest_code=None):
+        # granularity code and dataframe (index "Datum", one column per series) of the periods overlapping the
+        # window, plus one period on each side so that the lines reach the edges of the chart
+        if len(pyramid.datum) == 0:
+            return None, pd.DataFrame()
+        code = self.detail_code(pyramid, start, end, max_points, finest_code)
+        first, last = pyramid.period_range(code, start, end)
+        first, last = max(first - 1, 0), min(last + 1, len(pyramid.levels[code][0]))
+        parts = [self.tile(key, pyramid, code, i) for i in range(first // self.tile_size, (last - 1) // self.tile_size + 1)]
+        offset = first - (first // self.tile_size) * self.tile_size
+        labels = parts[0][0].append([labels for labels, _ in parts[1:]])[offset:offset + last - first]
+        means = np.concatenate([means for _, means in parts])[offset:offset + last - first]
+        return code, pd.DataFrame(means, index=labels.rename("Datum"), columns=pyramid.columns)
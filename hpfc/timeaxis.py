@@ -0,0 +1,84 @@
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+import pandas as pd
+
+
+# Canonical time axis of the curves
+# Every curve is indexed by UTC instants : "Datum" is a naive datetime64[ns] in UTC, unique and increasing, so
+# that the curves of the HPFC files and the spot prices are joined by exact alignment of the same instants and
+# the days of the daylight saving switches have their real 23 and 25 hours.
+# The calendar (days, weekdays and hours of the products, delivery periods, labels of the charts) is the local
+# time of local_timezone, converted from the UTC instants with the vectorized timezone conversions of pandas,
+# never through strings. The local times of an axis are computed once and cached, since the same axis is
+# shared by every curve of a merged frame or of the cube.
+# The HPFC files are written in local wall-clock time, 24 (or 96) values per day : on the spring switch the
+# missing hour (02:00) is dropped, on the autumn switch the value of the repeated hour is used for both of its
+# occurrences.
+
+local_timezone = "Europe/Zurich"
+
+local_cache = OrderedDict()
+local_cache_size = 32
+local_cache_lock = Lock()
+
+def axis_key(datum):
+    datum = np.ascontiguousarray(datum, dtype="datetime64[ns]")
+    return len(datum), hashlib.blake2b(datum.view("uint8"), digest_size=16).hexdigest()
+
+def utc_from_wall_clock(local, tz=local_timezone):
+    # UTC instants of increasing local wall-clock times, and for each instant the position of its wall-clock time
+    # (the wall-clock times that do not exist are left out, the repeated ones give two instants)
+    local = pd.DatetimeIndex(np.asarray(local, dtype="datetime64[ns]"))
+    summer = local.tz_localize(tz, ambiguous=np.ones(len(local), dtype=bool), nonexistent="NaT").asi8
+    winter = local.tz_localize(tz, ambiguous=np.zeros(len(local), dtype=bool), nonexistent="NaT").asi8
+    exists = summer != pd.NaT.value
+    repeated = exists & (summer != winter)
+    positions = np.concatenate([np.flatnonzero(exists), np.flatnonzero(repeated)])
+    instants = np.concatenate([summer[exists], winter[repeated]])
+    order = np.argsort(instants, kind="stable")
+    return instants[order].view("datetime64[ns]"), positions[order]
+
+def compute_local_times(datum, tz):
+    return pd.DatetimeIndex(datum).tz_localize("UTC").tz_convert(tz).tz_localize(None).to_numpy()
+
+def local_times(datum, tz=local_timezone):
+    # cached read-only local wall-clock times (naive datetime64[ns]) of UTC instants
+    datum = np.asarray(datum, dtype="datetime64[ns]")
+    if len(datum) <= 1:
+        return compute_local_times(datum, tz)
+    key = (axis_key(datum), tz)
+    with local_cache_lock:
+        if key in local_cache:
+            local_cache.move_to_end(key)
+            return local_cache[key]
+    local = compute_local_times(datum, tz)
+    local.setflags(write=False)
+    with local_cache_lock:
+        local_cache[key] = local
+        while len(local_cache) > local_cache_size:
+            local_cache.popitem(last=False)
+    return local
+
+def to_utc(local, tz=local_timezone):
+    # UTC instant (np.datetime64) of a local wall-clock time, e.g. a bound of a date window chosen in the app
+    # a repeated time is taken at its first occurrence, a missing one is moved to the end of the gap
+    instant = pd.Timestamp(local).tz_localize(tz, ambiguous=True, nonexistent="shift_forward")
+    return np.datetime64(instant.value, "ns")
+
+def utc_times(local, tz=local_timezone):
+    # UTC instants of an array of local wall-clock times, like to_utc
+    local = pd.DatetimeIndex(np.asarray(local, dtype="datetime64[ns]"))
+    utc = local.tz_localize(tz, ambiguous=np.ones(len(local), dtype=bool), nonexistent="shift_forward")
+    return utc.tz_convert("UTC").tz_localize(None).to_numpy()
+
+def local_datetime(instant, tz=local_timezone):
+    # local wall-clock time of a UTC instant, as a naive datetime.datetime
+    return pd.Timestamp(instant).tz_localize("UTC").tz_convert(tz).tz_localize(None).to_pydatetime()
+
+def local_frame(df, tz=local_timezone):
+    # copy of a frame of curves with "Datum" in local wall-clock time, for display
+    if len(df) == 0:
+        return df
+    return df.assign(Datum=local_times(df["Datum"].to_numpy(), tz))
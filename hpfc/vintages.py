@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from hpfc.timeaxis import local_times
+
+
+# Comparison of forecast vintages (the HPFC curves of several forecast dates) on the aligned curve array
+# Everything works on 2D arrays (curves x hours) on one shared time axis, e.g. a slice of the curve cube,
+# and is vectorized over all curves at once instead of merging the curves pair by pair :
+# - the average price of every curve per delivery period (month, quarter, year) and product,
+# - the revision matrices, i.e. the change of these averages between every pair of vintages,
+# - the pairwise correlations of curves (between countries, or between curves and spot prices).
+
+def period_bounds(datum, code="M"):
+    # labels of the delivery periods (in local time) of a sorted UTC time axis and the index of the first hour
+    # of each period (plus the end)
+    periods = pd.DatetimeIndex(local_times(datum)).to_period(code)
+    ids = periods.asi8
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(ids)) + 1]) if len(ids) > 0 else np.array([], dtype="int64")
+    return periods[starts].astype(str).to_numpy(), np.append(starts, len(ids))
+
+def period_means(values, datum, code="M", mask=None):
+    # average of every curve (rows of values) per delivery period, over the hours of mask (e.g. the peak hours)
+    # returns the period labels and an array (curves, periods), NaN where a curve has no value in a period
+    values = np.atleast_2d(np.asarray(values, dtype="float64"))
+    labels, bounds = period_bounds(datum, code)
+    if len(labels) == 0:
+        return labels, np.empty((len(values), 0))
+    finite = ~np.isnan(values)
+    if mask is not None:
+        finite &= mask
+    sums = np.add.reduceat(np.where(finite, values, 0.0), bounds[:-1], axis=1)
+    counts = np.add.reduceat(finite, bounds[:-1], axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return labels, np.where(counts > 0, sums / counts, np.nan)
+
+def revision_matrices(means):
+    # revisions[i, j, p] : change of the average of period p from vintage i to vintage j (means[j, p] - means[i, p])
+    means = np.asarray(means, dtype="float64")
+    return means[None, :, :] - means[:, None, :]
+
+def pairwise_correlations(values, min_hours=24):
+    # Pearson correlation of every pair of curves (rows of values), over the hours where both curves have a value
+    # all pairs are computed at once with matrix products ; pairs with less than min_hours common hours are NaN
+    values = np.atleast_2d(np.asarray(values, dtype="float64"))
+    finite = ~np.isnan(values)
+    present = finite.astype("float64")
+    x = np.where(finite, values, 0.0)
+    n = present @ present.T
+    sums = x @ present.T  # sums[i, j] : sum of curve i over the hours common with curve j
+    squares = (x * x) @ present.T
+    products = x @ x.T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / n
+        covariance = products / n - means * means.T
+        variances = squares / n - means * means
+        correlations = covariance / np.sqrt(variances * variances.T)
+    correlations[n < min_hours] = np.nan
+    return np.clip(correlations, -1, 1)
+
+def align_to_axis(axis, datum, values):
+    # values of a series on a sorted time axis, NaN where the series has no value
+    aligned = np.full(len(axis), np.nan)
+    positions = np.searchsorted(axis, datum)
+    found = positions < len(axis)
+    found[found] = axis[positions[found]] == datum[found]
+    aligned[positions[found]] = np.asarray(values, dtype="float64")[found]
+    return aligned
@@ -1,11 +1,26 @@
 # Necessary imports
 import streamlit as st
-from datetime import datetime, timezone
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from datetime import datetime, date as Date
 import pandas as pd
-import os, requests
-from bokeh.plotting import figure as bok
-from bokeh.models import DatetimeTickFormatter, HoverTool, Range1d
-from bokeh.palettes import Category10, Reds8, Oranges8, Blues8, Purples8
+import numpy as np
+import os, logging, threading
+
+from hpfc.parser import HPFC_file_name
+from hpfc import engine
+from hpfc.cube import open_cube
+from hpfc.catalog import HPFCCatalog
+from hpfc.products import ProductDefinition, product_mask
+from hpfc.downsample import downsample_series
+from hpfc.tiles import TileCache
+from hpfc.spot import update_spot_archive, spot_frame
+from hpfc.loader import LoadTask, load_concurrently, http_session
+from hpfc.cache import CurveCache
+from hpfc.export import export_formats, frame_chunks, cube_chunks, export_file
+from hpfc.metrics import start_recording, stage, instrument, serve_metrics
+from hpfc.vintages import period_means, revision_matrices, pairwise_correlations, align_to_axis
+from hpfc.shapes import ShapeProfiles, weekday_names, month_names
+from hpfc.timeaxis import local_datetime, local_times
 
 
 # This is a Streamlit-hosted python app
@@ -24,17 +39,24 @@ countries =                   ["CH",          "DE",         "FR",       "AT"]
 captions_countries =          ["Switzerland", "Germany",    "France",   "Austria"]
 siloveda_spot_country_codes = [ 17210,         17208,        17209,      17207]
 spot_colours_countries      = ["darkred",     "darkorange", "darkblue", "darkmagenta"]
-hpfc_colours_countries      = [Reds8,          Oranges8,     Blues8,     Purples8]
+hpfc_colours_countries      = ["Reds8",        "Oranges8",   "Blues8",   "Purples8"]  # bokeh palettes
 products =          ["base", "peak", "off-peak"]
 captions_products = ["All hours of the day, everyday",
                      "Week days from 8 am to 8 pm",
                      "Week days from midnight to 8 am and from 8 pm to midnight and week-end days, all hours of the day"]
-granularities =        ["hourly", "daily", "weekly", "monthly", "quarterly", "yearly"]
-granularity_codes =    ["H",      "D",     "W",      "M",       "Q",         "Y"]
-granularity_tooltips = ["{%Y-%m-%d %Hh}", "{%Y-%m-%d}", "{week%W %Y}", "{%b %Y}", "{%F}", "{%Y}"]
+# hours of the peak product described in captions_products (e.g. ProductDefinition(peak_end=19*60+30) for 8 am - 7:30 pm,
+# or ProductDefinition(holidays=german_public_holidays(range(2022, 2027))) to put the German holidays off-peak)
+product_definition = ProductDefinition()
+granularities =        ["quarter-hourly",      "hourly",         "daily",      "weekly",      "monthly", "quarterly", "yearly"]
+granularity_codes =    ["15min",               "H",              "D",          "W",           "M",       "Q",         "Y"]
+granularity_tooltips = ["{%Y-%m-%d %H:%M}", "{%Y-%m-%d %Hh}", "{%Y-%m-%d}", "{week%W %Y}", "{%b %Y}", "{%F}", "{%Y}"]
+export_scopes =        ["Displayed data", "All hourly HPFC curves"]
+detail_captions =      {"15min": "quarter-hourly prices", "H": "hourly prices", "D": "daily averages", "W": "weekly averages", "M": "monthly averages", "Q": "quarterly averages", "Y": "yearly averages"}
 
 if "dataframe" not in st.session_state: 
     st.session_state.dataframe = pd.DataFrame()
+if "export" not in st.session_state:
+    st.session_state.export = None
 if "country" not in st.session_state:
     st.session_state.country = countries[0]
 if "product" not in st.session_state:
@@ -52,94 +74,199 @@ if "end_slider_date" not in st.session_state:
 if "graph_dates" not in st.session_state:
     st.session_state.graph_dates = ( st.session_state.start_slider_date, st.session_state.end_slider_date )
 if "granularity" not in st.session_state:
-    st.session_state.granularity = granularities[0]
+    st.session_state.granularity = "hourly"
+if "zoom_dates" not in st.session_state:
+    # dates shown after a zoom in the graph, and the slider dates they belong to
+    st.session_state.zoom_dates = None
+if "zoom_event" not in st.session_state:
+    st.session_state.zoom_event = None
+if "view_dates" not in st.session_state:
+    st.session_state.view_dates = st.session_state.graph_dates
 
-data_path = "small_HPFC_data/"
+# maximum time in seconds to load the datasets of a selection
+load_timeout = 60
+
+# memory budget of the curve cache in MB, and time to live of the spot data in seconds
+cache_budget = int(os.environ.get("HPFC_CACHE_MB", 1024))
+spot_ttl = 900
+
+# number of min/max buckets per line of the graph, about the width of the graph in pixels
+graph_buckets = 1200
+
+# port of the Prometheus text endpoint of the stage timings (http://host:port/metrics), off if not set
+metrics_port = os.environ.get("HPFC_METRICS_PORT")
+
+# port of the query service of the curves (see hpfc.service), sharing the curve cache of the app, off if not set
+service_port = os.environ.get("HPFC_SERVICE_PORT")
+# interface of the query service, the loopback interface only by default (e.g. 0.0.0.0 to open it to the network)
+service_host = os.environ.get("HPFC_SERVICE_HOST", "127.0.0.1")
+
+# number of background threads precomputing the new HPFC files into the curve cache and the store (see hpfc.precompute), off if not set
+precompute_workers = os.environ.get("HPFC_PRECOMPUTE")
+
+logger = logging.getLogger(__name__)
+
+data_path = engine.data_path
 #data_path = "K:/Dept/W/HUV.A04974/1000_Handel Front Office/1100_Admin/1170_User/Lelievre/HPFC/"
 
 
 # useful functions to fetch and aggregate the data
 
-@st.cache_data
+@st.cache_resource
+def get_curve_cache():
+    # cache of the curve data shared by all the sessions (see hpfc.cache)
+    # entries are keyed on cheap identifiers and dropped when one of their source files changes
+    return CurveCache(max_bytes=cache_budget * 2**20)
+
 def fetch_HPFC_data_from_filer(country, date, data_path):
     # need date as 8-characters string : yyyymmdd
-    file_path = data_path + "HPFC_" + country +"_" + date + ".csv"
-    if os.path.isfile(file_path):
-        df = pd.read_csv(file_path, sep=";")
-        df.columns.values[0] = "Datum"
-        df = df.transpose()
-        df.columns = df.iloc[0]
-        df = df[1:]
-        df = df.reset_index()
-        df = df.melt(id_vars=["index"], value_vars=list(df.columns)[1:])
-        df["Datum"] = df["Datum"].astype(str) + " " + df["index"].astype(str) + "h"
-        df = df.drop("index", axis=1)
-        df["Datum"] = pd.to_datetime(df["Datum"], format="%d.%m.%Y %Hh")
-        df["value"] = df["value"].astype(float)
-        df.columns = ["Datum", "HPFC" + "_" + country +"_" + date]
-    else:
-        df = pd.DataFrame()  
-    return df
-
-@st.cache_data
-def fetch_spot_data_from_siloveda(country): # emma fetch heure par heure et pas milliseconde par milliseconde
-    most_recent_spot = datetime.date(datetime.now(timezone.utc))
-    beg_of_year = datetime(datetime.now().year-1, 1, 1)
-    old_spot = datetime.date(datetime(datetime.now().year, 1, 1)).strftime("%Y-%m-%d")
-    token = 'e45b081a-712c-34c1-238f-f94a328e2dfa'
-    headers = {'SilovedaAPIKey': token, 'Content-Type': 'application/json'}
-    parameters = {"from": beg_of_year, "to": most_recent_spot, "inclFrom": True, "inclTo": True}
+    return engine.cached_curve(get_curve_cache(), country, date, data_path)
+
+@st.cache_resource
+def get_HPFC_catalog(data_path):
+    # index of the HPFC files of data_path, scanned once and then kept up to date by watching the directory
+    catalog = HPFCCatalog(data_path).scan()
+    catalog.start_watching()
+    return catalog
+
+def available_hpfc_dates(selected_countries):
+    # vintage dates with an HPFC file for at least one of the countries, newest first
+    catalog = get_HPFC_catalog(data_path)
+    catalog.refresh_if_stale()
+    dates = {date for country in selected_countries for date in catalog.vintages(country)}
+    return sorted(dates, reverse=True)
+
+@st.cache_resource(max_entries=2)
+def get_HPFC_cube(data_path, dates, signature):
+    # one memory-mapped cube of all the available HPFC curves, shared by every session of the server
+    # only the current cube and the previous one (still used by the reruns in progress) stay mapped
+    # the signature changes (and the cube is reopened) when a file of data_path is added or modified
+    return open_cube(data_path, countries, list(dates))
+
+def current_HPFC_cube():
+    # the cube of the HPFC files currently in data_path, and its signature
+    signature = get_HPFC_catalog(data_path).signature(countries)
+    return get_HPFC_cube(data_path, tuple(sorted(available_hpfc_dates(countries))), signature), signature
+
+def fetch_spot_data_from_siloveda(country, freq="H"):
+    # hourly (or quarter-hourly with freq="15min") spot prices from the local archive, after fetching from SiloVeda
+    # the quarter hours missing in the archive ; the result is kept spot_ttl seconds in the curve cache
     c_index = countries.index(country)
     code = siloveda_spot_country_codes[c_index]
-    response = requests.get(
-        "https://192.168.46.6:8121/SiloVedaServices/measuringdata_api/v3/timeSeries/"+str(code)+"/values",
-        params=parameters, headers=headers, verify=False)
-    resp = response.json()
-    df = pd.DataFrame(resp)
-    df = df.drop("state", axis=1)
-    df = df.rename(columns={"ts": "Datum", "val": "spot_"+country})
-    df["Datum"] = pd.to_datetime(df["Datum"], utc=True).dt.tz_convert('Europe/Zurich').dt.tz_localize(None)
-    df["spot_"+country] = df["spot_"+country].astype(float)
+    def fetch():
+        archive = update_spot_archive(code, session=http_session())
+        return spot_frame(archive, "spot_"+country, freq)
+    df = get_curve_cache().get_or_compute( ("spot", country, freq), fetch, ttl=spot_ttl )
     return df
 
-@st.cache_data
-def merge_datasets(datasets):
-    merged_df = pd.DataFrame()
-    for df in datasets:
-        if len(df)>0:
-            if len(merged_df)==0:
-                merged_df = df
-            else:
-                merged_df = pd.merge(merged_df, df, on="Datum", how="outer")
-    return merged_df
-
-@st.cache_data
-def separate_data_products(merged_df):
-    if len(merged_df)>0:
-        peak_df = merged_df.set_index('Datum').between_time('8:00', '19:30').reset_index()
-        peak_df = peak_df[peak_df["Datum"].dt.dayofweek < 5]
-        off_peak_df = pd.merge(merged_df, peak_df, how='outer', indicator=True)
-        off_peak_df = off_peak_df.loc[off_peak_df._merge == 'left_only'].drop("_merge", axis=1)
-    else:
-        peak_df, off_peak_df = pd.DataFrame(), pd.DataFrame()
-    return merged_df, peak_df, off_peak_df
-
-@st.cache_data
-def average_for_granularity(df, granularity):
+def compare_vintages(cube, signature, country, product, period_code):
+    # average price of every vintage of a country per delivery period, on the hours of the product
+    # returns the vintages, the period labels and the averages (vintages, periods)
+    def compare():
+        c = cube.countries.index(country)
+        rows = [d for d, date in enumerate(cube.dates) if (country, date) in cube]
+        mask = product_mask(cube.datum, product, product_definition)
+        labels, means = period_means(cube.values[c, rows], cube.datum, period_code, mask)
+        return [cube.dates[d] for d in rows], list(labels), means
+    return get_curve_cache().get_or_compute( ("vintages", signature, country, product, period_code), compare )
+
+@st.cache_resource(max_entries=4)
+def get_shape_profiles(_cube, signature, reference):
+    # shape factors and weekday / hour profiles of all the curves of the cube (countries and vintages) in one pass,
+    # relative to the monthly base or peak averages ; computed once per cube (its signature) and reference
+    with stage("shape profiles"):
+        return ShapeProfiles(_cube.values, _cube.datum, reference, "M", product_definition)
+
+@instrument("merge")
+def merge_datasets(datasets, key, source_paths):
+    # outer join of all the datasets on "Datum", in a single pass
+    return engine.cached_merge(get_curve_cache(), datasets, key, source_paths)
+
+@instrument("split products")
+def separate_data_products(merged_df, key, source_paths, definition=product_definition):
+    # calendar mask of the peak hours, cached per time index and shared by all columns and sessions
+    return engine.cached_products(get_curve_cache(), merged_df, key, source_paths, definition)
+
+@instrument("aggregate pyramid")
+def get_aggregate_pyramid(df, key, source_paths):
+    # sums and counts for every granularity, computed once per loaded curve set and product
+    return engine.cached_pyramid(get_curve_cache(), df, key, source_paths)
+
+@instrument("statistics kernel")
+def get_window_statistics(df, key, source_paths, product, definition=product_definition):
+    # statistics kernel of the product rows of the curves df (all the rows, for the peak - base spread), computed once
+    # per loaded curve set and product and answering every slider window
+    return engine.cached_statistics(get_curve_cache(), df, key, source_paths, definition, product)
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_endpoint(port):
+    # one endpoint per server process, with the curve cache counters as gauges (None if the port is in use)
+    cache_gauges = lambda: {"curve_cache_" + name: value for name, value in get_curve_cache().stats().items()}
+    return serve_metrics(port, gauges=cache_gauges)
+
+@st.cache_resource(show_spinner=False)
+def start_query_service(port):
+    # one query service per server process, answering from the curve cache of the app (imported only if it is on)
+    # None if the port is in use, the app runs without it
+    from hpfc.service import start_service
+    return start_service(port, host=service_host, cache=get_curve_cache(), data_path=data_path)
+
+@st.cache_resource(show_spinner=False)
+def start_precompute_scheduler(workers):
+    # one scheduler per server process, fed by the catalog of data_path and filling the curve cache of the app
+    from hpfc.precompute import start_precompute
+    return start_precompute(get_HPFC_catalog(data_path), countries, cache=get_curve_cache(), workers=workers)
+
+@st.cache_resource
+def get_tile_cache():
+    # tiles of the progressive graph, shared by all sessions
+    return TileCache()
+
+@instrument("averages")
+def average_for_granularity(pyramid, granularity, window=(None, None)):
+    # averages of every period of the granularity, over the rows strictly inside the window
     g_index = granularities.index(granularity)
     gran = granularity_codes[g_index]
-    gran_df = pd.DataFrame()
-    if len(df)>0:
-        gran_df = df.set_index('Datum').groupby(pd.Grouper(freq=gran)).mean()
-        gran_df.insert( loc=0, column="Datum", value=gran_df.index)
+    gran_df = pyramid.averages(gran, window[0], window[1])
     return gran_df
 
-def save_data(): # emma change file name ? and ask where the user would like to save it ?
-    # save data in a csv file
-    save_path = "C:/Users/u241397/OneDrive - SBB/Docs/Data visualisation/HPFC/Streamlit/saved_graphs/"
-    save_name = "Visu_"+datetime.date(datetime.now()).strftime("%Y%m%d")+"_"+st.session_state.country+"_"+st.session_state.product+"_"+st.session_state.granularity+".csv"
-    df = st.session_state.dataframe
-    df.to_csv( save_path + save_name )
+def line_source(graph_df, column, graph_dates):
+    # data of one line of the graph : only the points of the displayed dates, downsampled with min/max buckets
+    from bokeh.models import ColumnDataSource
+    datum, values = downsample_series(graph_df.index.to_numpy(), graph_df[column].to_numpy(), graph_dates[0], graph_dates[1], graph_buckets)
+    return ColumnDataSource(data={"Datum": datum, "price": values})
+
+def add_graph_line(graph, graph_df, column, line_color, legend_label):
+    # add the line of a column to the graph if its data is available, return the added lines
+    if column not in graph_df.columns:
+        return []
+    line = graph.line(source=line_source(graph_df, column, st.session_state.view_dates), x="Datum", y="price",
+                      name=column, line_color=line_color, legend_label=legend_label)
+    return [line]
+
+def export_name(scope, export_format):
+    # name of the exported file, e.g. Visu_20230417_CH_base_daily.csv or Visu_20230417_HPFC_hourly.parquet
+    today = datetime.date(datetime.now()).strftime("%Y%m%d")
+    if scope == export_scopes[0]:
+        name = "Visu_"+today+"_"+st.session_state.country+"_"+st.session_state.product+"_"+st.session_state.granularity
+    else:
+        name = "Visu_"+today+"_HPFC_hourly"
+    return name + export_formats[export_format][1]
+
+def export_key(scope, export_format, source_key):
+    # identifier of the exported data, the prepared export is dropped when it changes
+    if scope == export_scopes[0]:
+        return (scope, export_format, source_key, st.session_state.granularity, st.session_state.graph_dates)
+    return (scope, export_format, get_HPFC_catalog(data_path).signature(countries))
+
+def prepare_export(scope, export_format, key):
+    # the export is written in chunks to a spooled temporary file, its bytes are kept in the session until the selection changes
+    if scope == export_scopes[0]:
+        chunks = frame_chunks(st.session_state.dataframe)
+    else:
+        # all hourly HPFC curves of all countries, straight from the slices of the shared cube
+        chunks = cube_chunks(current_HPFC_cube()[0])
+    st.session_state.export = (key, export_file(chunks, export_format))
 
 
 # building of the app
@@ -150,6 +277,16 @@ st.set_page_config(
     layout="wide"
 )
 
+# the background starters come after set_page_config, which must be the first streamlit command of the script
+# the stages of this rerun (loading, merge, products, aggregates, graph) are recorded for the performance panel
+rerun_recorder = start_recording()
+if metrics_port:
+    start_metrics_endpoint(int(metrics_port))
+if service_port:
+    start_query_service(int(service_port))
+if precompute_workers:
+    start_precompute_scheduler(int(precompute_workers))
+
 st.title("Preistool Energie-SBB")
 st.write("Sie können mit diesem Tool die Energiepreise für verschiedene Länder, Datum und Produkte vergleichen.")
 
@@ -191,13 +328,20 @@ with st.sidebar:
     selected_hpfc_dates = []
     if is_checked_hpfc:
         st.header("HPFC date(s)")
-        number_of_selected_hpfc_dates = st.number_input(
-            label="How many HPFC dates do you want to display ?",
-            min_value=1,
-            max_value=8
-        )
-        for d in range(number_of_selected_hpfc_dates):
-            selected_hpfc_dates.append( st.date_input( label="Date n°"+str(d+1)+":" ) )
+        # only the dates with an HPFC file on the filer are proposed, the newest first
+        hpfc_date_options = tuple( Date(int(date[:4]), int(date[4:6]), int(date[6:])) for date in
+                                   available_hpfc_dates(countries if selected_country == "Alle" else [selected_country]) )
+        if len(hpfc_date_options)==0:
+            st.caption("No HPFC file available on the filer")
+        else:
+            number_of_selected_hpfc_dates = st.number_input(
+                label="How many HPFC dates do you want to display ?",
+                min_value=1,
+                max_value=min(8, len(hpfc_date_options))
+            )
+            for d in range(number_of_selected_hpfc_dates):
+                selected_hpfc_dates.append( st.selectbox( label="Date n°"+str(d+1)+":", options=hpfc_date_options, index=d,
+                                                          format_func=lambda date: date.strftime("%d.%m.%Y") ) )
 
     st.header("Date")
     selected_date = st.slider( 
@@ -209,15 +353,14 @@ with st.sidebar:
 
     st.header("Granularity")
     granularity_options = tuple( granularities )
-    selected_granularity = st.selectbox( label="Choose a granularity:", options=granularity_options )
+    selected_granularity = st.selectbox( label="Choose a granularity:", options=granularity_options,
+                                         index=granularities.index(st.session_state.granularity) )
     st.session_state.granularity = selected_granularity
     st.caption(selected_granularity+" average")
 
-    st.header("Export")
-    st.button( label="Save as csv file", on_click=save_data)
 
 
-graphs_tab, correlations_tab = st.tabs(["Graphs", "Correlations"])
+graphs_tab, correlations_tab, shapes_tab = st.tabs(["Graphs", "Correlations", "Shapes"])
 
 hpfc_dates = []
 if is_checked_hpfc:
@@ -226,102 +369,237 @@ if is_checked_hpfc:
         if date.strftime("%Y%m%d") not in hpfc_dates:
             hpfc_dates.append(date.strftime("%Y%m%d"))
 st.session_state.hpfc_dates = hpfc_dates
-if len(st.session_state.hpfc_dates) < 3:
-    graph_colors = Category10[3][:len(hpfc_dates)]
-else:
-    graph_colors = Category10[len(hpfc_dates)]
 
-datasets = []
+# entries of the curve cache built from files that changed since are dropped
+get_curve_cache().invalidate_changed_files()
+
+# the datasets are loaded concurrently, in the order of the tasks
+# the spot prices are loaded per quarter hour only when the quarter-hourly granularity is selected
+spot_freq = "15min" if st.session_state.granularity == "quarter-hourly" else "H"
+load_tasks = []
+# the cube of the HPFC files, looked up once per rerun for the Alle mode and the tabs
+hpfc_cube, hpfc_signature = current_HPFC_cube()
 if st.session_state.country == "Alle":
     # if the user wants to display all countries at the same time
+    # the HPFC curves are read from the shared cube, one dataframe per country
     for country in countries:
         if st.session_state.is_checked_spot:
-            datasets.append( fetch_spot_data_from_siloveda(country) )
-        for date in st.session_state.hpfc_dates:
-            datasets.append( fetch_HPFC_data_from_filer(country, date, data_path) )
+            load_tasks.append( LoadTask("spot "+country, fetch_spot_data_from_siloveda, country, spot_freq, kind="http") )
+        if len(st.session_state.hpfc_dates)>0:
+            load_tasks.append( LoadTask("HPFC "+country, hpfc_cube.frame, [(country, date) for date in st.session_state.hpfc_dates]) )
 else:
     # if the user only wants to display data for one country
     if st.session_state.is_checked_spot:
-        datasets.append( fetch_spot_data_from_siloveda(st.session_state.country) )
+        load_tasks.append( LoadTask("spot "+st.session_state.country, fetch_spot_data_from_siloveda, st.session_state.country, spot_freq, kind="http") )
     for date in st.session_state.hpfc_dates:
-        datasets.append( fetch_HPFC_data_from_filer(st.session_state.country, date, data_path) )
-merged_df = merge_datasets(datasets)
+        load_tasks.append( LoadTask(engine.curve_name(st.session_state.country, date), fetch_HPFC_data_from_filer, st.session_state.country, date, data_path) )
+# the worker threads get the streamlit context of this rerun, for the cached resources the tasks use
+script_run_ctx = get_script_run_ctx()
+with stage("load") as load_stage:
+    datasets, load_failures = load_concurrently(load_tasks, timeout=load_timeout,
+                                                initializer=lambda: add_script_run_ctx(threading.current_thread(), script_run_ctx))
+    load_stage.rows_out = sum(len(df) for df in datasets)
+for name, message in load_failures:
+    st.warning("The "+name+" data could not be loaded ("+message+"), it is not displayed.")
+selected_countries = countries if st.session_state.country == "Alle" else [st.session_state.country]
+selected_files = [data_path + HPFC_file_name(country, date) for country in selected_countries for date in st.session_state.hpfc_dates]
+selected_key = engine.selection_key([task.name for task in load_tasks], datasets, selected_files)
+merged_df = merge_datasets(datasets, selected_key, selected_files)
 if len(merged_df)>0:
-    st.session_state.start_slider_date = datetime.strptime(str(merged_df["Datum"].iloc[0]), "%Y-%m-%d %H:%M:%S")
-    st.session_state.end_slider_date = datetime.strptime(str(merged_df["Datum"].iloc[-1]), "%Y-%m-%d %H:%M:%S")
-base_df, peak_df, off_peak_df = separate_data_products(merged_df)
+    # the curves are on the UTC time axis, the slider shows local dates
+    st.session_state.start_slider_date = local_datetime(merged_df["Datum"].iloc[0])
+    st.session_state.end_slider_date = local_datetime(merged_df["Datum"].iloc[-1])
+base_df, peak_df, off_peak_df = separate_data_products(merged_df, selected_key, selected_files)
 if st.session_state.product == "base":
     source_df = base_df
 if st.session_state.product == "peak":
     source_df = peak_df
 if st.session_state.product == "off-peak":
     source_df = off_peak_df
-graph_df = source_df
-stats_df = source_df
-save_df = source_df
-if len(source_df)>0:
-    # limit the dataset to the start- and end-dates selected by the user
-    stats_df = stats_df[ (stats_df["Datum"] > st.session_state.graph_dates[0]) & (stats_df["Datum"] < st.session_state.graph_dates[1]) ]
-    save_df = save_df[ (save_df["Datum"] > st.session_state.graph_dates[0]) & (save_df["Datum"] < st.session_state.graph_dates[1]) ]
 # modify the datasets to account for the granularity selected by the user
-graph_df = average_for_granularity(graph_df, st.session_state.granularity)
-save_df = average_for_granularity(save_df, st.session_state.granularity)
+# the saved dataset is limited to the start- and end-dates selected by the user
+source_key = (selected_key, st.session_state.product)
+pyramid = get_aggregate_pyramid(source_df, source_key, selected_files)
+window_statistics = get_window_statistics(merged_df, source_key, selected_files, st.session_state.product)
+graph_df = average_for_granularity(pyramid, st.session_state.granularity)
+save_df = average_for_granularity(pyramid, st.session_state.granularity, st.session_state.graph_dates)
 st.session_state.dataframe = save_df
-if len(source_df)>0:
-    # modify the dataset that we want to plot to account for missing data
-    g_index = granularities.index(st.session_state.granularity)
-    gran = granularity_codes[g_index]
-    all_grans = pd.DataFrame(pd.date_range(graph_df['Datum'].min(), graph_df['Datum'].max(), freq=gran), columns=["Datum"]).set_index('Datum')
-    graph_df = all_grans.merge(right=graph_df.set_index('Datum'), how='left', on='Datum')
+
+with st.sidebar:
+    st.header("Export")
+    export_scope = st.radio( label="Data to export:", options=export_scopes )
+    export_format = st.selectbox( label="Format:", options=tuple(export_formats) )
+    current_export_key = export_key(export_scope, export_format, source_key)
+    if st.session_state.export is not None and st.session_state.export[0] != current_export_key:
+        st.session_state.export = None
+    if st.session_state.export is None:
+        st.button( label="Prepare the export", on_click=prepare_export, args=(export_scope, export_format, current_export_key) )
+    else:
+        st.download_button( label="Download "+export_name(export_scope, export_format), data=st.session_state.export[1],
+                            file_name=export_name(export_scope, export_format), mime=export_formats[export_format][0] )
+if len(graph_df)>0:
+    # the pyramid already has a row for every period (empty ones included), the dates only move to the index
+    graph_df = graph_df.drop(columns="Datum")
 
 
 with graphs_tab:
     # plot the desired prices 
     st.write("Zeitliche Entwicklung der Spot- und Hpfc-Preise in €/MWh")
-    graph = bok( width=800, height=400, x_axis_type='datetime', y_axis_label = "HPFC (EUR/MWh)" )
-    graph.xaxis.formatter = DatetimeTickFormatter(years="%Y", months="%b %Y", days="%d %b %Y", hours="%d %b %Hh", hourmin="%d %b %Hh%M",  minutes="%d %b %Hh%Mmin%S")
-    graph.x_range = Range1d(st.session_state.graph_dates[0], st.session_state.graph_dates[1])
-    g_index = granularities.index(st.session_state.granularity)
-    gran_tt = granularity_tooltips[g_index]
-    graph_tooltips=[ ("Datum", "@Datum"+gran_tt) ]
-    if st.session_state.country == "Alle":
-        # if the user wants to display all countries at the same time
-        for c, country in enumerate(countries):
+    if len(merged_df) == 0:
+        # nothing selected : bokeh is not imported (about 0.3 s at the first run of a worker process)
+        st.info("Choose HPFC dates or the spot prices in the sidebar to display the graph.")
+    else:
+        from bokeh.plotting import figure as bok
+        from bokeh.models import CustomJS, DatetimeTickFormatter, HoverTool, Range1d
+        from bokeh import palettes
+        graph = bok( width=800, height=400, x_axis_type='datetime', y_axis_label = "HPFC (EUR/MWh)" )
+        graph.xaxis.formatter = DatetimeTickFormatter(years="%Y", months="%b %Y", days="%d %b %Y", hours="%d %b %Hh", hourmin="%d %b %Hh%M",  minutes="%d %b %Hh%Mmin%S")
+        # with the hourly and quarter-hourly granularities, the graph starts with an overview of the selected dates and
+        # loads finer data for the visible dates only when the user zooms in (the zoom is forgotten when the slider moves)
+        progressive_graph = st.session_state.granularity in ("quarter-hourly", "hourly")
+        st.session_state.view_dates = st.session_state.graph_dates
+        if progressive_graph:
+            zoom = st.session_state.zoom_dates
+            if zoom is not None and zoom[0] == st.session_state.graph_dates:
+                st.session_state.view_dates = zoom[1]
+            finest_code = pyramid.level_code(granularity_codes[granularities.index(st.session_state.granularity)])
+            detail_code, graph_df = get_tile_cache().window(source_key, pyramid, st.session_state.view_dates[0], st.session_state.view_dates[1],
+                                                            2*graph_buckets, finest_code)
+            if detail_code is not None:
+                st.caption("Displayed: "+detail_captions[detail_code]+(" - zoom in for more detail" if detail_code != finest_code else ""))
+        graph.x_range = Range1d(st.session_state.view_dates[0], st.session_state.view_dates[1])
+        g_index = granularities.index(st.session_state.granularity)
+        gran_tt = granularity_tooltips[g_index]
+        graph_tooltips=[ ("Datum", "@Datum"+gran_tt), ("", "$name"), ("Price", "@price{0.0}") ]
+        graph_lines = []
+        if st.session_state.country == "Alle":
+            # if the user wants to display all countries at the same time
+            for c, country in enumerate(countries):
+                for d, date in enumerate(st.session_state.hpfc_dates):
+                    graph_lines += add_graph_line(graph, graph_df, "HPFC_"+country+"_"+date, getattr(palettes, hpfc_colours_countries[c])[d], country+"-"+date)
+                if st.session_state.is_checked_spot:
+                    # plot spot prices in dark colors
+                    graph_lines += add_graph_line(graph, graph_df, "spot_"+country, spot_colours_countries[c], country+"-spot")
+        else:
+            # if the user only wants to display data for one country
+            graph_colors = palettes.Category10[max(3, len(st.session_state.hpfc_dates))]
             for d, date in enumerate(st.session_state.hpfc_dates):
-                graph.line(source=graph_df, x="Datum", y="HPFC_"+country+"_"+date, line_color=hpfc_colours_countries[c][d], legend_label=country+"-"+date)
-                graph_tooltips.append( ("HPFC_"+country+"_"+date, "@HPFC_"+country+"_"+date) )
+                graph_lines += add_graph_line(graph, graph_df, "HPFC_"+st.session_state.country+"_"+date, graph_colors[d], date)
             if st.session_state.is_checked_spot:
-                # plot spot prices in dark colors
-                graph.line(source=graph_df, x="Datum", y="spot_"+country, line_color=spot_colours_countries[c], legend_label=country+"-spot")
-                graph_tooltips.append( ("spot_"+country, "@spot_"+country) )
-    else:
-        # if the user only wants to display data for one country
-        for d, date in enumerate(st.session_state.hpfc_dates):
-            graph.line(source=graph_df, x="Datum", y="HPFC_"+st.session_state.country+"_"+date, line_color=graph_colors[d], legend_label=date)
-            graph_tooltips.append( ("HPFC_"+st.session_state.country+"_"+date, "@HPFC_"+st.session_state.country+"_"+date) )
-        if st.session_state.is_checked_spot:
-            # plot spot prices in black
-            graph.line(source=graph_df, x="Datum", y="spot_"+st.session_state.country, line_color="black", legend_label=st.session_state.country+"-spot")
-            graph_tooltips.append( ("spot_"+st.session_state.country, "@spot_"+st.session_state.country) )
-    graph.legend.click_policy="hide"
-    graph_hover = HoverTool(
-        formatters={"@Datum": "datetime"},
-        tooltips=graph_tooltips)
-    graph.add_tools(graph_hover)
-    st.bokeh_chart(graph, use_container_width=True)
+                # plot spot prices in black
+                graph_lines += add_graph_line(graph, graph_df, "spot_"+st.session_state.country, "black", st.session_state.country+"-spot")
+        if len(graph_lines)>0:
+            graph.legend.click_policy="hide"
+        logger.info("bokeh graph: %d line(s), %d point(s) sent instead of %d",
+                    len(graph_lines), sum(len(line.data_source.data["Datum"]) for line in graph_lines), len(graph_lines)*len(graph_df))
+        graph_hover = HoverTool(
+            formatters={"@Datum": "datetime"},
+            tooltips=graph_tooltips,
+            renderers=graph_lines)
+        graph.add_tools(graph_hover)
+        if progressive_graph:
+            # send the visible dates back to streamlit after each zoom or pan
+            graph.js_on_event("rangesupdate", CustomJS(code="""
+                document.dispatchEvent(new CustomEvent("RANGE_CHANGED", {detail: {start: cb_obj.x0, end: cb_obj.x1}}))
+            """))
+            graph.sizing_mode = "stretch_width"
+            from streamlit_bokeh_events import streamlit_bokeh_events
+            with stage("bokeh chart", rows_in=len(graph_df)):
+                zoom_event = streamlit_bokeh_events(graph, events="RANGE_CHANGED", key="graph_zoom", debounce_time=500, override_height=450)
+            if zoom_event is not None and zoom_event != st.session_state.zoom_event and "RANGE_CHANGED" in zoom_event:
+                st.session_state.zoom_event = zoom_event
+                zoom_dates = ( datetime.utcfromtimestamp(zoom_event["RANGE_CHANGED"]["start"]/1000),
+                               datetime.utcfromtimestamp(zoom_event["RANGE_CHANGED"]["end"]/1000) )
+                if zoom_dates != st.session_state.view_dates:
+                    st.session_state.zoom_dates = (st.session_state.graph_dates, zoom_dates)
+                    st.experimental_rerun()
+        else:
+            with stage("bokeh chart", rows_in=len(graph_df)):
+                st.bokeh_chart(graph, use_container_width=True)
 
     # display relevant statistics on the plotted data
     st.write("\n")
     st.write("\n")
     st.write("\n")
     st.write("Statistik über die ", st.session_state.country, " ", st.session_state.product, " Preise für den ausgewählten Zeitraum")
-    mean_statistics = [stats_df[col].mean() for col in stats_df.columns[1:]]
-    min_statistics = [stats_df[col].min() for col in stats_df.columns[1:]]
-    max_statistics = [stats_df[col].max() for col in stats_df.columns[1:]]
-    statistics_index = stats_df.columns[1:]
-    graph_statistics = pd.DataFrame({"Mean value" : mean_statistics, "Min value" : min_statistics, "Max value" : max_statistics}, index=statistics_index)
-    st.table(graph_statistics.style.format("{:.1f}"))
+    # all the statistics of all the columns over the window, in one pass
+    with stage("statistics window") as statistics_stage:
+        graph_statistics = window_statistics.window(st.session_state.graph_dates[0], st.session_state.graph_dates[1])
+        statistics_stage.rows_out = len(graph_statistics)
+    st.table(graph_statistics.style.format("{:.1f}").format("{:.0f}", subset=["Negative hours"]))
 
 with correlations_tab:
-    st.write("Blabla Correlations")
+    # comparison of all the available HPFC vintages of a country
+    st.write("Vergleich aller verfügbaren HPFC-Prognosen eines Landes für das Produkt ", st.session_state.product)
+    comparison_cube, comparison_signature = hpfc_cube, hpfc_signature
+    comparison_country = st.selectbox( label="Choose a country to compare its HPFC vintages:", options=tuple(countries),
+                                       index=countries.index(st.session_state.country) if st.session_state.country in countries else 0 )
+    comparison_period = st.selectbox( label="Choose a delivery period:", options=("monthly", "quarterly", "yearly") )
+    comparison_code = granularity_codes[granularities.index(comparison_period)]
+    vintages, delivery_periods, vintage_means = compare_vintages(comparison_cube, comparison_signature, comparison_country,
+                                                                 st.session_state.product, comparison_code)
+    if len(vintages)==0:
+        st.write("No HPFC file available for ", comparison_country)
+    else:
+        st.write("Average ", st.session_state.product, " price per delivery period (EUR/MWh)")
+        st.dataframe(pd.DataFrame(vintage_means, index=vintages, columns=delivery_periods).style.format("{:.1f}"))
+
+        delivery_period = st.selectbox( label="Choose a delivery period to see the revisions between vintages:", options=tuple(delivery_periods) )
+        st.write("Revision of the ", delivery_period, " ", st.session_state.product, " price from the vintage of the row to the vintage of the column (EUR/MWh)")
+        revisions = revision_matrices(vintage_means)[:, :, delivery_periods.index(delivery_period)]
+        st.table(pd.DataFrame(revisions, index=vintages, columns=vintages).style.format("{:.1f}"))
+
+        # correlations of the hourly prices of the product
+        correlation_vintage = st.selectbox( label="Choose a vintage for the correlations between countries:", options=tuple(reversed(vintages)) )
+        correlation_mask = product_mask(comparison_cube.datum, st.session_state.product, product_definition)
+        d = comparison_cube.dates.index(correlation_vintage)
+        correlations = pairwise_correlations(np.where(correlation_mask, comparison_cube.values[:, d], np.nan))
+        st.write("Correlation of the hourly ", st.session_state.product, " prices between countries, vintage ", correlation_vintage)
+        st.table(pd.DataFrame(correlations, index=comparison_cube.countries, columns=comparison_cube.countries).style.format("{:.2f}"))
 
+        if st.session_state.is_checked_spot:
+            spot_df = fetch_spot_data_from_siloveda(comparison_country, "15min" if comparison_cube.step < np.timedelta64(1, "h") else "H")
+            spot = align_to_axis(comparison_cube.datum, spot_df["Datum"].to_numpy(), spot_df["spot_"+comparison_country].to_numpy())
+            c = comparison_cube.countries.index(comparison_country)
+            rows = [comparison_cube.dates.index(vintage) for vintage in vintages]
+            curves = np.where(correlation_mask, np.vstack([spot, comparison_cube.values[c, rows]]), np.nan)
+            spot_correlations = pairwise_correlations(curves)[0, 1:]
+            st.write("Correlation of each HPFC vintage with the ", comparison_country, " spot prices (hours with both prices)")
+            st.table(pd.DataFrame({"Correlation with spot": spot_correlations}, index=vintages).style.format("{:.2f}"))
+
+with shapes_tab:
+    # hourly shape of the HPFC vintages : price of each hour divided by the average of its month
+    st.write("Stundenprofil der HPFC-Prognosen: Preis jeder Stunde geteilt durch den Monatsdurchschnitt")
+    shape_cube, shape_signature = hpfc_cube, hpfc_signature
+    shape_country = st.selectbox( label="Choose a country for the shapes:", options=tuple(countries),
+                                  index=countries.index(st.session_state.country) if st.session_state.country in countries else 0 )
+    shape_reference = st.radio( label="Reference average of the month:", options=("base", "peak"), horizontal=True )
+    shapes = get_shape_profiles(shape_cube, shape_signature, shape_reference)
+    c = shape_cube.countries.index(shape_country)
+    shape_rows = [d for d, date in enumerate(shape_cube.dates) if (shape_country, date) in shape_cube]
+    if len(shape_rows)==0:
+        st.write("No HPFC file available for ", shape_country)
+    else:
+        shape_vintages = [shape_cube.dates[d] for d in shape_rows]
+        shape_vintage = st.selectbox( label="Choose a vintage:", options=tuple(reversed(shape_vintages)) )
+        d = shape_cube.dates.index(shape_vintage)
+        profile_month = st.selectbox( label="Choose the calendar month of the profiles:", options=("All months",)+tuple(month_names) )
+        month = month_names.index(profile_month) if profile_month in month_names else None
+        st.write("Mean shape factor per weekday and hour (", shape_reference, " average of the month = 1), vintage ", shape_vintage)
+        st.dataframe(pd.DataFrame(shapes.profiles(month)[c, d], index=weekday_names, columns=range(24)).style.format("{:.2f}"))
+        st.write("Mean shape factor per hour of every vintage of ", shape_country)
+        st.dataframe(pd.DataFrame(shapes.hour_profiles(month)[c, shape_rows], index=shape_vintages, columns=range(24)).style.format("{:.2f}"))
+
+        # hourly shape factors of one delivery month of the vintage
+        delivery_months = [label for label, mean in zip(shapes.labels, shapes.means[c, d]) if not np.isnan(mean)]
+        if len(delivery_months)>0:
+            delivery_month = st.selectbox( label="Choose a delivery month for the hourly shape factors:", options=tuple(delivery_months) )
+            month_rows = local_times(shape_cube.datum).astype("datetime64[M]") == np.datetime64(delivery_month, "M")
+            st.line_chart(pd.DataFrame({"Shape factor": shapes.factors[c, d, month_rows]}, index=local_times(shape_cube.datum)[month_rows]))
+
+with st.sidebar:
+    # wall time, rows, memory change and curve cache hits / misses of the stages of this rerun
+    with st.expander("Performance"):
+        st.write("Rerun: {:.2f} s".format(rerun_recorder.elapsed()))
+        st.dataframe(rerun_recorder.frame().style.format({"seconds": "{:.4f}"}))
+        st.write("Curve cache: ", get_curve_cache().stats())
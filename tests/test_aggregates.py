@@ -0,0 +1,44 @@
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+
+from hpfc import engine
+from hpfc.aggregates import AggregatePyramid
+from hpfc.timeaxis import local_frame, local_times, to_utc
+
+data_path = os.path.join(os.path.dirname(__file__), "..", "small_HPFC_data", "")
+
+
+@pytest.fixture(scope="module")
+def curves(tmp_path_factory):
+    # hourly curves of two countries over four years, with the daylight saving switches
+    return engine.load_curves(["CH", "DE"], ["20230407", "20230417"], data_path, how="outer", store_path=str(tmp_path_factory.mktemp("store")))
+
+def pandas_averages(df, code):
+    # the hourly periods are those of the UTC axis (labelled in local time), the others those of the local calendar
+    if code == "H":
+        means = df.set_index("Datum").groupby(pd.Grouper(freq=code)).mean()
+        means.index = pd.DatetimeIndex(local_times(means.index.to_numpy()))
+        return means
+    return local_frame(df).set_index("Datum").groupby(pd.Grouper(freq=code)).mean()
+
+@pytest.mark.parametrize("code", ["H", "D", "W", "M", "Q", "Y"])
+def test_averages_match_pandas(curves, code):
+    result = AggregatePyramid(curves).averages(code)
+    expected = pandas_averages(curves, code)
+    pd.testing.assert_frame_equal(result.drop(columns="Datum"), expected, check_names=False, check_freq=False, rtol=1e-9)
+
+@pytest.mark.parametrize("code", ["D", "W", "M"])
+def test_window_averages_match_pandas(curves, code):
+    # the periods at the edges of the window are averaged over the rows inside the window
+    start, end = datetime(2023, 3, 15, 13), datetime(2023, 11, 2, 7)
+    window = curves[(curves["Datum"] > to_utc(start)) & (curves["Datum"] < to_utc(end))]
+    result = AggregatePyramid(curves).averages(code, start, end)
+    expected = pandas_averages(window, code)
+    pd.testing.assert_frame_equal(result.drop(columns="Datum"), expected, check_names=False, check_freq=False, rtol=1e-9)
+
+def test_empty_window(curves):
+    assert len(AggregatePyramid(curves).averages("D", datetime(2030, 1, 1), datetime(2030, 2, 1))) == 0
+    assert len(AggregatePyramid(pd.DataFrame()).averages("M")) == 0
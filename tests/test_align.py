@@ -0,0 +1,31 @@
+import os
+import pandas as pd
+import pytest
+
+from hpfc.align import align_datasets
+from hpfc.parser import HPFC_column_name, HPFC_file_name, parse_HPFC_file
+
+data_path = os.path.join(os.path.dirname(__file__), "..", "small_HPFC_data", "")
+
+
+def merge_loop(datasets, how):
+    # the pd.merge loop the apps used before, as a reference
+    merged_df = pd.DataFrame()
+    for df in datasets:
+        if len(df)>0:
+            merged_df = df if len(merged_df)==0 else pd.merge(merged_df, df, on="Datum", how=how)
+    return merged_df
+
+@pytest.fixture(scope="module")
+def datasets():
+    # curves of several files, shifted so that the outer join has to extend the time axis
+    curves = []
+    for i, (country, date) in enumerate([("CH", "20230407"), ("DE", "20230413"), ("FR", "20230417"), ("AT", "20230102")]):
+        df = parse_HPFC_file(data_path + HPFC_file_name(country, date), HPFC_column_name(country, date))
+        df["Datum"] = df["Datum"] + pd.Timedelta(days=10 * i)
+        curves.append(df)
+    return curves + [pd.DataFrame()]
+
+@pytest.mark.parametrize("how", ["outer", "inner"])
+def test_aligned_join_matches_the_merge_loop(datasets, how):
+    pd.testing.assert_frame_equal(align_datasets(datasets, how=how), merge_loop(datasets, how).reset_index(drop=True))
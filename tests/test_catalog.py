@@ -0,0 +1,27 @@
+import os, shutil
+
+from hpfc.catalog import HPFCCatalog
+
+data_path = os.path.join(os.path.dirname(__file__), "..", "small_HPFC_data", "")
+
+
+def test_missing_directory_gives_an_empty_catalog(tmp_path):
+    catalog = HPFCCatalog(str(tmp_path / "not mounted") + os.sep).scan()
+    assert catalog.countries() == []
+    assert catalog.vintages("CH") == []
+    assert catalog.latest("CH") == []
+
+def test_scan_notifies_only_the_new_and_modified_files(tmp_path):
+    directory = str(tmp_path) + os.sep
+    for name in ["HPFC_CH_20230407.csv", "HPFC_CH_20230413.csv", "HPFC_DE_20230413.csv"]:
+        shutil.copy(data_path + name, directory)
+    notified = []
+    catalog = HPFCCatalog(directory)
+    catalog.add_listener(notified.append)
+    catalog.scan()
+    assert sorted(entry.date for entry in notified[0]) == ["20230407", "20230413", "20230413"]
+    catalog.scan()
+    assert len(notified) == 1
+    shutil.copy(data_path + "HPFC_CH_20230414.csv", directory)
+    catalog.scan()
+    assert [(entry.country, entry.date) for entry in notified[1]] == [("CH", "20230414")]
@@ -0,0 +1,30 @@
+import os
+import numpy as np
+
+from hpfc.cube import available_HPFC_dates, open_cube
+from hpfc.parser import HPFC_column_name
+
+data_path = os.path.join(os.path.dirname(__file__), "..", "small_HPFC_data", "")
+
+
+def test_available_dates_leave_out_the_spot_files():
+    assert available_HPFC_dates(data_path, ["AT"]) == ["20230102", "20230407", "20230413", "20230414", "20230417"]
+    assert available_HPFC_dates(data_path, ["XX"]) == []
+
+def test_cube_frame_matches_the_curves(tmp_path):
+    cube = open_cube(data_path, ["CH", "DE"], ["20230407", "20230417"], str(tmp_path))
+    df = cube.frame([("DE", "20230417")])
+    assert list(df.columns) == ["Datum", HPFC_column_name("DE", "20230417")]
+    assert np.isfinite(df.iloc[:, 1]).sum() > 0
+
+def test_stale_cubes_are_removed(tmp_path):
+    store = str(tmp_path)
+    open_cube(data_path, ["CH", "DE"], ["20230407"], store)
+    open_cube(data_path, ["FR"], ["20230407"], store)
+    open_cube(data_path, ["CH", "DE"], ["20230407", "20230413"], store)
+    files = sorted(os.listdir(os.path.join(store, "cubes")))
+    # the current cube of CH, DE and the cube of FR
+    assert len(files) == 4
+    cube = open_cube(data_path, ["CH", "DE"], ["20230407", "20230413"], store)
+    assert cube.dates == ["20230407", "20230413"]
+    assert sorted(os.listdir(os.path.join(store, "cubes"))) == files
@@ -0,0 +1,51 @@
+import os, shutil
+import pytest
+
+from hpfc import engine
+from hpfc.cube import open_cube
+from hpfc.parser import HPFC_file_name
+from hpfc.products import ProductDefinition, default_product_definition, german_public_holidays
+
+data_path = os.path.join(os.path.dirname(__file__), "..", "small_HPFC_data", "")
+countries = ["CH", "DE", "FR", "AT"]
+
+
+@pytest.fixture
+def cube(tmp_path):
+    return open_cube(data_path, countries, ["20230102", "20230407", "20230413"], str(tmp_path / "store"))
+
+def alle_key(cube, dates):
+    # the key of the Alle mode of interactive_app1 : one task "HPFC <country>" per country, read from the cube
+    names = ["HPFC " + country for country in countries]
+    datasets = [cube.frame([(country, date) for date in dates]) for country in countries]
+    files = [data_path + HPFC_file_name(country, date) for country in countries for date in dates]
+    return engine.selection_key(names, datasets, files)
+
+def test_selection_key_changes_with_the_vintages(cube):
+    # the frames of the vintages have the same name, length and first and last dates
+    assert alle_key(cube, ["20230102"]) != alle_key(cube, ["20230407"])
+    assert alle_key(cube, ["20230102"]) != alle_key(cube, ["20230407", "20230413"])
+    assert alle_key(cube, ["20230407", "20230413"]) == alle_key(cube, ["20230407", "20230413"])
+
+def test_selection_key_changes_when_a_file_is_delivered_again(tmp_path):
+    directory = str(tmp_path / "data") + os.sep
+    os.makedirs(directory)
+    shutil.copy(data_path + HPFC_file_name("CH", "20230417"), directory)
+    path = directory + HPFC_file_name("CH", "20230417")
+    df = engine.load_curve("CH", "20230417", directory, str(tmp_path / "store"))
+    name = engine.curve_name("CH", "20230417")
+    key = engine.selection_key([name], [df], [path])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert engine.selection_key([name], [df], [path]) != key
+
+def test_derived_frames_of_definitions_with_other_holidays_differ(tmp_path):
+    files = [data_path + HPFC_file_name("DE", "20230417")]
+    holidays = ProductDefinition(holidays=german_public_holidays(range(2023, 2027)))
+    key = lambda definition: (("DE",), ("20230417",), "peak", definition)
+    assert repr(holidays) == repr(default_product_definition)
+    assert engine.derived_file_path("product", key(holidays), files) != engine.derived_file_path("product", key(default_product_definition), files)
+    store = str(tmp_path / "store")
+    default_peak = engine.product_curves(["DE"], ["20230417"], "peak", data_path, store_path=store)
+    holidays_peak = engine.product_curves(["DE"], ["20230417"], "peak", data_path, holidays, store_path=store)
+    assert len(holidays_peak) < len(default_peak)
@@ -0,0 +1,32 @@
+import gzip, io
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from streamlit.elements.button import marshall_file
+from streamlit.proto.DownloadButton_pb2 import DownloadButton as DownloadButtonProto
+
+from hpfc.export import export_formats, export_file, frame_chunks
+
+
+def sample_frame(rows=50):
+    datum = np.arange(np.datetime64("2023-05-01T00:00", "ns"), np.datetime64("2023-05-01T00:00", "ns") + np.timedelta64(rows, "h"), np.timedelta64(1, "h"))
+    return pd.DataFrame({"Datum": datum, "HPFC_CH_20230417": np.arange(rows, dtype="float64")})
+
+@pytest.mark.parametrize("export_format", list(export_formats))
+def test_export_is_accepted_by_the_download_button(export_format):
+    data = export_file(frame_chunks(sample_frame(), chunk_rows=7), export_format)
+    assert isinstance(data, bytes)
+    # raises "Invalid binary data format" for the types the download button does not take
+    marshall_file("test", data, DownloadButtonProto(), export_formats[export_format][0])
+
+@pytest.mark.parametrize("export_format", list(export_formats))
+def test_export_round_trip(export_format):
+    df = sample_frame()
+    data = export_file(frame_chunks(df, chunk_rows=7), export_format)
+    if export_format == "parquet":
+        result = pq.read_table(io.BytesIO(data)).to_pandas()
+    else:
+        text = gzip.decompress(data) if export_format == "csv.gz" else data
+        result = pd.read_csv(io.BytesIO(text), parse_dates=["Datum"])
+    pd.testing.assert_frame_equal(result, df, check_dtype=False)
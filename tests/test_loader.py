@@ -0,0 +1,46 @@
+import threading, time
+import pandas as pd
+
+from hpfc import loader
+from hpfc.loader import LoadTask, load_concurrently
+
+
+def frame(seconds, rows=3):
+    time.sleep(seconds)
+    return pd.DataFrame({"value": range(rows)})
+
+def fail():
+    raise OSError("filer not mounted")
+
+def test_results_keep_the_order_of_the_tasks():
+    tasks = [LoadTask("slow", frame, 0.2, 1), LoadTask("fast", frame, 0.0, 2), LoadTask("spot", frame, 0.1, 3, kind="http")]
+    results, failures = load_concurrently(tasks, timeout=5)
+    assert [len(df) for df in results] == [1, 2, 3]
+    assert failures == []
+
+def test_the_timeout_is_counted_per_task(monkeypatch):
+    # with one worker the second task starts when the first one ends : both are within their own timeout
+    monkeypatch.setattr(loader, "file_workers", 1)
+    tasks = [LoadTask("first", frame, 0.3), LoadTask("second", frame, 0.3)]
+    results, failures = load_concurrently(tasks, timeout=0.5)
+    assert failures == []
+    assert [len(df) for df in results] == [3, 3]
+
+def test_a_slow_task_times_out_alone():
+    start = time.perf_counter()
+    tasks = [LoadTask("hung", frame, 2.0), LoadTask("fast", frame, 0.0), LoadTask("broken", fail)]
+    results, failures = load_concurrently(tasks, timeout=0.3)
+    assert time.perf_counter() - start < 1.5
+    assert [name for name, message in failures] == ["hung", "broken"]
+    assert failures[0][1] == "timed out after 0.3s"
+    assert len(results[0]) == 0 and len(results[1]) == 3
+
+def test_the_initializer_runs_in_the_worker_threads():
+    # e.g. the streamlit context of the rerun, attached to the threads by interactive_app1
+    context = threading.local()
+    initializer = lambda: setattr(context, "rerun", "rerun 1")
+    tasks = [LoadTask("file", lambda: pd.DataFrame({"rerun": [context.rerun]})),
+             LoadTask("spot", lambda: pd.DataFrame({"rerun": [context.rerun]}), kind="http")]
+    results, failures = load_concurrently(tasks, timeout=5, initializer=initializer)
+    assert failures == []
+    assert [df["rerun"][0] for df in results] == ["rerun 1", "rerun 1"]
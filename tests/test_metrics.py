@@ -0,0 +1,23 @@
+from urllib.request import urlopen
+
+from hpfc.metrics import serve_metrics
+
+
+def test_endpoint_on_the_loopback_interface():
+    server = serve_metrics(0, gauges=lambda: {"test": 1})
+    try:
+        host, port = server.server_address
+        assert host == "127.0.0.1"
+        assert "hpfc_test 1" in urlopen("http://127.0.0.1:" + str(port) + "/metrics").read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_port_in_use_is_logged(caplog):
+    server = serve_metrics(0)
+    try:
+        assert serve_metrics(server.server_address[1]) is None
+        assert "not started" in caplog.text
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,36 @@
+import os, shutil
+
+from hpfc import engine
+from hpfc.cache import CurveCache
+from hpfc.catalog import HPFCCatalog
+from hpfc.precompute import start_precompute
+from hpfc.store import product_table_path, stored_file_path
+
+data_path = os.path.join(os.path.dirname(__file__), "..", "small_HPFC_data", "")
+
+
+def test_new_file_is_precomputed(tmp_path):
+    directory = str(tmp_path / "data") + os.sep
+    store = str(tmp_path / "store")
+    os.makedirs(directory)
+    shutil.copy(data_path + "HPFC_CH_20230413.csv", directory)
+    cache = CurveCache()
+    catalog = HPFCCatalog(directory).scan()
+    scheduler = start_precompute(catalog, ["CH", "DE"], cache=cache, store_path=store)
+    shutil.copy(data_path + "HPFC_CH_20230417.csv", directory)
+    catalog.scan()
+    scheduler.join()
+    scheduler.stop()
+    assert scheduler.stats()["failed"] == 0 and scheduler.stats()["dropped"] == 0
+    path = directory + "HPFC_CH_20230417.csv"
+    assert os.path.isfile(stored_file_path(path, store))
+    assert os.path.isfile(product_table_path(stored_file_path(path, store)))
+    assert os.listdir(os.path.join(store, "cubes")) != []
+    assert not os.path.isdir(os.path.join(store, "derived"))
+    # the selection of the newest vintage alone is served from the cache
+    df = engine.cached_curve(cache, "CH", "20230417", directory, store)
+    key = engine.selection_key([engine.curve_name("CH", "20230417")], [df], [path])
+    hits = cache.stats()["hits"]
+    engine.cached_pyramid(cache, None, (key, "peak"), [path])
+    engine.cached_statistics(cache, None, (key, "peak"), [path])
+    assert cache.stats()["hits"] == hits + 2
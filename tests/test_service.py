@@ -0,0 +1,45 @@
+import json, os, shutil, socket, tempfile
+import pandas as pd
+from tornado.testing import AsyncHTTPTestCase
+
+from hpfc.service import CurveService, make_app, start_service
+
+data_path = os.path.join(os.path.dirname(__file__), "..", "small_HPFC_data", "")
+
+
+class ServiceTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.store_path = tempfile.mkdtemp()
+        return make_app(CurveService(data_path=data_path, store_path=self.store_path))
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.store_path, ignore_errors=True)
+
+    def curves(self, query):
+        response = self.fetch("/curves?country=CH&vintage=20230417&granularity=H&format=json&" + query)
+        return response.code, json.loads(response.body)
+
+    def test_bounds_with_a_utc_offset(self):
+        # 2023-05-01T00:00Z is 02:00 in Zurich
+        code, utc = self.curves("start=2023-05-01T00:00Z&end=2023-05-01T06:00Z")
+        assert code == 200
+        code, local = self.curves("start=2023-05-01T02:00&end=2023-05-01T08:00")
+        assert code == 200
+        assert utc == local
+        assert pd.Timestamp(utc["data"][0][0]) == pd.Timestamp("2023-05-01T03:00")
+
+    def test_invalid_bounds(self):
+        for query in ["start=yesterday", "start=", "end=2023-13-01"]:
+            code, body = self.curves(query)
+            assert code == 400, query
+            assert "error" in body
+
+def test_port_in_use_does_not_block(caplog):
+    # the second service on the same port is logged and left out instead of waiting forever
+    with socket.socket() as taken:
+        taken.bind(("127.0.0.1", 0))
+        taken.listen()
+        assert start_service(taken.getsockname()[1], data_path=data_path, store_path=tempfile.mkdtemp()) is None
+    assert "not started" in caplog.text
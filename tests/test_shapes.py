@@ -0,0 +1,33 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from hpfc.cube import open_cube
+from hpfc.products import peak_mask
+from hpfc.shapes import ShapeProfiles
+from hpfc.timeaxis import local_times
+
+data_path = os.path.join(os.path.dirname(__file__), "..", "small_HPFC_data", "")
+
+
+@pytest.mark.parametrize("shape", [(4, 0, 0), (4, 0, 48), (4, 2, 0)])
+def test_empty_cube(shape):
+    datum = np.datetime64("2023-01-01", "ns") + np.arange(shape[2]) * np.timedelta64(1, "h")
+    shapes = ShapeProfiles(np.full(shape, np.nan, dtype="float32"), datum, "peak")
+    assert shapes.factors.shape == shape
+    assert shapes.profiles().shape == shape[:2] + (7, 24)
+    assert shapes.hour_profiles(0).shape == shape[:2] + (24,)
+
+def test_profiles_match_pandas(tmp_path):
+    cube = open_cube(data_path, ["CH", "DE"], ["20230407", "20230417"], str(tmp_path))
+    shapes = ShapeProfiles(cube.values, cube.datum, "peak")
+    local = pd.DatetimeIndex(local_times(cube.datum))
+    df = pd.DataFrame({"price": cube.values[1, 1].astype("float64"), "month": local.to_period("M"), "peak": peak_mask(cube.datum),
+                       "weekday": local.weekday, "hour": local.hour, "calendar month": local.month - 1})
+    df["factor"] = df["price"] / df["month"].map(df[df["peak"]].groupby("month")["price"].mean())
+    np.testing.assert_allclose(shapes.factors[1, 1], df["factor"], rtol=1e-6)
+    np.testing.assert_allclose(shapes.profiles()[1, 1], df.groupby(["weekday", "hour"])["factor"].mean().unstack(), rtol=1e-9)
+    may = df[df["calendar month"] == 4]
+    np.testing.assert_allclose(shapes.profiles(4)[1, 1], may.groupby(["weekday", "hour"])["factor"].mean().unstack(), rtol=1e-9)
+    np.testing.assert_allclose(shapes.hour_profiles()[1, 1], df.groupby("hour")["factor"].mean(), rtol=1e-9)
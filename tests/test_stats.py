@@ -0,0 +1,53 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+
+from hpfc.products import peak_mask, product_mask
+from hpfc.stats import WindowStatistics, statistics_columns
+from hpfc.timeaxis import to_utc
+
+
+def curves():
+    # two hourly curves over the spring switch, with missing and negative values
+    datum = np.arange(np.datetime64("2023-03-01T00:00", "ns"), np.datetime64("2023-05-01T00:00", "ns"), np.timedelta64(1, "h"))
+    rng = np.random.default_rng(1)
+    first = 80 + 30 * rng.standard_normal(len(datum))
+    second = 60 + 40 * rng.standard_normal(len(datum))
+    second[100:300] = np.nan
+    return pd.DataFrame({"Datum": datum, "HPFC_CH_20230407": first, "HPFC_DE_20230407": second})
+
+def pandas_statistics(df, rows, start, end):
+    window = df[rows & (df["Datum"] > to_utc(start)) & (df["Datum"] < to_utc(end))].drop(columns="Datum")
+    table = pd.DataFrame({"Mean value": window.mean(), "Min value": window.min(), "Max value": window.max(),
+                          "Std deviation": window.std(), "P5": window.quantile(0.05), "Median": window.quantile(0.5),
+                          "P95": window.quantile(0.95), "Negative hours": (window < 0).sum().astype("float64")})
+    return table
+
+@pytest.mark.parametrize("product", ["base", "peak", "off-peak"])
+def test_statistics_match_pandas(product):
+    df = curves()
+    datum = df["Datum"].to_numpy()
+    statistics = WindowStatistics(df, peak_mask(datum), product_mask(datum, product))
+    start, end = datetime(2023, 3, 10, 6), datetime(2023, 4, 20, 18)
+    result = statistics.window(start, end)
+    assert list(result.columns) == statistics_columns
+    expected = pandas_statistics(df, product_mask(datum, product), start, end)
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_names=False, rtol=1e-9)
+
+@pytest.mark.parametrize("product", ["base", "peak", "off-peak"])
+def test_peak_base_spread_is_computed_on_all_the_rows(product):
+    df = curves()
+    datum = df["Datum"].to_numpy()
+    statistics = WindowStatistics(df, peak_mask(datum), product_mask(datum, product))
+    start, end = datetime(2023, 3, 10), datetime(2023, 4, 20)
+    window = df[(df["Datum"] > to_utc(start)) & (df["Datum"] < to_utc(end))]
+    values = window.drop(columns="Datum")
+    spread = values[peak_mask(window["Datum"].to_numpy())].mean() - values.mean()
+    np.testing.assert_allclose(statistics.window(start, end)["Peak - base"], spread, rtol=1e-9)
+    assert (spread.abs() > 0).all()
+
+def test_empty_window():
+    df = curves()
+    result = WindowStatistics(df).window(datetime(2024, 1, 1), datetime(2024, 2, 1))
+    assert result.isna().drop(columns="Negative hours").all().all()